@@ -1,53 +1,90 @@
-from flask import Flask
+import os
 
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask
 
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 
+from andromeda.config import Config
+from andromeda.database import RoutingSQLAlchemy
+from andromeda.email_checks import DeliverabilityChecker
+from andromeda.hashing import PasswordHasher
+from andromeda.instrumentation import Instrumentation
+from andromeda.page_cache import PageCache
+from andromeda.rate_limit import RateLimiter
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '60808326457a6384f78964761aaa161c'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-
-app.config['SECURITY_PASSWORD_SCHEMES'] = ['pbkdf2_sha512']
 
-#    CACHING FIX FOR PRODUCTION ONLY
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+MIGRATIONS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'migrations')
 
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
+db = RoutingSQLAlchemy()
+bcrypt = Bcrypt()
+password_hasher = PasswordHasher(bcrypt=bcrypt)
 
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
+email_checker = DeliverabilityChecker()
+instrumentation = Instrumentation()
+page_cache = PageCache()
+rate_limiter = RateLimiter()
+
+
+def create_app(config=Config):
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    instrumentation.init_app(app)
+    db.init_app(app)
+    bcrypt.init_app(app)
+    password_hasher.init_app(app, bcrypt)
+    login_manager.init_app(app)
+    email_checker.init_app(app)
+    user_cache.init_app(app)
+    job_queue.init_app(app)
+    page_cache.init_app(app)
+    rate_limiter.init_app(app)
+    event_bus.init_app(app)
+    refdata.init_app(app)
+
+    #   Imported here, as it is by the routes and andromeda.bookings, so
+    #   that importing the package for its models (migrations, scripts)
+    #   does not load NumPy. Building an app always does.
+    from andromeda.fares import fare_engine
+    fare_engine.init_app(app)
+
+    #   `flask db ...`: versioned schema migrations (see migrations/).
+    from flask_migrate import Migrate
+    from andromeda.schema import include_object
+    Migrate(app, db, directory=MIGRATIONS_DIRECTORY, render_as_batch=True,
+            include_object=include_object)
+
+    from andromeda.routes import main
+    app.register_blueprint(main)
+
+    from andromeda.cli import cli
+    app.cli.add_command(cli)
+
+    #   Flask-Admin and the admin views are only imported by processes
+    #   that serve the admin UI.
+    if app.config.get('ENABLE_ADMIN'):
+        from andromeda.admin_views import init_admin
+        init_admin(app)
+
+    return app
 
 
 #   Below import is necessary, even if the linter complains about it.
-#   This is because the linter cannot distinguish between imports in a script
-#   and imports in a package. The order of the imports is also important.
-#   These two imports *had* to happen after initializing db.
-from andromeda import routes
+#   The models (and the user loader, which needs them) only need the
+#   extensions above, so they can be imported from the package without
+#   building an app. The order of the imports is important.
 from andromeda.models import User, Company, Country, City, Passport
-from andromeda.models import Flight, Employment, Booking
-from andromeda.admin_views import UserView, CompanyView, CountryView, CityView
-from andromeda.admin_views import BookingView, EmploymentView, PassportView
-from andromeda.admin_views import FlightView
-
-from flask_admin import Admin
-
-# set optional bootswatch theme
-app.config['FLASK_ADMIN_SWATCH'] = 'flatly'
-
-
-admin = Admin(app, name='Andromeda Admin', template_mode='bootstrap3')
-# Add administrative views here
-admin.add_view(UserView(User, db.session))
-admin.add_view(CompanyView(Company, db.session))
-admin.add_view(CountryView(Country, db.session))
-admin.add_view(CityView(City, db.session))
-admin.add_view(PassportView(Passport, db.session))
-admin.add_view(FlightView(Flight, db.session))
-admin.add_view(EmploymentView(Employment, db.session))
-admin.add_view(BookingView(Booking, db.session))
+from andromeda.models import Flight, Employment, Booking, Job
+from andromeda.user_cache import user_cache
+from andromeda.jobs import job_queue
+from andromeda.events import event_bus
+from andromeda.refdata import refdata
+from andromeda import tasks
+from andromeda import reporting
@@ -1,5 +1,31 @@
+import tempfile
+
+from datetime import date, datetime, timedelta
+
+from flask import Response, abort, current_app, flash, redirect, request
+from flask import send_file, stream_with_context, url_for
+from flask_admin import Admin, BaseView, expose
+from flask_admin.actions import action
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.model import typefmt
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
+from wtforms import PasswordField, SelectField
+from wtforms.validators import Optional, ValidationError
+
+from andromeda import db
+from andromeda.bookings import cancel_booking
+from andromeda.custom_validators import normalize_phone_numbers
+from andromeda.database import estimated_row_count
+from andromeda.exports import company_bookings_query, manifest_query
+from andromeda.exports import csv_chunks, parquet_available, write_parquet
+from andromeda.fares import KINDS
+from andromeda.models import User, Company, Country, City, Passport
+from andromeda.models import Flight, Employment, Booking, Job
+from andromeda.models import SweepFinding, FareRule
+from andromeda.refdata import refdata
+from andromeda import reporting
+from andromeda.user_cache import user_cache
 
 
 # Show null values instead of empty strings.
@@ -7,72 +33,373 @@ MY_DEFAULT_FORMATTERS = dict(typefmt.BASE_FORMATTERS)
 MY_DEFAULT_FORMATTERS.update({type(None): typefmt.null_formatter})
 
 
-class UserView(ModelView):
+class EstimatedCount:
+    """Count query stand-in that answers with the table's estimated size.
+
+    Flask-Admin narrows the count query for searches and filters; any
+    such call returns the real query, so those counts stay exact.
+    """
+
+    def __init__(self, query, estimate):
+        self.query = query
+        self.estimate = estimate
+
+    def scalar(self):
+        return self.estimate
+
+    def __getattr__(self, name):
+        return getattr(self.query, name)
+
+
+class AndromedaModelView(ModelView):
+    """ModelView with eager loading for the list page.
+
+    Flask-Admin joins the relationships shown in column_list itself;
+    list_loader_options adds the ones their __repr__ reaches through
+    (a Booking shows its flight), so a list page takes the same number
+    of queries whatever its size. Cities and countries in a repr come
+    from andromeda.refdata.
+    """
+
+    list_loader_options = ()
+
+    def get_query(self):
+        return super().get_query().options(*self.list_loader_options)
+
+    def get_count_query(self):
+        query = super().get_count_query()
+        estimate = estimated_row_count(self.session, self.model.__table__)
+        threshold = current_app.config['ADMIN_ESTIMATED_COUNT_THRESHOLD']
+        if estimate is None or estimate < threshold:
+            return query
+        return EstimatedCount(query, estimate)
+
+
+class ReferenceSelectField(SelectField):
+    """Select of a country or city id, with options from refdata.
+
+    Used for the foreign key column rather than the relationship, so
+    that neither the options nor the current value cost a query.
+    choices is a function, called for each form.
+    """
+
+    def __init__(self, label=None, validators=None, choices=None, **kwargs):
+        super().__init__(label, validators, coerce=int, choices=choices(),
+                         **kwargs)
+
+
+class PhoneNumberActions:
+    """Bulk action that re-validates the selected rows' phone numbers.
+
+    Numbers are checked in one batch and rewritten in E.164 form with a
+    single executemany UPDATE, without loading the objects.
+    """
+
+    @action('normalize_phone_numbers', 'Normalize phone numbers')
+    def action_normalize_phone_numbers(self, ids):
+        model = self.model
+        rows = db.session.query(model.id, model.phone_number) \
+            .filter(model.id.in_(ids), model.phone_number.isnot(None)) \
+            .all()
+        normalized = normalize_phone_numbers(phone for id, phone in rows)
+
+        updates = [{'id': id, 'phone_number': normalized[phone]}
+                   for id, phone in rows
+                   if normalized[phone] not in (None, phone)]
+        invalid = sum(1 for id, phone in rows if normalized[phone] is None)
+
+        db.session.bulk_update_mappings(model, updates)
+        db.session.commit()
+        # Bulk updates skip the mapper events that invalidate the cache.
+        if model is User:
+            for update in updates:
+                user_cache.invalidate(update['id'])
+
+        flash(f"Normalized {len(updates)} phone numbers.", 'success')
+        if invalid:
+            flash(f"{invalid} phone numbers are invalid.", 'error')
+
+
+class UserView(PhoneNumberActions, AndromedaModelView):
+    """Users, with the password hash left out of the list and forms.
+
+    new_password is always empty when the form is shown; the password
+    is only hashed and replaced when it is filled in.
+    """
+
     form_columns = (
         'username',
         'email',
-        'password',
+        'new_password',
         'phone_number',
     )
+    form_extra_fields = {
+        'new_password': PasswordField('New password',
+                                      validators=[Optional()]),
+    }
+    column_exclude_list = ('_password',)
     column_editable_list = ('username', 'email', 'phone_number')
     column_searchable_list = ('username', 'email')
     column_type_formatters = MY_DEFAULT_FORMATTERS
 
+    def on_model_change(self, form, model, is_created):
+        if form.new_password.data:
+            model.password = form.new_password.data
+        elif is_created:
+            raise ValidationError("A new user needs a password.")
+
 
-class CompanyView(ModelView):
-    form_excluded_columns = ('employees')
+class CompanyView(PhoneNumberActions, AndromedaModelView):
+    form_excluded_columns = ('employees', 'tickets_used')
     column_type_formatters = MY_DEFAULT_FORMATTERS
 
 
-class CountryView(ModelView):
+class CountryView(AndromedaModelView):
     form_excluded_columns = ('cities', 'passports')
     column_type_formatters = MY_DEFAULT_FORMATTERS
 
 
-class CityView(ModelView):
-    form_columns = ('name', 'country')
+class CityView(AndromedaModelView):
+    form_columns = ('name', 'country_id')
+    form_extra_fields = {
+        'country_id': ReferenceSelectField(
+            'Country', choices=refdata.country_choices),
+    }
     column_list = ('name', 'country')
     column_type_formatters = MY_DEFAULT_FORMATTERS
 
 
-class PassportView(ModelView):
+class PassportView(AndromedaModelView):
+    form_excluded_columns = ('country',)
+    form_extra_fields = {
+        'country_id': ReferenceSelectField(
+            'Country', choices=refdata.country_choices),
+    }
     column_type_formatters = MY_DEFAULT_FORMATTERS
 
 
-class FlightView(ModelView):
+class FlightView(AndromedaModelView):
     column_list = ('name',
                    'departure_city',
                    'arrival_city',
                    'departure',
-                   'arrival')
+                   'arrival',
+                   'capacity',
+                   'seats_remaining',
+                   'base_fare')
     form_columns = ('name',
-                    'departure_city',
-                    'arrival_city',
+                    'departure_city_id',
+                    'arrival_city_id',
                     'departure',
-                    'arrival')
+                    'arrival',
+                    'capacity',
+                    'base_fare')
     column_labels = dict(departure_city='From',
                          arrival_city='To',
                          departure='Departure Time',
-                         arrival='Arrival Time')
+                         arrival='Arrival Time',
+                         seats_remaining='Seats Left')
+    form_extra_fields = {
+        'departure_city_id': ReferenceSelectField(
+            'From', choices=refdata.city_choices),
+        'arrival_city_id': ReferenceSelectField(
+            'To', choices=refdata.city_choices),
+    }
     column_type_formatters = MY_DEFAULT_FORMATTERS
+    list_loader_options = (
+        joinedload(Flight.departure_city),
+        joinedload(Flight.arrival_city),
+    )
 
+    def on_model_change(self, form, model, is_created):
+        if is_created:
+            model.seats_remaining = model.capacity
+            return
+        # Shift the counter by the change in capacity, relative to the
+        # stored value, so concurrent bookings are not overwritten.
+        history = inspect(model).attrs.capacity.history
+        if history.added and history.deleted:
+            delta = history.added[0] - history.deleted[0]
+            model.seats_remaining = Flight.seats_remaining + delta
 
-class EmploymentView(ModelView):
+
+class EmploymentView(AndromedaModelView):
     form_excluded_columns = ('bookings')
     column_type_formatters = MY_DEFAULT_FORMATTERS
 
 
-class BookingView(ModelView):
+class BookingView(AndromedaModelView):
+    """Bookings are made through book_flight and cancelled through
+    cancel_booking, which keep the seat and ticket counters; rows are
+    never added or deleted here directly. Only the cancellation terms
+    can be edited."""
+
+    can_create = False
+    can_delete = False
     column_list = ('user',
                    'flight',
                    'employment',
                    'date_issued',
                    'cancellation_fee',
                    'cancellation_deadline')
-    form_columns = ('user',
-                    'flight',
-                    'employment',
-                    'date_issued',
-                    'cancellation_fee',
+    form_columns = ('cancellation_fee',
                     'cancellation_deadline')
     column_type_formatters = MY_DEFAULT_FORMATTERS
+    list_loader_options = (
+        joinedload(Booking.user),
+        joinedload(Booking.flight),
+        joinedload(Booking.employment).joinedload(Employment.user),
+        joinedload(Booking.employment).joinedload(Employment.company),
+    )
+
+    @action('cancel', 'Cancel',
+            'Cancel the selected bookings and give back their seats?')
+    def action_cancel(self, ids):
+        bookings = Booking.query.filter(Booking.id.in_(ids)).all()
+        for booking in bookings:
+            cancel_booking(booking)
+        flash(f"Cancelled {len(bookings)} bookings.", 'success')
+
+
+class FareRuleView(AndromedaModelView):
+    column_list = ('kind',
+                   'min_days',
+                   'company',
+                   'fare_multiplier',
+                   'fee_rate')
+    form_columns = ('kind',
+                    'min_days',
+                    'company',
+                    'fare_multiplier',
+                    'fee_rate')
+    form_choices = {'kind': [(kind, kind) for kind in KINDS]}
+    column_default_sort = 'kind'
+    column_type_formatters = MY_DEFAULT_FORMATTERS
+
+
+class JobView(AndromedaModelView):
+    can_create = False
+    column_list = ('name',
+                   'status',
+                   'attempts',
+                   'run_at',
+                   'created_at',
+                   'last_error')
+    column_filters = ('name', 'status')
+    form_columns = ('status', 'run_at', 'max_attempts')
+    column_type_formatters = MY_DEFAULT_FORMATTERS
+
+
+class SweepFindingView(AndromedaModelView):
+    can_create = False
+    can_edit = False
+    column_list = ('sweep', 'booking', 'found_at', 'resolved_at')
+    column_filters = ('sweep', 'found_at', 'resolved_at')
+    column_default_sort = ('found_at', True)
+    column_type_formatters = MY_DEFAULT_FORMATTERS
+    list_loader_options = (
+        joinedload(SweepFinding.booking).joinedload(Booking.user),
+        joinedload(SweepFinding.booking).joinedload(Booking.flight),
+    )
+
+
+class ExportView(BaseView):
+    """Passenger manifests and company booking dumps.
+
+    CSV is streamed to the client as it is read from the database;
+    Parquet is written to a temporary file first, and only offered if
+    pyarrow is installed.
+    """
+
+    @expose('/')
+    def index(self):
+        return self.render('admin/exports.html',
+                           parquet=parquet_available())
+
+    @expose('/manifest')
+    def manifest(self):
+        flight_id = request.args.get('flight_id', type=int)
+        if flight_id is None:
+            abort(400)
+        return self.export(manifest_query(flight_id),
+                           f'manifest-{flight_id}')
+
+    @expose('/bookings')
+    def bookings(self):
+        company_id = request.args.get('company_id', type=int)
+        if company_id is None:
+            abort(400)
+        return self.export(company_bookings_query(company_id),
+                           f'bookings-{company_id}')
+
+    def export(self, query, name):
+        if request.args.get('format', 'csv') == 'parquet':
+            if not parquet_available():
+                flash("Parquet export needs the pyarrow package.", 'error')
+                return redirect(url_for('.index'))
+            f = tempfile.TemporaryFile()
+            with db.replica():
+                write_parquet(query, f)
+            f.seek(0)
+            return send_file(f, mimetype='application/vnd.apache.parquet',
+                             as_attachment=True,
+                             attachment_filename=f'{name}.parquet')
+
+        def generate():
+            with db.replica():
+                yield from csv_chunks(query)
+
+        return Response(stream_with_context(generate()),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition':
+                                 f'attachment; filename={name}.csv'})
+
+
+class ReportsView(BaseView):
+    """Load factors, bookings per day and per company, and the best
+    selling flights, over a range of days (by default, the 30 days
+    either side of today). Read from the rollups in andromeda.reporting,
+    so they cost the same whatever the number of bookings.
+    """
+
+    @expose('/')
+    def index(self):
+        today = date.today()
+        start = self.day_arg('start', today - timedelta(days=30))
+        end = self.day_arg('end', today + timedelta(days=30))
+        with db.replica():
+            return self.render(
+                'admin/reports.html', start=start, end=end,
+                routes=reporting.route_load_factors(start, end),
+                days=reporting.bookings_per_day(start, end),
+                companies=reporting.company_months(start, end),
+                flights=reporting.top_flights(start, end))
+
+    def day_arg(self, name, default):
+        value = request.args.get(name)
+        if not value:
+            return default
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            abort(400)
+
+
+def init_admin(app):
+    admin = Admin(app, name='Andromeda Admin', template_mode='bootstrap3')
+    # Add administrative views here
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(CompanyView(Company, db.session))
+    admin.add_view(CountryView(Country, db.session))
+    admin.add_view(CityView(City, db.session))
+    admin.add_view(PassportView(Passport, db.session))
+    admin.add_view(FlightView(Flight, db.session))
+    admin.add_view(EmploymentView(Employment, db.session))
+    admin.add_view(BookingView(Booking, db.session))
+    admin.add_view(FareRuleView(FareRule, db.session))
+    admin.add_view(JobView(Job, db.session))
+    admin.add_view(SweepFindingView(SweepFinding, db.session,
+                                    name='Sweep Findings'))
+    admin.add_view(ExportView(name='Exports', endpoint='exports'))
+    admin.add_view(ReportsView(name='Reports', endpoint='reports'))
+    return admin
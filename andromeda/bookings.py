@@ -0,0 +1,153 @@
+from datetime import date
+
+from sqlalchemy import or_, func
+
+from andromeda import db
+from andromeda.fares import fare_engine
+from andromeda.jobs import job_queue
+from andromeda.models import Flight, Booking, Company, Employment
+
+
+class BookingError(Exception):
+    pass
+
+
+class FlightFullError(BookingError):
+    pass
+
+
+class QuotaExceededError(BookingError):
+    pass
+
+
+def _check_cancellation_deadline(cancellation_deadline, departure):
+    """Raise BookingError unless the deadline falls between today and the
+    day of departure."""
+    if cancellation_deadline < date.today():
+        raise BookingError("The cancellation deadline has passed.")
+    if cancellation_deadline > departure.date():
+        raise BookingError("The cancellation deadline must not be after "
+                           "the departure.")
+
+
+def _claim_seat(flight_id):
+    claimed = Flight.query\
+        .filter(Flight.id == flight_id,
+                Flight.seats_remaining > 0)\
+        .update({Flight.seats_remaining: Flight.seats_remaining - 1},
+                synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        if Flight.query.get(flight_id) is None:
+            raise BookingError("This flight does not exist.")
+        raise FlightFullError("This flight is sold out.")
+
+
+def _claim_ticket(company_id):
+    # A company without a quota (NULL) is not limited.
+    claimed = Company.query\
+        .filter(Company.id == company_id,
+                or_(Company.ticket_quota.is_(None),
+                    Company.tickets_used < Company.ticket_quota))\
+        .update({Company.tickets_used: Company.tickets_used + 1},
+                synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        raise QuotaExceededError("The company's ticket quota is used up.")
+
+
+def book_flight(flight_id, user, cancellation_deadline,
+                employment=None, cancellation_fee=None):
+    """Book one seat on a flight for user, and commit.
+
+    The seat and one ticket of the issuing company's quota are each
+    claimed with a single conditional UPDATE, in one transaction, so
+    each check and its increment happen atomically in the database:
+    concurrent requests for the last seat or the last ticket cannot
+    both succeed, whatever the isolation level. Raises FlightFullError
+    or QuotaExceededError, leaving both counters untouched.
+
+    The fare, and the cancellation fee unless one is given, are quoted
+    by the fare engine for the issuing company. The cancellation
+    deadline must fall between today and the day of departure.
+    """
+    if employment is None:
+        employment = user.employment
+    if employment is None:
+        raise BookingError("Bookings must be issued through an employment.")
+
+    _claim_seat(flight_id)
+    _claim_ticket(employment.company_id)
+
+    flight = Flight.query.get(flight_id)
+    try:
+        _check_cancellation_deadline(cancellation_deadline, flight.departure)
+    except BookingError:
+        db.session.rollback()
+        raise
+    db.session.expire(flight, ['seats_remaining'])
+
+    quote = fare_engine.quote_flight(
+        flight,
+        cancellation_deadline=cancellation_deadline,
+        company_id=employment.company_id)
+    if cancellation_fee is None:
+        cancellation_fee = float(quote.cancellation_fee.amount)
+
+    booking = Booking(flight=flight,
+                      user=user,
+                      issuing_employment=employment,
+                      cancellation_deadline=cancellation_deadline,
+                      cancellation_fee=cancellation_fee,
+                      fare=quote.fare.amount)
+    db.session.add(booking)
+    try:
+        db.session.flush()
+        job_queue.enqueue('send_booking_confirmation',
+                          idempotency_key=f'booking-confirmation:{booking.id}',
+                          booking_id=booking.id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return booking
+
+
+def cancel_booking(booking):
+    """Delete a booking, giving back its seat and quota ticket, and commit."""
+    Flight.query\
+        .filter(Flight.id == booking.flight_id)\
+        .update({Flight.seats_remaining: Flight.seats_remaining + 1},
+                synchronize_session=False)
+
+    company_id = db.session.query(Employment.company_id)\
+        .filter(Employment.user_id == booking.issuing_employment_id)\
+        .as_scalar()
+    Company.query\
+        .filter(Company.id == company_id,
+                Company.tickets_used > 0)\
+        .update({Company.tickets_used: Company.tickets_used - 1},
+                synchronize_session=False)
+
+    db.session.delete(booking)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def recount_tickets_used():
+    """Recompute every company's tickets_used from the bookings, and commit.
+
+    The counters are maintained incrementally; this is the set-based
+    repair path, one UPDATE for all companies.
+    """
+    issued = db.session.query(func.count(Booking.id))\
+        .join(Employment,
+              Employment.user_id == Booking.issuing_employment_id)\
+        .filter(Employment.company_id == Company.id)\
+        .as_scalar()
+    Company.query.update({Company.tickets_used: issued},
+                         synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe, size-bounded mapping whose entries expire.
+
+    When full, the least recently used entry is evicted. Each entry
+    may have its own time-to-live, which lets callers keep negative
+    results for less time than positive ones.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires <= self._timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = self._timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ClientCache:
+    """Shared cache over a redis-py style client (get, set with ex=,
+    delete), so that several worker processes see the same entries.
+
+    Values are stored as JSON, so they must be JSON-serializable.
+    """
+
+    def __init__(self, client, prefix='andromeda:', ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return default
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value),
+                        ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def cache_from_url(url, prefix='andromeda:', maxsize=1024, ttl=300):
+    """Build a cache backend: in-process if url is empty or 'local',
+    otherwise a shared redis cache (requires the redis package)."""
+    if not url or url == 'local':
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError(f"The redis package is needed to use {url}.")
+    return ClientCache(redis.Redis.from_url(url), prefix=prefix, ttl=ttl)
@@ -0,0 +1,136 @@
+import os
+
+import click
+
+from flask.cli import AppGroup
+
+
+cli = AppGroup('andromeda', help="Andromeda maintenance commands.")
+
+
+@cli.command('import-schedule')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=5000, show_default=True,
+              help="Rows inserted per transaction.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help="Progress file [default: PATH.checkpoint].")
+@click.option('--restart', is_flag=True,
+              help="Ignore an existing checkpoint and start over.")
+def import_schedule(path, chunk_size, checkpoint, restart):
+    """Import flights, cities and countries from a CSV or JSON Lines file.
+
+    An interrupted import resumes after the last committed chunk when
+    the command is run again.
+    """
+    from andromeda.schedule_import import ScheduleImporter, ScheduleError
+    from andromeda.schedule_import import read_schedule
+
+    checkpoint = checkpoint or path + '.checkpoint'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    importer = ScheduleImporter(chunk_size=chunk_size, checkpoint=checkpoint)
+    try:
+        importer.run(read_schedule(path))
+    except ScheduleError as e:
+        raise click.ClickException(str(e))
+
+    for number, message in importer.errors[:20]:
+        where = f"row {number}" if number else "schedule"
+        click.echo(f"{where}: {message}", err=True)
+    click.echo(f"Imported {importer.inserted} flights, "
+               f"skipped {importer.skipped} existing, "
+               f"{importer.error_count} errors.")
+
+
+def _export(query, output, format):
+    from andromeda import db
+    from andromeda.exports import write_csv, write_parquet
+
+    if format is None:
+        format = 'parquet' if output and output.endswith('.parquet') \
+            else 'csv'
+    with db.replica():
+        if format == 'parquet':
+            if not output:
+                raise click.UsageError("Parquet exports need --output.")
+            try:
+                write_parquet(query, output)
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+        elif output:
+            with open(output, 'w', newline='') as f:
+                write_csv(query, f)
+        else:
+            write_csv(query, click.get_text_stream('stdout'))
+
+
+@cli.command('export-manifest')
+@click.argument('flight_id', type=int)
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help="File to write [default: standard output].")
+@click.option('--format', type=click.Choice(['csv', 'parquet']),
+              help="Output format [default: from the file extension].")
+def export_manifest(flight_id, output, format):
+    """Export the passenger manifest of a flight."""
+    from andromeda.exports import manifest_query
+    _export(manifest_query(flight_id), output, format)
+
+
+@cli.command('export-bookings')
+@click.argument('company_id', type=int)
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help="File to write [default: standard output].")
+@click.option('--format', type=click.Choice(['csv', 'parquet']),
+              help="Output format [default: from the file extension].")
+def export_bookings(company_id, output, format):
+    """Export the bookings issued through a company's employees."""
+    from andromeda.exports import company_bookings_query
+    _export(company_bookings_query(company_id), output, format)
+
+
+@cli.command('worker')
+@click.option('--burst', is_flag=True,
+              help="Exit once no jobs are due.")
+@click.option('--batch-size', default=10, show_default=True,
+              help="Jobs claimed at a time.")
+def worker(burst, batch_size):
+    """Run queued background jobs."""
+    from flask import current_app
+    from andromeda.jobs import job_queue
+
+    job_queue.work(
+        poll_interval=current_app.config['JOBS_POLL_INTERVAL'],
+        batch_size=batch_size,
+        burst=burst)
+
+
+@cli.command('sweep')
+@click.argument('names', nargs=-1)
+def sweep(names):
+    """Run the passport expiry and cancellation deadline sweeps.
+
+    Meant to be run daily; each run only looks at what changed since
+    the previous one. NAMES selects sweeps [default: all].
+    """
+    from andromeda.sweeps import SWEEPS, run_sweep
+
+    for name in names or SWEEPS:
+        if name not in SWEEPS:
+            raise click.BadParameter(f"no sweep called {name!r}",
+                                     param_hint='NAMES')
+        click.echo(f"{name}: {run_sweep(name)} new findings")
+
+
+@cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Recompute the reporting rollups from the bookings.
+
+    They are kept up to date as bookings change; run this after bulk
+    loads, or to repair them. Bookings made while it runs may be
+    missed, so run it when the site is quiet.
+    """
+    from andromeda.reporting import rebuild_rollups
+
+    for table, rows in rebuild_rollups().items():
+        click.echo(f"{table}: {rows} rows")
@@ -0,0 +1,171 @@
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def replica_binds():
+    urls = [url.strip()
+            for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+            if url.strip()]
+    return {f'replica_{i}': url for i, url in enumerate(urls)}
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY',
+                                '60808326457a6384f78964761aaa161c')
+
+    SECURITY_PASSWORD_SCHEMES = ['pbkdf2_sha512']
+
+    #   Static files linked with static_url() are versioned by content
+    #   and cached for a year; this applies to any other static URL.
+    SEND_FILE_MAX_AGE_DEFAULT = env_int('SEND_FILE_MAX_AGE_DEFAULT', 3600)
+
+    #   Public pages are cached for anonymous visitors, per process
+    #   unless PAGE_CACHE_URL points at a shared cache (redis://...).
+    PAGE_CACHE_ENABLED = env_bool('PAGE_CACHE_ENABLED', True)
+    PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL')
+    PAGE_CACHE_TTL = env_int('PAGE_CACHE_TTL', 300)
+
+    #   Serve the Flask-Admin UI from this process.
+    ENABLE_ADMIN = env_bool('ENABLE_ADMIN', False)
+    # set optional bootswatch theme
+    FLASK_ADMIN_SWATCH = 'flatly'
+    #   Admin list pages show the planner's row estimate instead of an
+    #   exact COUNT(*) for tables at least this large.
+    ADMIN_ESTIMATED_COUNT_THRESHOLD = env_int(
+        'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL',
+                                             'sqlite:///site.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    #   Read replicas: DATABASE_REPLICA_URLS is a comma-separated list.
+    #   Reads inside db.replica() blocks go to one of them.
+    SQLALCHEMY_BINDS = replica_binds()
+    SQLALCHEMY_REPLICA_BINDS = sorted(SQLALCHEMY_BINDS)
+
+    #   Connection pool, for server databases (ignored for SQLite).
+    DATABASE_POOL_SIZE = env_int('DATABASE_POOL_SIZE', 10)
+    DATABASE_MAX_OVERFLOW = env_int('DATABASE_MAX_OVERFLOW', 20)
+    DATABASE_POOL_TIMEOUT = env_int('DATABASE_POOL_TIMEOUT', 30)
+    DATABASE_POOL_RECYCLE = env_int('DATABASE_POOL_RECYCLE', 1800)
+    DATABASE_POOL_PRE_PING = env_bool('DATABASE_POOL_PRE_PING', True)
+
+    #   SQLite: WAL lets readers run alongside the writer, and writers
+    #   wait up to SQLITE_BUSY_TIMEOUT milliseconds for the lock.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_BUSY_TIMEOUT = env_int('SQLITE_BUSY_TIMEOUT', 5000)
+
+    #   bcrypt work factor; existing hashes are upgraded on the next login.
+    BCRYPT_LOG_ROUNDS = env_int('BCRYPT_LOG_ROUNDS', 12)
+    #   Threads allowed to hash at once, and how many more may wait.
+    PASSWORD_HASHING_WORKERS = env_int('PASSWORD_HASHING_WORKERS', 4)
+    PASSWORD_HASHING_BACKLOG = env_int('PASSWORD_HASHING_BACKLOG', 64)
+
+    #   Login attempts: per client address and per account, at most
+    #   *_BURST at once, then *_RATE a minute. Limits are per process
+    #   unless RATE_LIMIT_URL points at a shared cache (redis://...).
+    #   Behind a proxy, the client address must come from it (see
+    #   werkzeug.middleware.proxy_fix), or all clients share a limit.
+    RATE_LIMIT_ENABLED = env_bool('RATE_LIMIT_ENABLED', True)
+    RATE_LIMIT_URL = os.environ.get('RATE_LIMIT_URL')
+    LOGIN_IP_RATE = env_int('LOGIN_IP_RATE', 20)
+    LOGIN_IP_BURST = env_int('LOGIN_IP_BURST', 20)
+    LOGIN_ACCOUNT_RATE = env_int('LOGIN_ACCOUNT_RATE', 5)
+    LOGIN_ACCOUNT_BURST = env_int('LOGIN_ACCOUNT_BURST', 10)
+
+    #   Logged-in users are cached for USER_CACHE_TTL seconds, per process
+    #   unless USER_CACHE_URL points at a shared cache (redis://...).
+    USER_CACHE_URL = os.environ.get('USER_CACHE_URL')
+
+    #   Per-request metrics, served in Prometheus format at
+    #   METRICS_ENDPOINT (e.g. /metrics; not served unless set), and
+    #   warnings in the andromeda.slow_queries and andromeda.slow_requests
+    #   logs. Metrics and Server-Timing headers tell anyone who can read
+    #   them which requests are slow: only turn them on where that is
+    #   fine, or behind a proxy that keeps them in.
+    INSTRUMENTATION_ENABLED = env_bool('INSTRUMENTATION_ENABLED', True)
+    METRICS_ENDPOINT = os.environ.get('METRICS_ENDPOINT')
+    SERVER_TIMING_ENABLED = env_bool('SERVER_TIMING_ENABLED', False)
+    SLOW_QUERY_THRESHOLD_MS = env_int('SLOW_QUERY_THRESHOLD_MS', 200)
+    SLOW_REQUEST_THRESHOLD_MS = env_int('SLOW_REQUEST_THRESHOLD_MS', 1000)
+    #   Warn when a request runs the same statement this many times.
+    N_PLUS_ONE_THRESHOLD = env_int('N_PLUS_ONE_THRESHOLD', 10)
+
+    #   background, sync or offline: see andromeda.email_checks
+    #   With a job worker running, the welcome e-mail job checks the
+    #   domain again, off the request, unless this is offline.
+    EMAIL_DELIVERABILITY_MODE = os.environ.get('EMAIL_DELIVERABILITY_MODE',
+                                               'background')
+
+    #   database or eager: see andromeda.jobs. Queued jobs are run by
+    #   `flask andromeda worker`.
+    JOBS_MODE = os.environ.get('JOBS_MODE', 'database')
+    JOBS_MAX_ATTEMPTS = env_int('JOBS_MAX_ATTEMPTS', 5)
+    #   Seconds before the first retry; doubled for each later one.
+    JOBS_RETRY_DELAY = env_int('JOBS_RETRY_DELAY', 30)
+    JOBS_LOCK_TIMEOUT = env_int('JOBS_LOCK_TIMEOUT', 600)
+
+    #   The passport sweep checks flights departing this many days ahead.
+    SWEEP_PASSPORT_HORIZON_DAYS = env_int('SWEEP_PASSPORT_HORIZON_DAYS', 30)
+
+    #   Flight update streams (/flights/<id>/events): see
+    #   andromeda.events. With several worker processes, set
+    #   EVENTS_BROKER_URL (redis://...) so that each sees every update.
+    EVENTS_BROKER_URL = os.environ.get('EVENTS_BROKER_URL')
+    #   Seconds between keep-alive comments on an idle stream.
+    EVENTS_KEEPALIVE = env_int('EVENTS_KEEPALIVE', 15)
+
+    #   Fares: see andromeda.fares. Rule changes made in another
+    #   process are picked up after FARE_RULES_TTL seconds.
+    FARE_CURRENCY = os.environ.get('FARE_CURRENCY', 'EUR')
+    FARE_RULES_TTL = env_int('FARE_RULES_TTL', 60)
+
+    #   Countries and cities are cached in each process, loaded before
+    #   the first request: see andromeda.refdata. Changes made in
+    #   another process are picked up after REFDATA_TTL seconds.
+    REFDATA_PRELOAD = env_bool('REFDATA_PRELOAD', True)
+    REFDATA_TTL = env_int('REFDATA_TTL', 300)
+
+    #   Outgoing mail. Without MAIL_SERVER, messages are only logged.
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
+    MAIL_PORT = env_int('MAIL_PORT', 587)
+    MAIL_USE_TLS = env_bool('MAIL_USE_TLS', True)
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER',
+                                         'no-reply@andromeda.local')
+    MAIL_TIMEOUT = env_int('MAIL_TIMEOUT', 10)
+
+
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    ENABLE_ADMIN = False
+
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_BINDS = {}
+    SQLALCHEMY_REPLICA_BINDS = []
+
+    #   Tests must not depend on DNS, and the cheapest bcrypt cost keeps
+    #   tests that create users fast.
+    EMAIL_DELIVERABILITY_MODE = 'offline'
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASHING_WORKERS = 0
+    USER_CACHE_URL = None
+    PAGE_CACHE_URL = None
+    RATE_LIMIT_URL = None
+    EVENTS_BROKER_URL = None
+    #   Loaded on first use, so query counts do not depend on test order.
+    REFDATA_PRELOAD = False
+    JOBS_MODE = 'eager'
+    MAIL_SERVER = None
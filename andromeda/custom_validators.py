@@ -1,13 +1,82 @@
+from functools import lru_cache
+
+from email_validator import validate_email, EmailNotValidError
 from flask_validator import Validator
-from phonenumbers import carrier, parse
+from phonenumbers import NumberParseException, PhoneNumberFormat
+from phonenumbers import carrier, format_number, parse
 from phonenumbers.phonenumberutil import number_type
+from sqlalchemy import event
+
+
+PHONE_NUMBER_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=PHONE_NUMBER_CACHE_SIZE)
+def normalize_phone_number(value):
+    """Return the E.164 form of a mobile number, or None if it is not one.
+
+    The number must be in international format. Results are memoized,
+    so re-validating the same numbers does not parse them again.
+    """
+    try:
+        number = parse(value)
+    except NumberParseException:
+        return None
+    if not carrier._is_mobile(number_type(number)):
+        return None
+    return format_number(number, PhoneNumberFormat.E164)
+
+
+def normalize_phone_numbers(values):
+    """Batch form of normalize_phone_number: {value: E.164 or None}.
+
+    Each distinct value is parsed once.
+    """
+    return {value: normalize_phone_number(value) for value in set(values)
+            if value is not None}
 
 
 class ValidatePhoneNumber(Validator):
+    """Accept mobile numbers and store them in E.164 form."""
+
     def __init__(self, field, allow_null=True, throw_exception=False,
                  message=None):
         Validator.__init__(self, field, allow_null, throw_exception, message)
+        # Runs after the validator, which has rejected invalid values.
+        event.listen(field, 'set', self.normalize, retval=True)
 
     def check_value(self, value):
         # NOTE: the phone number must be a valid international number
-        return carrier._is_mobile(number_type(parse(value)))
+        return normalize_phone_number(value) is not None
+
+    def normalize(self, target, value, oldvalue, initiator):
+        if value is None:
+            return value
+        return normalize_phone_number(value) or value
+
+
+class ValidateEmail(Validator):
+    """Drop-in for flask_validator's ValidateEmail.
+
+    Syntax is checked locally; whether the domain accepts mail is left
+    to a DeliverabilityChecker (see andromeda.email_checks), which
+    caches results and may be set to resolve in the background or not
+    at all, instead of doing a DNS lookup on every assignment.
+    """
+
+    def __init__(self, field, checker=None, allow_smtputf8=True,
+                 allow_null=True, throw_exception=False, message=None):
+        self.checker = checker
+        self.allow_smtputf8 = allow_smtputf8
+        Validator.__init__(self, field, allow_null, throw_exception, message)
+
+    def check_value(self, value):
+        try:
+            result = validate_email(value,
+                                    allow_smtputf8=self.allow_smtputf8,
+                                    check_deliverability=False)
+        except EmailNotValidError:
+            return False
+        if self.checker is None:
+            return True
+        return self.checker.check(result.ascii_domain)
@@ -0,0 +1,138 @@
+import random
+
+from contextlib import contextmanager
+from functools import wraps
+
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm, text
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from a replica inside db.replica() blocks.
+
+    Flushes, and everything outside those blocks, use the primary.
+    Code inside a replica block must therefore be read-only: bulk
+    UPDATE/DELETE queries issued there would go to the replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get('replica_bind')
+        if replica is not None and not self._flushing and \
+                not _has_bind_key(mapper):
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+def _has_bind_key(mapper):
+    if mapper is None:
+        return False
+    return mapper.persist_selectable.info.get('bind_key') is not None
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with pool settings, SQLite pragmas and read
+    replica routing taken from the application config."""
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_BINDS', [])
+        app.config.setdefault('DATABASE_POOL_SIZE', 10)
+        app.config.setdefault('DATABASE_MAX_OVERFLOW', 20)
+        app.config.setdefault('DATABASE_POOL_TIMEOUT', 30)
+        app.config.setdefault('DATABASE_POOL_RECYCLE', 1800)
+        app.config.setdefault('DATABASE_POOL_PRE_PING', True)
+        app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+        app.config.setdefault('SQLITE_BUSY_TIMEOUT', 5000)
+        super().init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if sa_url.drivername.startswith('sqlite'):
+            pragmas = {'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT']}
+            if sa_url.database not in (None, '', ':memory:') and \
+                    app.config['SQLITE_JOURNAL_MODE']:
+                pragmas['journal_mode'] = app.config['SQLITE_JOURNAL_MODE']
+            options['sqlite_pragmas'] = pragmas
+        else:
+            options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+            options.setdefault('max_overflow',
+                               app.config['DATABASE_MAX_OVERFLOW'])
+            options.setdefault('pool_timeout',
+                               app.config['DATABASE_POOL_TIMEOUT'])
+            options.setdefault('pool_recycle',
+                               app.config['DATABASE_POOL_RECYCLE'])
+        options.setdefault('pool_pre_ping',
+                           app.config['DATABASE_POOL_PRE_PING'])
+        return super().apply_driver_hacks(app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super().create_engine(sa_url, engine_opts)
+
+        if pragmas:
+            @event.listens_for(engine, 'connect')
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for name, value in pragmas.items():
+                    cursor.execute(f"PRAGMA {name}={value}")
+                cursor.close()
+
+        return engine
+
+    @contextmanager
+    def replica(self):
+        """Send the current session's reads to a read replica, if any."""
+        session = self.session()
+        replicas = self.get_app().config['SQLALCHEMY_REPLICA_BINDS']
+        if not replicas or 'replica_bind' in session.info:
+            yield
+            return
+
+        session.info['replica_bind'] = random.choice(replicas)
+        try:
+            yield
+        finally:
+            session.info.pop('replica_bind', None)
+
+    def reads_from_replica(self, view):
+        """Decorator: run a read-only view inside db.replica()."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with self.replica():
+                return view(*args, **kwargs)
+        return wrapper
+
+
+def estimated_row_count(session, table):
+    """Row count from the planner's statistics, without scanning the
+    table, or None if the database keeps no estimate for it."""
+    connection = session.connection()
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        # reltuples is -1 until the table has been vacuumed or analyzed.
+        count = connection.execute(
+            text("SELECT reltuples FROM pg_class "
+                 "WHERE oid = to_regclass(:table)"),
+            table=table.name).scalar()
+    elif dialect == 'mysql':
+        count = connection.execute(
+            text("SELECT table_rows FROM information_schema.tables "
+                 "WHERE table_schema = DATABASE() AND table_name = :table"),
+            table=table.name).scalar()
+    elif dialect == 'sqlite':
+        # sqlite_stat1 only exists once ANALYZE has been run.
+        if connection.execute(text("SELECT 1 FROM sqlite_master "
+                                   "WHERE name = 'sqlite_stat1'")).scalar():
+            stat = connection.execute(
+                text("SELECT stat FROM sqlite_stat1 "
+                     "WHERE tbl = :table LIMIT 1"),
+                table=table.name).scalar()
+            count = int(stat.split()[0]) if stat else None
+        else:
+            count = None
+    else:
+        count = None
+    if count is None or count < 0:
+        return None
+    return int(count)
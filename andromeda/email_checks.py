@@ -0,0 +1,157 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from email_validator import validate_email_deliverability
+from email_validator import EmailUndeliverableError
+
+from flask import current_app, has_app_context
+
+from andromeda.cache import TTLCache
+from andromeda.extension import Extension
+
+
+log = logging.getLogger('andromeda.email_checks')
+
+DELIVERABLE = 'deliverable'
+UNDELIVERABLE = 'undeliverable'
+PENDING = 'pending'
+
+#   background: accept unknown domains as pending, resolve them off-thread.
+#               The default.
+#   sync:       resolve unknown domains during the request, which waits
+#               for DNS; opt-in only.
+#   offline:    never resolve; syntax checks only (tests, batch loads).
+MODES = ('background', 'sync', 'offline')
+
+
+def resolve_mx(domain):
+    """Default resolver: True if the domain can receive mail, False if it
+    cannot, None if DNS did not answer in time."""
+    try:
+        result = validate_email_deliverability(domain, domain)
+    except EmailUndeliverableError:
+        return False
+    return None if 'unknown-deliverability' in result else True
+
+
+class DeliverabilityChecker(Extension):
+    """Cached, pluggable e-mail domain deliverability check.
+
+    Results are kept per domain in a TTL+LRU cache, so a domain is
+    resolved at most once per TTL however many addresses use it.
+    Undeliverable and unanswered domains are cached too, for
+    negative_ttl seconds. Functions registered with on_resolved are
+    told the outcome of each background lookup, in the app context it
+    was started from.
+    """
+
+    name = 'email_checker'
+
+    class State:
+        def __init__(self, mode='background', cache_size=4096, ttl=24 * 3600,
+                     negative_ttl=3600, workers=2):
+            self.mode = mode
+            self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+            self.negative_ttl = negative_ttl
+            self.workers = workers
+            self.executor = None
+            self.in_flight = set()
+            self.lock = threading.Lock()
+
+    def __init__(self, app=None, resolver=resolve_mx):
+        super().__init__()
+        self.resolver = resolver
+        self._callbacks = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EMAIL_DELIVERABILITY_MODE', 'background')
+        app.config.setdefault('EMAIL_DELIVERABILITY_CACHE_SIZE', 4096)
+        app.config.setdefault('EMAIL_DELIVERABILITY_TTL', 24 * 3600)
+        app.config.setdefault('EMAIL_DELIVERABILITY_NEGATIVE_TTL', 3600)
+        app.config.setdefault('EMAIL_DELIVERABILITY_WORKERS', 2)
+
+        mode = app.config['EMAIL_DELIVERABILITY_MODE']
+        if mode not in MODES:
+            raise ValueError(f"EMAIL_DELIVERABILITY_MODE must be one of "
+                             f"{MODES}, not {mode!r}.")
+        self._bind(app, self.State(
+            mode=mode,
+            cache_size=app.config['EMAIL_DELIVERABILITY_CACHE_SIZE'],
+            ttl=app.config['EMAIL_DELIVERABILITY_TTL'],
+            negative_ttl=app.config['EMAIL_DELIVERABILITY_NEGATIVE_TTL'],
+            workers=app.config['EMAIL_DELIVERABILITY_WORKERS']))
+
+    def on_resolved(self, function):
+        """Decorator: call function(domain, status) when a background
+        lookup finishes."""
+        self._callbacks.append(function)
+        return function
+
+    def status(self, domain):
+        """DELIVERABLE, UNDELIVERABLE, PENDING or None if never checked."""
+        return self.state.cache.get(domain.lower())
+
+    def check(self, domain):
+        """Return False only if the domain is known to be undeliverable."""
+        state = self.state
+        domain = domain.lower()
+        status = state.cache.get(domain)
+        if status is None:
+            if state.mode == 'offline':
+                return True
+            if state.mode == 'background':
+                self._schedule(state, domain)
+                return True
+            status = self.resolve(domain)
+        return status != UNDELIVERABLE
+
+    def resolve(self, domain):
+        """Look the domain up now, cache and return its status."""
+        state = self.state
+        domain = domain.lower()
+        deliverable = self.resolver(domain)
+        if deliverable:
+            status = DELIVERABLE
+            state.cache.set(domain, status)
+        else:
+            # An unanswered lookup does not block the address, but is
+            # retried sooner than a successful one.
+            status = UNDELIVERABLE if deliverable is False else PENDING
+            state.cache.set(domain, status, ttl=state.negative_ttl)
+        return status
+
+    def _schedule(self, state, domain):
+        with state.lock:
+            if domain in state.in_flight:
+                return
+            state.in_flight.add(domain)
+            if state.executor is None:
+                state.executor = ThreadPoolExecutor(
+                    max_workers=state.workers,
+                    thread_name_prefix='email-check')
+        state.cache.set(domain, PENDING, ttl=state.negative_ttl)
+        app = current_app._get_current_object() \
+            if has_app_context() else None
+        state.executor.submit(self._resolve_in_background, state, domain,
+                              app)
+
+    def _resolve_in_background(self, state, domain, app):
+        try:
+            if app is None:
+                self.resolve(domain)
+                return
+            with app.app_context():
+                status = self.resolve(domain)
+                for callback in self._callbacks:
+                    try:
+                        callback(domain, status)
+                    except Exception:
+                        log.exception("Recording the status of %s failed.",
+                                      domain)
+        finally:
+            with state.lock:
+                state.in_flight.discard(domain)
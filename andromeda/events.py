@@ -0,0 +1,319 @@
+import json
+import queue
+import threading
+
+from collections import defaultdict, deque
+from functools import partial
+from itertools import chain
+
+from sqlalchemy import event, inspect, select
+
+from andromeda import db
+from andromeda.extension import Extension
+from andromeda.models import Booking, Flight
+
+
+def flight_channel(flight_id):
+    return f'flight:{flight_id}'
+
+
+class Subscription:
+    """Events published on one channel, for one listener.
+
+    At most maxsize events are kept: a listener that falls behind loses
+    the oldest ones, which is harmless as every event carries the whole
+    state of the flight.
+    """
+
+    def __init__(self, bus, state, channel, maxsize=100):
+        self.bus = bus
+        self.state = state
+        self.channel = channel
+        self._events = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, event):
+        with self._condition:
+            self._events.append(event)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """The next event, or None if there was none within timeout."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._events, timeout)
+            return self._events.popleft() if self._events else None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus(Extension):
+    """Publish/subscribe for flight updates, fanned out in process.
+
+    Listeners wait on a condition variable rather than polling, so an
+    idle listener costs nothing but memory; under an async worker
+    (gunicorn -k gevent) each one is a greenlet, not a thread.
+
+    With EVENTS_BROKER_URL set, events are published to a broker
+    (redis://..., or 'local' for the in-process LocalBroker), and one
+    thread per process relays them from it to the local listeners, so
+    every worker process sees every event.
+    """
+
+    name = 'event_bus'
+
+    class State:
+        def __init__(self, queue_size=100, keepalive=15):
+            self.queue_size = queue_size
+            self.keepalive = keepalive
+            self.transport = None
+            self.subscribers = defaultdict(set)
+            self.lock = threading.Lock()
+
+    def __init__(self, app=None):
+        super().__init__()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_BROKER_URL', None)
+        app.config.setdefault('EVENTS_QUEUE_SIZE', 100)
+        app.config.setdefault('EVENTS_KEEPALIVE', 15)
+        state = self._bind(app, self.State(
+            queue_size=app.config['EVENTS_QUEUE_SIZE'],
+            keepalive=app.config['EVENTS_KEEPALIVE']))
+        self._set_transport(
+            state, transport_from_url(app.config['EVENTS_BROKER_URL']))
+
+    def set_transport(self, transport):
+        self._set_transport(self.state, transport)
+
+    def _set_transport(self, state, transport):
+        if state.transport is not None:
+            state.transport.stop()
+        state.transport = transport
+        if transport is not None:
+            # The relay thread runs outside any app context.
+            transport.start(partial(self._deliver, state))
+
+    def subscribe(self, channel):
+        state = self.state
+        subscription = Subscription(self, state, channel, state.queue_size)
+        with state.lock:
+            state.subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        state = subscription.state
+        with state.lock:
+            subscribers = state.subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del state.subscribers[subscription.channel]
+
+    def listening(self, channel):
+        """Whether publishing on channel may reach anyone."""
+        state = self.state
+        return state.transport is not None or channel in state.subscribers
+
+    def publish(self, channel, event):
+        state = self.state
+        if state.transport is None:
+            self._deliver(state, channel, event)
+        else:
+            state.transport.publish(channel, event)
+
+    def _deliver(self, state, channel, event):
+        with state.lock:
+            subscribers = list(state.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class BrokerTransport:
+    """Relays events through a redis-py style client (publish, and
+    pubsub() with psubscribe and listen), one listening thread per
+    process."""
+
+    def __init__(self, client, prefix='andromeda:events:'):
+        self.client = client
+        self.prefix = prefix
+        self._pubsub = None
+
+    def publish(self, channel, event):
+        self.client.publish(self.prefix + channel, json.dumps(event))
+
+    def start(self, deliver):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(self.prefix + '*')
+        thread = threading.Thread(target=self._listen,
+                                  args=(self._pubsub, deliver),
+                                  name='andromeda-events', daemon=True)
+        thread.start()
+
+    def stop(self):
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def _listen(self, pubsub, deliver):
+        for message in pubsub.listen():
+            if message['type'] != 'pmessage':
+                continue
+            channel = message['channel']
+            data = message['data']
+            if isinstance(channel, bytes):
+                channel, data = channel.decode(), data.decode()
+            deliver(channel[len(self.prefix):], json.loads(data))
+
+
+class LocalBroker:
+    """In-process stand-in for a redis server's publish/subscribe, for
+    development and tests: every BrokerTransport using the same
+    LocalBroker sees every message, as separate worker processes would
+    through redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pubsubs = set()
+
+    def publish(self, channel, data):
+        with self._lock:
+            pubsubs = list(self._pubsubs)
+        for pubsub in pubsubs:
+            pubsub.receive(channel, data)
+        return len(pubsubs)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return LocalPubSub(self)
+
+
+class LocalPubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.patterns = []
+        self._messages = queue.Queue()
+
+    def psubscribe(self, pattern):
+        # Only trailing-'*' patterns, which is all BrokerTransport uses.
+        self.patterns.append(pattern)
+        with self.broker._lock:
+            self.broker._pubsubs.add(self)
+
+    def receive(self, channel, data):
+        for pattern in self.patterns:
+            if channel.startswith(pattern.rstrip('*')):
+                self._messages.put({'type': 'pmessage', 'pattern': pattern,
+                                    'channel': channel, 'data': data})
+                return
+
+    def listen(self):
+        while True:
+            message = self._messages.get()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        with self.broker._lock:
+            self.broker._pubsubs.discard(self)
+        self._messages.put(None)
+
+
+def transport_from_url(url):
+    """No transport (in-process only) if url is empty; the in-process
+    LocalBroker if it is 'local'; otherwise redis (requires the redis
+    package)."""
+    if not url:
+        return None
+    if url == 'local':
+        return BrokerTransport(LocalBroker())
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError(f"The redis package is needed to use {url}.")
+    return BrokerTransport(redis.Redis.from_url(url))
+
+
+def flight_state(flight):
+    """The event sent for a flight: everything a client shows."""
+    return {
+        'id': flight.id,
+        'departure': flight.departure.isoformat(),
+        'arrival': flight.arrival.isoformat(),
+        'seats_remaining': flight.seats_remaining,
+        'sold_out': flight.seats_remaining <= 0,
+    }
+
+
+def format_event(data, event='flight'):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(subscription, first=None, keepalive=15):
+    """Yield a subscription as server-sent events, starting with first.
+
+    A comment is sent after keepalive idle seconds, so proxies keep the
+    connection open and a closed one is noticed. The subscription is
+    closed when the client goes away.
+    """
+    try:
+        yield "retry: 5000\n\n"
+        if first is not None:
+            yield format_event(first)
+        while True:
+            event = subscription.get(timeout=keepalive)
+            yield format_event(event) if event is not None \
+                else ": keep-alive\n\n"
+    finally:
+        subscription.close()
+
+
+event_bus = EventBus()
+
+
+#   Flights are published after the commit that changed them: the state
+#   is read in after_flush, while the session can still run SQL, and
+#   sent in after_commit. Seat counts change through bulk UPDATEs (see
+#   andromeda.bookings), which skip mapper events, so bookings created
+#   or deleted are what marks their flight as changed.
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_flights(session, flush_context):
+    flight_ids = {booking.flight_id
+                  for booking in chain(session.new, session.deleted)
+                  if isinstance(booking, Booking)}
+    flight_ids.update(flight.id for flight in session.dirty
+                      if isinstance(flight, Flight) and
+                      (inspect(flight).attrs.departure.history.has_changes()
+                       or inspect(flight).attrs.arrival.history.has_changes()))
+    flight_ids = {flight_id for flight_id in flight_ids
+                  if event_bus.listening(flight_channel(flight_id))}
+    if not flight_ids:
+        return
+
+    table = Flight.__table__
+    rows = session.execute(
+        select([table.c.id, table.c.departure, table.c.arrival,
+                table.c.seats_remaining])
+        .where(table.c.id.in_(flight_ids)))
+    changed = session.info.setdefault('changed_flights', {})
+    for row in rows:
+        changed[row.id] = flight_state(row)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_changed_flights(session):
+    for flight_id, state in session.info.pop('changed_flights', {}).items():
+        event_bus.publish(flight_channel(flight_id), state)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_changed_flights(session, previous_transaction):
+    session.info.pop('changed_flights', None)
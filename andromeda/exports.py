@@ -0,0 +1,131 @@
+import csv
+import importlib.util
+import io
+
+from sqlalchemy import Date, DateTime, Float, Integer
+
+from andromeda import db
+from andromeda.models import Booking, Country, Employment, Flight
+from andromeda.models import Passport, User
+
+
+CHUNK_SIZE = 10000
+
+
+def _booking_columns():
+    return (Booking.id.label('booking_id'),
+            Flight.name.label('flight'),
+            Flight.departure.label('departure'),
+            User.username.label('username'),
+            User.email.label('email'),
+            Passport.first_name.label('first_name'),
+            Passport.last_name.label('last_name'),
+            Passport.date_of_birth.label('date_of_birth'),
+            Country.name.label('nationality'),
+            Passport.expiration_date.label('passport_expiration_date'),
+            Booking.date_issued.label('date_issued'),
+            Booking.cancellation_deadline.label('cancellation_deadline'),
+            Booking.cancellation_fee.label('cancellation_fee'))
+
+
+def _bookings_query():
+    # Columns only: rows come back as tuples, not ORM objects, and
+    # passengers without a passport on file are still listed.
+    return db.session.query(*_booking_columns()) \
+        .select_from(Booking) \
+        .join(Flight, Booking.flight_id == Flight.id) \
+        .join(User, Booking.user_id == User.id) \
+        .outerjoin(Passport, Passport.user_id == User.id) \
+        .outerjoin(Country, Passport.country_id == Country.id)
+
+
+def manifest_query(flight_id):
+    """Passengers booked on a flight."""
+    return _bookings_query() \
+        .filter(Booking.flight_id == flight_id) \
+        .order_by(User.username, Booking.id)
+
+
+def company_bookings_query(company_id):
+    """Bookings issued through a company's employees."""
+    return _bookings_query() \
+        .join(Employment,
+              Booking.issuing_employment_id == Employment.user_id) \
+        .filter(Employment.company_id == company_id) \
+        .order_by(Booking.id)
+
+
+def column_names(query):
+    return [column['name'] for column in query.column_descriptions]
+
+
+def stream(query, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to chunk_size rows.
+
+    Rows are fetched chunk_size at a time, through a server-side
+    cursor where the driver has one, so memory does not grow with the
+    size of the result.
+    """
+    rows = query.execution_options(stream_results=True) \
+        .yield_per(chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_chunks(query, chunk_size=CHUNK_SIZE):
+    """Yield the query's result as CSV text, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column_names(query))
+    for rows in stream(query, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_csv(query, f, chunk_size=CHUNK_SIZE):
+    for chunk in csv_chunks(query, chunk_size):
+        f.write(chunk)
+
+
+def parquet_available():
+    """True if pyarrow, which write_parquet needs, is installed."""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def write_parquet(query, path, chunk_size=CHUNK_SIZE):
+    """Write the query's result to a Parquet file, one row group per
+    chunk (requires the pyarrow package)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("The pyarrow package is needed to write Parquet.")
+
+    def arrow_type(sql_type):
+        if isinstance(sql_type, Integer):
+            return pa.int64()
+        if isinstance(sql_type, Float):
+            return pa.float64()
+        if isinstance(sql_type, DateTime):
+            return pa.timestamp('us', tz='UTC' if sql_type.timezone else None)
+        if isinstance(sql_type, Date):
+            return pa.date32()
+        return pa.string()
+
+    schema = pa.schema([(column['name'], arrow_type(column['type']))
+                        for column in query.column_descriptions])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in stream(query, chunk_size):
+            columns = [pa.array(values, type=field.type)
+                       for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
@@ -0,0 +1,37 @@
+from flask import current_app, has_app_context
+
+
+class Extension:
+    """Base for the package's module-level extensions (password_hasher,
+    job_queue, page_cache, ...).
+
+    One object serves every app created in the process, so it only
+    holds what does not depend on the app: registered tasks, callbacks
+    and the like. What init_app reads from an app's config, and what is
+    cached from its database, is kept in a State stored in
+    app.extensions[name] and read back through the state property. Out
+    of an app context, or in an app the extension was not initialized
+    with, a State with the defaults is used.
+    """
+
+    name = None
+
+    class State:
+        pass
+
+    def __init__(self):
+        self._default_state = self.State()
+        self._default_state.extension = self
+
+    @property
+    def state(self):
+        if has_app_context():
+            state = current_app.extensions.get(self.name)
+            if state is not None and state.extension is self:
+                return state
+        return self._default_state
+
+    def _bind(self, app, state):
+        state.extension = self
+        app.extensions[self.name] = state
+        return state
@@ -0,0 +1,178 @@
+import threading
+import time
+
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from moneyed import Money
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from andromeda import db
+from andromeda.extension import Extension
+from andromeda.models import FareRule
+
+
+ADVANCE_PURCHASE = 'advance_purchase'
+FLEXIBILITY = 'flexibility'
+CONTRACT = 'contract'
+KINDS = (ADVANCE_PURCHASE, FLEXIBILITY, CONTRACT)
+
+Quote = namedtuple('Quote', ['fare', 'cancellation_fee'])
+
+
+class StepTable:
+    """Rules keyed by a minimum number of days, as sorted arrays.
+
+    lookup() finds the rule for every input at once with
+    np.searchsorted; inputs below the first threshold get the defaults.
+    """
+
+    def __init__(self, rules, defaults):
+        rules = sorted(rules)
+        self.thresholds = np.array([-np.inf] + [rule[0] for rule in rules])
+        self.columns = [np.array([default] + [rule[i + 1] for rule in rules])
+                        for i, default in enumerate(defaults)]
+
+    def lookup(self, days):
+        index = np.searchsorted(self.thresholds, days, side='right') - 1
+        return [column[index] for column in self.columns]
+
+
+class CompiledRules:
+    def __init__(self, rules):
+        self.advance = StepTable(
+            [(rule.min_days or 0, rule.fare_multiplier) for rule in rules
+             if rule.kind == ADVANCE_PURCHASE], defaults=(1.0,))
+        self.flexibility = StepTable(
+            [(rule.min_days or 0, rule.fare_multiplier, rule.fee_rate)
+             for rule in rules if rule.kind == FLEXIBILITY],
+            defaults=(1.0, 0.0))
+        self.contracts = {rule.company_id: rule.fare_multiplier
+                          for rule in rules if rule.kind == CONTRACT}
+
+
+class FareEngine(Extension):
+    """Quotes fares and cancellation fees from the rules in fare_rule.
+
+    The rules are compiled into NumPy arrays, cached for
+    FARE_RULES_TTL seconds (and dropped as soon as a transaction in
+    this process changes them), and a whole page of flights is priced
+    with a handful of array operations rather than a loop per flight.
+    """
+
+    name = 'fare_engine'
+
+    class State:
+        def __init__(self, currency='EUR', ttl=60):
+            self.currency = currency
+            self.ttl = ttl
+            self.rules = None
+            self.loaded_at = None
+            self.lock = threading.Lock()
+
+    def __init__(self, app=None):
+        super().__init__()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FARE_CURRENCY', 'EUR')
+        app.config.setdefault('FARE_RULES_TTL', 60)
+        self._bind(app, self.State(currency=app.config['FARE_CURRENCY'],
+                                   ttl=app.config['FARE_RULES_TTL']))
+
+    def invalidate(self):
+        state = self.state
+        with state.lock:
+            state.rules = None
+
+    def rules(self):
+        state = self.state
+        with state.lock:
+            if state.rules is not None and \
+                    time.monotonic() - state.loaded_at < state.ttl:
+                return state.rules
+        rules = CompiledRules(FareRule.query.all())
+        with state.lock:
+            state.rules = rules
+            state.loaded_at = time.monotonic()
+        return rules
+
+    def quote_arrays(self, base_fares, departures, booked_at=None,
+                     cancellation_deadline=None, company_id=None):
+        """Fares and fees, as float arrays, for flights given as parallel
+        sequences of base fares and departure times.
+
+        Without a cancellation deadline, the least flexible ticket is
+        quoted.
+        """
+        rules = self.rules()
+        base = np.asarray(base_fares, dtype=float)
+        departures = np.asarray(departures, dtype='datetime64[s]')
+        booked_at = np.datetime64(booked_at or datetime.now(), 's')
+
+        one_day = np.timedelta64(1, 'D')
+        days_ahead = np.floor((departures - booked_at) / one_day)
+        if cancellation_deadline is None:
+            days_flexible = np.full(len(base), np.inf)
+        else:
+            deadline = np.datetime64(cancellation_deadline, 'D')
+            # A deadline after departure is as flexible as one on the day,
+            # not below every rule.
+            days_flexible = np.maximum(
+                (departures.astype('datetime64[D]') - deadline) / one_day, 0)
+
+        advance, = rules.advance.lookup(days_ahead)
+        flexibility, fee_rate = rules.flexibility.lookup(days_flexible)
+        contract = rules.contracts.get(company_id, 1.0)
+
+        fares = np.round(base * advance * flexibility * contract, 2)
+        fees = np.round(fares * fee_rate, 2)
+        return fares, fees
+
+    def quote_flights(self, flights, booked_at=None,
+                      cancellation_deadline=None, company_id=None):
+        """Quote for each flight (anything with base_fare and departure)."""
+        if not flights:
+            return []
+        fares, fees = self.quote_arrays(
+            [flight.base_fare for flight in flights],
+            [flight.departure for flight in flights],
+            booked_at, cancellation_deadline, company_id)
+        return [Quote(self.money(fare), self.money(fee))
+                for fare, fee in zip(fares, fees)]
+
+    def quote_flight(self, flight, booked_at=None,
+                     cancellation_deadline=None, company_id=None):
+        return self.quote_flights([flight], booked_at,
+                                  cancellation_deadline, company_id)[0]
+
+    def money(self, amount):
+        return Money(Decimal(f'{amount:.2f}'), self.state.currency)
+
+
+fare_engine = FareEngine()
+
+
+@event.listens_for(FareRule, 'after_insert')
+@event.listens_for(FareRule, 'after_update')
+@event.listens_for(FareRule, 'after_delete')
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['fare_rules_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed(session):
+    if session.info.pop('fare_rules_changed', False):
+        fare_engine.invalidate()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_changed(session, previous_transaction):
+    session.info.pop('fare_rules_changed', None)
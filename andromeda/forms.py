@@ -1,8 +1,16 @@
+from datetime import date
+
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, BooleanField
+from wtforms import IntegerField, HiddenField, SelectField
+from wtforms.fields.html5 import DateField
 from wtforms.validators import DataRequired, Length, Email, EqualTo
+from wtforms.validators import Optional, NumberRange
 from wtforms.validators import ValidationError
 
+from flask_login import current_user
+
+from andromeda.itineraries import MAX_WINDOW_DAYS
 from andromeda.models import User
 
 
@@ -27,12 +35,36 @@ class RegistrationForm(FlaskForm):
             raise ValidationError('Username already exists!')
 
     def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
+        user = User.by_email(email.data)
 
         if user:
             raise ValidationError('Account with email already exists!')
 
 
+class UpdateAccountForm(FlaskForm):
+    username = StringField('Username',
+                           validators=[DataRequired(),
+                                       Length(min=2, max=15)])
+    email = StringField('Email',
+                        validators=[DataRequired(),
+                                    Email()])
+    submit = SubmitField('Update')
+
+    def validate_username(self, username):
+        if username.data != current_user.username:
+            user = User.query.filter_by(username=username.data).first()
+
+            if user:
+                raise ValidationError('Username already exists!')
+
+    def validate_email(self, email):
+        if email.data.lower() != current_user.email.lower():
+            user = User.by_email(email.data)
+
+            if user:
+                raise ValidationError('Account with email already exists!')
+
+
 class LoginForm(FlaskForm):
     email = StringField('Email',
                         validators=[DataRequired(),
@@ -41,3 +73,90 @@ class LoginForm(FlaskForm):
                              validators=[DataRequired()])
     remember = BooleanField('Remember Me')
     submit = SubmitField('Log in')
+
+
+class CityField(SelectField):
+    """Select of a city id.
+
+    Its options (refdata.city_choices) are given to the form for the
+    HTML page only: without them, as for ?format=json, any city id is
+    taken as it is.
+    """
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, coerce=int, **kwargs)
+
+    def pre_validate(self, form):
+        if self.choices is not None:
+            super().pre_validate(form)
+
+
+class RouteSearchForm(FlaskForm):
+    # Submitted with GET, so there is no CSRF token to check.
+    class Meta:
+        csrf = False
+
+    origin = CityField('From', validators=[DataRequired()])
+    destination = CityField('To', validators=[DataRequired()])
+    departure_from = DateField('Departing on or after',
+                               validators=[DataRequired()])
+    departure_to = DateField('Departing on or before',
+                             validators=[Optional()])
+
+    def __init__(self, cities=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.origin.choices = self.destination.choices = cities
+
+
+class FlightSearchForm(RouteSearchForm):
+    limit = IntegerField('Results per page',
+                         validators=[Optional(),
+                                     NumberRange(min=1, max=100)])
+    cursor = HiddenField()
+    submit = SubmitField('Search')
+
+    def validate_departure_to(self, departure_to):
+        if departure_to.data and self.departure_from.data and \
+                departure_to.data < self.departure_from.data:
+            raise ValidationError('Must not be before the first day.')
+
+
+class ItinerarySearchForm(RouteSearchForm):
+    max_hops = IntegerField('Maximum flights',
+                            default=3,
+                            validators=[Optional(),
+                                        NumberRange(min=1, max=5)])
+    min_layover = IntegerField('Minimum layover (minutes)',
+                               default=45,
+                               validators=[Optional(),
+                                           NumberRange(min=0, max=24 * 60)])
+    limit = IntegerField('Results',
+                         validators=[Optional(),
+                                     NumberRange(min=1, max=50)])
+    submit = SubmitField('Search')
+
+    def validate_departure_to(self, departure_to):
+        if departure_to.data and self.departure_from.data:
+            if departure_to.data < self.departure_from.data:
+                raise ValidationError('Must not be before the first day.')
+            if (departure_to.data - self.departure_from.data).days >= \
+                    MAX_WINDOW_DAYS:
+                raise ValidationError(f'Must be less than {MAX_WINDOW_DAYS} '
+                                      f'days after the first day.')
+
+
+class BookingForm(FlaskForm):
+    cancellation_deadline = DateField('Cancellation deadline',
+                                      validators=[DataRequired()])
+    submit = SubmitField('Book')
+
+    def __init__(self, departure=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.departure = departure
+
+    def validate_cancellation_deadline(self, cancellation_deadline):
+        if cancellation_deadline.data < date.today():
+            raise ValidationError('Must not be in the past.')
+        if self.departure and \
+                cancellation_deadline.data > self.departure.date():
+            raise ValidationError('Must not be after the departure.')
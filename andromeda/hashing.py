@@ -0,0 +1,130 @@
+import secrets
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from andromeda.extension import Extension
+from andromeda.instrumentation import record_timing
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+class PasswordHasher(Extension):
+    """Single place where passwords are hashed and checked.
+
+    Hashing runs on a bounded pool of worker threads (bcrypt releases
+    the GIL), so a burst of logins cannot put more than
+    PASSWORD_HASHING_WORKERS cores on bcrypt at once. Requests beyond
+    the backlog are refused with HashingBusyError instead of queueing
+    without limit, as are requests still waiting after
+    PASSWORD_HASHING_TIMEOUT seconds. With zero workers, hashing runs
+    inline.
+    """
+
+    name = 'password_hasher'
+
+    class State:
+        def __init__(self, rounds=12, workers=0, backlog=0, timeout=None):
+            self.rounds = rounds
+            self.workers = workers
+            self.backlog = backlog
+            self.timeout = timeout
+            self.executor = None
+            self.slots = None
+            self.dummy_hash = None
+            self.lock = threading.Lock()
+
+    def __init__(self, app=None, bcrypt=None):
+        super().__init__()
+        self.bcrypt = bcrypt
+        if app is not None:
+            self.init_app(app, bcrypt)
+
+    def init_app(self, app, bcrypt=None):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASHING_WORKERS', 4)
+        app.config.setdefault('PASSWORD_HASHING_BACKLOG', 64)
+        app.config.setdefault('PASSWORD_HASHING_TIMEOUT', 30)
+
+        if bcrypt is not None:
+            self.bcrypt = bcrypt
+        self._bind(app, self.State(
+            rounds=int(app.config['BCRYPT_LOG_ROUNDS']),
+            workers=int(app.config['PASSWORD_HASHING_WORKERS']),
+            backlog=int(app.config['PASSWORD_HASHING_BACKLOG']),
+            timeout=app.config['PASSWORD_HASHING_TIMEOUT']))
+
+    def hash(self, password):
+        state = self.state
+        hashed = self._run(state, self.bcrypt.generate_password_hash,
+                           password, state.rounds)
+        return hashed.decode('utf-8')
+
+    def check(self, hashed, password):
+        return self._run(self.state, self.bcrypt.check_password_hash,
+                         hashed, password)
+
+    def check_unknown(self, password):
+        """Check password against a hash of the current cost, and fail.
+
+        For logins to accounts that do not exist: they take as long as
+        any other failed login, so response times do not tell which
+        addresses have an account.
+        """
+        state = self.state
+        if state.dummy_hash is None:
+            state.dummy_hash = self.hash(secrets.token_hex(16))
+        self.check(state.dummy_hash, password)
+        return False
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<cost>$<salt and digest>
+        try:
+            return int(hashed.split('$')[2]) != self.state.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def _run(self, state, function, *args):
+        started = time.perf_counter()
+        try:
+            return self._call(state, function, *args)
+        finally:
+            record_timing('hashing', time.perf_counter() - started)
+
+    def _call(self, state, function, *args):
+        if state.workers <= 0:
+            return function(*args)
+
+        with state.lock:
+            if state.executor is None:
+                state.executor = ThreadPoolExecutor(
+                    max_workers=state.workers,
+                    thread_name_prefix='password-hashing')
+                state.slots = threading.BoundedSemaphore(
+                    state.workers + state.backlog)
+        slots = state.slots
+
+        if not slots.acquire(blocking=False):
+            raise HashingBusyError("Too many password checks in progress.")
+        try:
+            future = state.executor.submit(self._work, slots,
+                                           function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        try:
+            return future.result(timeout=state.timeout)
+        except FutureTimeoutError:
+            raise HashingBusyError("Password check timed out.")
+
+    def _work(self, slots, function, *args):
+        # The slot is given back when bcrypt is done, not when the
+        # caller stops waiting, so work that timed out still counts.
+        try:
+            return function(*args)
+        finally:
+            slots.release()
@@ -0,0 +1,60 @@
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased
+
+from andromeda import db
+from andromeda.models import Booking, City, Flight
+from andromeda.pagination import encode_cursor, decode_cursor
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def booking_history(user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one page of a user's bookings, newest first, plus the
+    cursor of the next.
+
+    Each page is a single query over the (user_id, date_issued, id)
+    index, joined to the flight and its cities, that returns plain rows
+    rather than ORM objects; with keyset pagination, a page costs the
+    same however many bookings the user has.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    departure_city = aliased(City)
+    arrival_city = aliased(City)
+
+    query = db.session.query(
+        Booking.id,
+        Booking.date_issued,
+        Booking.cancellation_deadline,
+        Booking.fare,
+        Booking.cancellation_fee,
+        Flight.id.label('flight_id'),
+        Flight.name.label('flight'),
+        Flight.departure,
+        Flight.arrival,
+        departure_city.name.label('departure_city'),
+        arrival_city.name.label('arrival_city'),
+    ) \
+        .select_from(Booking) \
+        .join(Flight, Booking.flight_id == Flight.id) \
+        .join(departure_city, Flight.departure_city_id == departure_city.id) \
+        .join(arrival_city, Flight.arrival_city_id == arrival_city.id) \
+        .filter(Booking.user_id == user_id)
+
+    if cursor:
+        date_issued, booking_id = decode_cursor(cursor)
+        query = query.filter(or_(Booking.date_issued < date_issued,
+                                 and_(Booking.date_issued == date_issued,
+                                      Booking.id < booking_id)))
+
+    rows = query.order_by(Booking.date_issued.desc(), Booking.id.desc()) \
+                .limit(limit + 1) \
+                .all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date_issued, rows[-1].id)
+
+    return rows, next_cursor
@@ -0,0 +1,280 @@
+import logging
+import threading
+import time
+
+from collections import Counter as Tally
+
+from flask import Response, g, has_app_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from andromeda.extension import Extension
+
+
+slow_query_log = logging.getLogger('andromeda.slow_queries')
+slow_request_log = logging.getLogger('andromeda.slow_requests')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets),
+                                                   0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = sorted((key, (list(counts), total))
+                            for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _labels(self.labelnames + ('le',), key + (le,))
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {counts[-1]}"
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class RequestStats:
+    """What one request spent its time on, collected in flask.g."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.statements = Tally()
+        self.timings = Tally()
+
+    def add(self, kind, seconds):
+        self.timings[kind] += seconds
+
+
+def record_timing(kind, seconds):
+    """Add seconds spent on kind ('db', 'render', 'hashing', ...) to the
+    current request, if it is being instrumented."""
+    stats = g.get('request_stats') if has_app_context() else None
+    if stats is not None:
+        stats.add(kind, seconds)
+
+
+class TimedTemplate(Template):
+    # Only top-level renders pass through here; extended and included
+    # templates are rendered inside them.
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            record_timing('render', time.perf_counter() - started)
+
+
+class Instrumentation(Extension):
+    """Per-request query counts and timings, exported as Prometheus
+    metrics, plus slow query, slow request and N+1 query logging.
+
+    Metrics are kept per process, across apps.
+    """
+
+    name = 'instrumentation'
+
+    class State:
+        def __init__(self, slow_query_threshold=0.2,
+                     slow_request_threshold=1.0, n_plus_one_threshold=10,
+                     server_timing=False):
+            self.slow_query_threshold = slow_query_threshold
+            self.slow_request_threshold = slow_request_threshold
+            self.n_plus_one_threshold = n_plus_one_threshold
+            self.server_timing = server_timing
+
+    def __init__(self, app=None):
+        super().__init__()
+        self.requests = Counter(
+            'andromeda_requests_total', "HTTP requests handled.",
+            ('endpoint', 'method', 'status'))
+        self.request_seconds = Histogram(
+            'andromeda_request_duration_seconds',
+            "Time spent handling requests.", ('endpoint',))
+        self.component_seconds = Histogram(
+            'andromeda_request_component_seconds',
+            "Time spent per request on the database, templates and "
+            "password hashing.", ('endpoint', 'component'))
+        self.queries = Counter(
+            'andromeda_db_queries_total', "SQL statements executed.",
+            ('endpoint',))
+        self.slow_queries = Counter(
+            'andromeda_db_slow_queries_total',
+            "SQL statements slower than SLOW_QUERY_THRESHOLD_MS.")
+        self.n_plus_one = Counter(
+            'andromeda_n_plus_one_total',
+            "Requests that repeated a statement N_PLUS_ONE_THRESHOLD "
+            "times or more.", ('endpoint',))
+        self.metrics = [self.requests, self.request_seconds,
+                        self.component_seconds, self.queries,
+                        self.slow_queries, self.n_plus_one]
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('INSTRUMENTATION_ENABLED', True)
+        app.config.setdefault('METRICS_ENDPOINT', None)
+        app.config.setdefault('SERVER_TIMING_ENABLED', False)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+        app.config.setdefault('SLOW_REQUEST_THRESHOLD_MS', 1000)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 10)
+        self._bind(app, self.State(
+            slow_query_threshold=app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000,
+            slow_request_threshold=(
+                app.config['SLOW_REQUEST_THRESHOLD_MS'] / 1000),
+            n_plus_one_threshold=app.config['N_PLUS_ONE_THRESHOLD'],
+            server_timing=app.config['SERVER_TIMING_ENABLED']))
+        if not app.config['INSTRUMENTATION_ENABLED']:
+            return
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+
+        app.jinja_env.template_class = TimedTemplate
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if app.config['METRICS_ENDPOINT']:
+            app.add_url_rule(app.config['METRICS_ENDPOINT'], 'metrics',
+                             self.metrics_view)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+        if elapsed >= self.state.slow_query_threshold:
+            self.slow_queries.inc()
+            # Not the parameters: they hold e-mail addresses, password
+            # hashes and the like, which the logs must not.
+            slow_query_log.warning("%.1f ms: %s", elapsed * 1000, statement)
+
+        stats = g.get('request_stats') if has_app_context() else None
+        if stats is not None:
+            stats.queries += 1
+            stats.statements[statement] += 1
+            stats.add('db', elapsed)
+
+    def _handle_error(self, context):
+        # after_cursor_execute is not called for a failed statement.
+        connection = context.connection
+        if connection is not None:
+            started = connection.info.get('query_started')
+            if started:
+                started.pop()
+
+    def _before_request(self):
+        g.request_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        state = self.state
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+
+        self.requests.inc(endpoint=endpoint, method=request.method,
+                          status=response.status_code)
+        self.request_seconds.observe(elapsed, endpoint=endpoint)
+        for component in ('db', 'render', 'hashing'):
+            self.component_seconds.observe(stats.timings[component],
+                                           endpoint=endpoint,
+                                           component=component)
+        self.queries.inc(stats.queries, endpoint=endpoint)
+
+        repeated = [(statement, count)
+                    for statement, count in stats.statements.items()
+                    if count >= state.n_plus_one_threshold]
+        if repeated:
+            self.n_plus_one.inc(endpoint=endpoint)
+            for statement, count in repeated:
+                slow_request_log.warning(
+                    "Possible N+1 on %s: %d executions of %s",
+                    endpoint, count, statement)
+
+        if elapsed >= state.slow_request_threshold:
+            slow_request_log.warning(
+                "%s %s took %.1f ms: %d queries, db %.1f ms, "
+                "render %.1f ms, hashing %.1f ms",
+                request.method, request.path, elapsed * 1000, stats.queries,
+                stats.timings['db'] * 1000, stats.timings['render'] * 1000,
+                stats.timings['hashing'] * 1000)
+
+        if state.server_timing:
+            timings = [
+                f"{component};dur={stats.timings[component] * 1000:.1f}"
+                for component in ('db', 'render', 'hashing')]
+            # The query count is read back by the benchmarks.
+            timings.append(f'queries;desc="{stats.queries}"')
+            response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    def expose(self):
+        lines = [line for metric in self.metrics for line in metric.expose()]
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.expose(),
+                        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,398 @@
+import heapq
+import itertools
+import threading
+import time as clock
+
+from bisect import bisect_left, insort
+from collections import namedtuple, defaultdict
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import object_session
+
+from andromeda import db
+from andromeda.models import CacheChange, CacheVersion, Flight
+
+
+DEFAULT_MIN_LAYOVER = timedelta(minutes=45)
+DEFAULT_MAX_LAYOVER = timedelta(hours=24)
+DEFAULT_MAX_HOPS = 3
+#   Searches seed one earliest-arrival search per departure in the
+#   window, so its length bounds their cost.
+MAX_WINDOW_DAYS = 7
+DEFAULT_LIMIT = 50
+
+#   Flight changes made in any process bump the graph's row in
+#   cache_version and log the flights they changed in cache_change;
+#   each process compares the version with its graph's at most every
+#   DEFAULT_CHECK_INTERVAL seconds and patches in the logged flights,
+#   and rebuilds the graph after DEFAULT_MAX_AGE seconds regardless.
+#   A graph more than CHANGE_LOG_LENGTH versions behind is rebuilt.
+DEFAULT_MAX_AGE = 300
+DEFAULT_CHECK_INTERVAL = 5
+CHANGE_LOG_LENGTH = 1000
+VERSION_NAME = 'route_graph'
+GRAPH_ATTRIBUTES = ('name', 'departure', 'arrival',
+                    'departure_city_id', 'arrival_city_id',
+                    'departure_city', 'arrival_city')
+
+
+Leg = namedtuple('Leg', ['flight_id', 'name',
+                         'departure_city_id', 'arrival_city_id',
+                         'departure', 'arrival'])
+
+
+def leg_for(flight):
+    return Leg(flight.id, flight.name,
+               flight.departure_city_id, flight.arrival_city_id,
+               flight.departure, flight.arrival)
+
+
+def current_version():
+    return db.session.query(CacheVersion.version) \
+        .filter(CacheVersion.name == VERSION_NAME).scalar() or 0
+
+
+def bump_version(connection, flight_ids=()):
+    """Mark every process's graph stale, in the transaction that
+    changes the flights.
+
+    With flight_ids, logs them and returns the new version, and other
+    processes patch in only those flights; without, they rebuild their
+    graph.
+    """
+    versions = CacheVersion.__table__
+    updated = connection.execute(
+        versions.update().where(versions.c.name == VERSION_NAME)
+        .values(version=versions.c.version + 1))
+    if not updated.rowcount:
+        connection.execute(versions.insert().values(name=VERSION_NAME,
+                                                    version=1))
+    if not flight_ids:
+        return None
+    version = connection.execute(
+        select([versions.c.version])
+        .where(versions.c.name == VERSION_NAME)).scalar()
+
+    changes = CacheChange.__table__
+    connection.execute(changes.insert(), [
+        {'name': VERSION_NAME, 'version': version, 'item_id': flight_id}
+        for flight_id in flight_ids
+    ])
+    connection.execute(changes.delete().where(
+        (changes.c.name == VERSION_NAME) &
+        (changes.c.version <= version - CHANGE_LOG_LENGTH)))
+    return version
+
+
+def logged_changes(since, version):
+    """Return the flights changed from version since to version, or
+    None if a graph at since has to be rebuilt: a change was not logged
+    flight by flight, or is no longer logged."""
+    rows = db.session.query(CacheChange.version, CacheChange.item_id) \
+        .filter(CacheChange.name == VERSION_NAME,
+                CacheChange.version > since,
+                CacheChange.version <= version).all()
+    if {logged for logged, _ in rows} != set(range(since + 1, version + 1)):
+        return None
+    return {flight_id for _, flight_id in rows}
+
+
+class Snapshot:
+    """Every flight as a leg, and each city's departures sorted by time.
+
+    Never changed once built: patches build a new one that shares the
+    untouched cities' departures, so searches read a snapshot without
+    holding the graph's lock.
+    """
+
+    def __init__(self, legs, departures):
+        self.legs = legs
+        self.departures = departures
+
+    def patched(self, upserts=(), removals=()):
+        legs = dict(self.legs)
+        departures = dict(self.departures)
+        copied = set()
+
+        def city(city_id):
+            if city_id not in copied:
+                departures[city_id] = list(departures.get(city_id, ()))
+                copied.add(city_id)
+            return departures[city_id]
+
+        for flight_id in itertools.chain(removals,
+                                         (leg.flight_id for leg in upserts)):
+            leg = legs.pop(flight_id, None)
+            if leg is not None:
+                city(leg.departure_city_id).remove(
+                    (leg.departure, leg.flight_id))
+        for leg in upserts:
+            legs[leg.flight_id] = leg
+            insort(city(leg.departure_city_id),
+                   (leg.departure, leg.flight_id))
+        return Snapshot(legs, departures)
+
+    def legs_between(self, city_id, earliest, latest):
+        departures = self.departures.get(city_id, ())
+        start = bisect_left(departures, (earliest, 0))
+        for departure, flight_id in itertools.islice(departures, start, None):
+            if departure > latest:
+                break
+            yield self.legs[flight_id]
+
+
+EMPTY = Snapshot({}, {})
+
+
+class RouteGraph:
+    """Time-expanded graph of every flight, held in memory.
+
+    Each city keeps its outgoing legs sorted by departure time, so the
+    connections available after a layover are found with a bisection
+    instead of a query per hop. The graph is built with a single
+    column query and then patched as flights change, in this process
+    or, through the change log, in others; the lock only guards
+    replacing the current Snapshot.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE,
+                 check_interval=DEFAULT_CHECK_INTERVAL):
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._snapshot = EMPTY
+        self._loaded_at = None
+        self._checked_at = None
+        self._version = None
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def reset(self):
+        with self._lock:
+            self._snapshot = EMPTY
+            self._loaded_at = None
+
+    def load(self):
+        # Read before the flights: a change committed in between makes
+        # the next check load them again.
+        version = current_version()
+        rows = db.session.query(Flight.id, Flight.name,
+                                Flight.departure_city_id,
+                                Flight.arrival_city_id,
+                                Flight.departure, Flight.arrival)
+        legs = {}
+        departures = defaultdict(list)
+        for row in rows:
+            leg = Leg(*row)
+            legs[leg.flight_id] = leg
+            departures[leg.departure_city_id].append(
+                (leg.departure, leg.flight_id))
+        for city_departures in departures.values():
+            city_departures.sort()
+
+        with self._lock:
+            self._snapshot = Snapshot(legs, dict(departures))
+            self._version = version
+            self._loaded_at = self._checked_at = clock.monotonic()
+
+    def ensure_loaded(self):
+        now = clock.monotonic()
+        with self._lock:
+            if self.loaded and now - self._loaded_at <= self.max_age:
+                if now - self._checked_at < self.check_interval:
+                    return
+                self._checked_at = now
+                version = self._version
+            else:
+                version = None
+        if version is None:
+            self.load()
+            return
+        latest = current_version()
+        if latest > version:
+            self.catch_up(version, latest)
+        elif latest < version:
+            self.load()
+
+    def catch_up(self, since, version):
+        """Patch in the flights changed from version since to version,
+        with one query for them, or rebuild the graph if they are not
+        logged."""
+        flight_ids = logged_changes(since, version)
+        if flight_ids is None:
+            self.load()
+            return
+        legs = [Leg(*row) for row in db.session.query(
+            Flight.id, Flight.name,
+            Flight.departure_city_id, Flight.arrival_city_id,
+            Flight.departure, Flight.arrival,
+        ).filter(Flight.id.in_(flight_ids))]
+        removals = flight_ids - {leg.flight_id for leg in legs}
+        self.patch(legs, removals, since, version)
+
+    def patch(self, upserts=(), removals=(), since=None, version=None):
+        """Replace and remove legs, and move the graph from version
+        since to version: patches that arrive out of order still apply,
+        but leave the version for the next check to catch up from."""
+        with self._lock:
+            if not self.loaded:
+                return
+            if version is not None and self._version >= version:
+                return
+            self._snapshot = self._snapshot.patched(upserts, removals)
+            if version is not None and self._version == since:
+                self._version = version
+
+    def upsert(self, flight, version=None):
+        self.patch([leg_for(flight)], (),
+                   version and version - 1, version)
+
+    def remove(self, flight_id, version=None):
+        self.patch((), [flight_id], version and version - 1, version)
+
+    def search(self, origin_id, destination_id,
+               earliest, latest=None,
+               min_layover=DEFAULT_MIN_LAYOVER,
+               max_layover=DEFAULT_MAX_LAYOVER,
+               max_hops=DEFAULT_MAX_HOPS,
+               limit=DEFAULT_LIMIT):
+        """Return itineraries from origin to destination, as lists of legs.
+
+        Every flight leaving the origin in the departure window (whole
+        days from earliest to latest, at most MAX_WINDOW_DAYS) seeds an
+        earliest-arrival search, and only itineraries that no other one
+        beats on both departure and arrival time are kept, ordered by
+        departure. At most limit are returned.
+        """
+        if latest is not None and \
+                (latest - earliest).days >= MAX_WINDOW_DAYS:
+            raise ValueError(f"The departure window is longer than "
+                             f"{MAX_WINDOW_DAYS} days.")
+        start = datetime.combine(earliest, time.min)
+        end = datetime.combine(latest or earliest, time.min) + \
+            timedelta(days=1)
+
+        snapshot = self._snapshot
+        found = []
+        for first in snapshot.legs_between(origin_id, start, end):
+            if first.departure >= end:
+                break
+            itinerary = self._earliest_arrival(snapshot, first,
+                                               destination_id,
+                                               min_layover, max_layover,
+                                               max_hops)
+            if itinerary:
+                found.append(itinerary)
+
+        itineraries = []
+        for itinerary in sorted(found,
+                                key=lambda i: (-i[0].departure.timestamp(),
+                                               i[-1].arrival)):
+            if itineraries and \
+                    itineraries[-1][-1].arrival <= itinerary[-1].arrival:
+                continue
+            itineraries.append(itinerary)
+        itineraries.reverse()
+        return itineraries[:limit]
+
+    def _earliest_arrival(self, snapshot, first, destination_id,
+                          min_layover, max_layover, max_hops):
+        # Time-dependent Dijkstra over (city, hops used) labels, keyed on
+        # arrival time. Labels are settled in order of arrival, so an
+        # earlier label at the same city, with no more hops, already
+        # tried every connection up to its arrival + max_layover: a later
+        # one only needs the connections after that, and is dropped if
+        # there can be none.
+        counter = itertools.count()
+        heap = [(first.arrival, 1, next(counter), (first,))]
+        settled = defaultdict(list)
+
+        while heap:
+            arrival, hops, _, path = heapq.heappop(heap)
+            city_id = path[-1].arrival_city_id
+            if city_id == destination_id:
+                return list(path)
+            covered = max((a + max_layover for h, a in settled[city_id]
+                           if h <= hops), default=None)
+            if covered is not None and covered >= arrival + max_layover:
+                continue
+            settled[city_id].append((hops, arrival))
+            if hops >= max_hops:
+                continue
+
+            visited = {leg.departure_city_id for leg in path}
+            for leg in snapshot.legs_between(city_id,
+                                             arrival + min_layover,
+                                             arrival + max_layover):
+                if leg.arrival_city_id in visited or \
+                        covered is not None and leg.departure <= covered:
+                    continue
+                heapq.heappush(heap, (leg.arrival, hops + 1,
+                                      next(counter), path + (leg,)))
+        return None
+
+
+route_graph = RouteGraph()
+
+
+#   The version is bumped by the flush that changes the flights, in the
+#   same transaction, so other processes see it once they can see the
+#   change; this process's graph is patched, and takes the version, once
+#   it commits. Core inserts (andromeda.schedule_import) call
+#   bump_version.
+def _mark(target, leg):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('route_graph_changes', {})[target.id] = leg
+
+
+@event.listens_for(Flight, 'after_insert')
+def _mark_added(mapper, connection, target):
+    _mark(target, leg_for(target))
+
+
+@event.listens_for(Flight, 'after_update')
+def _mark_moved(mapper, connection, target):
+    # Not for changes the graph does not hold, such as seats_remaining.
+    attrs = inspect(target).attrs
+    if any(attrs[name].history.has_changes() for name in GRAPH_ATTRIBUTES):
+        _mark(target, leg_for(target))
+
+
+@event.listens_for(Flight, 'after_delete')
+def _mark_removed(mapper, connection, target):
+    _mark(target, None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_changed(session, flush_context):
+    changes = session.info.pop('route_graph_changes', None)
+    if changes:
+        version = bump_version(session.connection(), sorted(changes))
+        session.info.setdefault('route_graph_versions', []) \
+            .append((version, changes))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _patch_committed(session):
+    for version, changes in session.info.pop('route_graph_versions', ()):
+        route_graph.patch(
+            [leg for leg in changes.values() if leg is not None],
+            [flight_id for flight_id, leg in changes.items() if leg is None],
+            version - 1, version)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop('route_graph_changes', None)
+    session.info.pop('route_graph_versions', None)
+
+
+def search_itineraries(origin_id, destination_id, earliest, latest=None,
+                       **constraints):
+    route_graph.ensure_loaded()
+    return route_graph.search(origin_id, destination_id,
+                              earliest, latest, **constraints)
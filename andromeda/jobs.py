@@ -0,0 +1,246 @@
+import json
+import logging
+import threading
+import time
+import traceback
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, or_
+
+from andromeda import db
+from andromeda.extension import Extension
+from andromeda.models import Job
+
+
+log = logging.getLogger('andromeda.jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+#   database: jobs are stored in the job table and run by
+#             `flask andromeda worker`, in another process.
+#   eager:    jobs run as soon as the transaction that enqueued them
+#             commits, in the same process (tests, scripts).
+MODES = ('database', 'eager')
+
+
+class UnknownJobError(Exception):
+    pass
+
+
+class JobQueue(Extension):
+    """Small job queue kept in the application database.
+
+    enqueue() adds the job to the current session, so it is committed
+    (or rolled back) with the work that asked for it. Workers claim due
+    jobs with a conditional UPDATE, so each attempt runs in exactly one
+    worker; a job is retried with exponential backoff until it has
+    failed max_attempts times. Delivery is at least once: a worker that
+    dies mid-job leaves it to be claimed again after JOBS_LOCK_TIMEOUT.
+    """
+
+    name = 'job_queue'
+
+    class State:
+        def __init__(self, mode='database', max_attempts=5, retry_delay=30,
+                     lock_timeout=600):
+            self.mode = mode
+            self.max_attempts = max_attempts
+            self.retry_delay = retry_delay
+            self.lock_timeout = lock_timeout
+
+    def __init__(self, app=None):
+        super().__init__()
+        self.tasks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_MODE', 'database')
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOBS_RETRY_DELAY', 30)
+        app.config.setdefault('JOBS_LOCK_TIMEOUT', 600)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+
+        mode = app.config['JOBS_MODE']
+        if mode not in MODES:
+            raise ValueError(f"JOBS_MODE must be one of {MODES}, "
+                             f"not {mode!r}.")
+        self._bind(app, self.State(
+            mode=mode,
+            max_attempts=app.config['JOBS_MAX_ATTEMPTS'],
+            retry_delay=app.config['JOBS_RETRY_DELAY'],
+            lock_timeout=app.config['JOBS_LOCK_TIMEOUT']))
+
+    def task(self, name):
+        """Decorator: register a function as the task called name.
+
+        Tasks take JSON-serializable keyword arguments and may run more
+        than once, so they should be safe to repeat.
+        """
+        def register(function):
+            self.tasks[name] = function
+            return function
+        return register
+
+    def enqueue(self, name, idempotency_key=None, delay=0, **kwargs):
+        """Queue the task name with kwargs, in the current transaction.
+
+        Returns the Job, or None in eager mode, where the task runs
+        when the transaction commits.
+        """
+        if name not in self.tasks:
+            raise UnknownJobError(f"No task called {name!r}.")
+        state = self.state
+        if state.mode == 'eager':
+            db.session.info.setdefault('eager_jobs', []) \
+                .append((self.tasks[name], kwargs))
+            return None
+
+        if idempotency_key is not None:
+            job = Job.query.filter_by(idempotency_key=idempotency_key) \
+                .first()
+            if job is not None:
+                return job
+
+        job = Job(name=name,
+                  payload=json.dumps(kwargs),
+                  idempotency_key=idempotency_key,
+                  run_at=datetime.now() + timedelta(seconds=delay),
+                  max_attempts=state.max_attempts)
+        db.session.add(job)
+        return job
+
+    def _due(self, now):
+        stale = now - timedelta(seconds=self.state.lock_timeout)
+        return or_(and_(Job.status == QUEUED, Job.run_at <= now),
+                   and_(Job.status == RUNNING, Job.locked_at < stale))
+
+    def claim(self, limit=10):
+        """Mark up to limit due jobs as running, and return their ids."""
+        now = datetime.now()
+        candidates = [id for id, in db.session.query(Job.id)
+                      .filter(self._due(now))
+                      .order_by(Job.run_at)
+                      .limit(limit)]
+        db.session.rollback()
+
+        claimed = []
+        for job_id in candidates:
+            # Another worker may have claimed it since the SELECT.
+            if Job.query.filter(Job.id == job_id, self._due(now)) \
+                    .update({Job.status: RUNNING,
+                             Job.locked_at: now,
+                             Job.attempts: Job.attempts + 1},
+                            synchronize_session=False):
+                claimed.append(job_id)
+            db.session.commit()
+        return claimed
+
+    def run(self, job_id):
+        """Run a claimed job and record the outcome."""
+        job = Job.query.get(job_id)
+        if job is None:
+            # Deleted since it was claimed.
+            return False
+        try:
+            task = self.tasks.get(job.name)
+            if task is None:
+                raise UnknownJobError(f"No task called {job.name!r}.")
+            task(**json.loads(job.payload))
+        except Exception as e:
+            db.session.rollback()
+            self._failed(job_id, e)
+            return False
+
+        job.status = DONE
+        job.locked_at = None
+        job.last_error = None
+        db.session.commit()
+        return True
+
+    def _failed(self, job_id, error):
+        job = Job.query.get(job_id)
+        if job is None:
+            log.warning("Job %s failed and has since been deleted: %s",
+                        job_id, error)
+            return
+        job.last_error = ''.join(traceback.format_exception(
+            type(error), error, error.__traceback__))
+        job.locked_at = None
+        if isinstance(error, UnknownJobError) or \
+                job.attempts >= job.max_attempts:
+            job.status = FAILED
+            log.error("Job %s (%s) failed for good: %s",
+                      job.id, job.name, error)
+        else:
+            job.status = QUEUED
+            job.run_at = datetime.now() + timedelta(
+                seconds=self.state.retry_delay * 2 ** (job.attempts - 1))
+            log.warning("Job %s (%s) failed, will retry: %s",
+                        job.id, job.name, error)
+        db.session.commit()
+
+    def run_pending(self, limit=10):
+        """Claim and run due jobs; return how many ran."""
+        claimed = self.claim(limit)
+        for job_id in claimed:
+            self.run(job_id)
+            db.session.remove()
+        return len(claimed)
+
+    def work(self, poll_interval=1.0, batch_size=10, burst=False):
+        """Run jobs until interrupted, or until none are due if burst."""
+        while True:
+            try:
+                ran = self.run_pending(batch_size)
+            except Exception:
+                # The database may be briefly unreachable; claimed jobs
+                # are claimed again once their lock times out.
+                log.exception("Running jobs failed.")
+                db.session.rollback()
+                db.session.remove()
+                ran = 0
+            if not ran:
+                if burst:
+                    return
+                time.sleep(poll_interval)
+
+
+def _run_eager(jobs):
+    # The committed session can emit no more SQL, so the tasks run on
+    # a thread of their own, with its own session, and are waited for.
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            for task, kwargs in jobs:
+                try:
+                    task(**kwargs)
+                except Exception:
+                    log.exception("Job %s failed.", task.__name__)
+                    db.session.rollback()
+            db.session.remove()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    jobs = session.info.pop('eager_jobs', None)
+    if jobs:
+        _run_eager(jobs)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _after_soft_rollback(session, previous_transaction):
+    session.info.pop('eager_jobs', None)
+
+
+job_queue = JobQueue()
@@ -1,19 +1,14 @@
-from andromeda import db, login_manager, bcrypt
+from andromeda import db, email_checker, password_hasher
 from flask_login import UserMixin
 from sqlalchemy.ext.hybrid import hybrid_property
-from flask_validator import ValidateEmail, ValidateCountry
-from andromeda.custom_validators import ValidatePhoneNumber
+from flask_validator import ValidateCountry
+from andromeda.custom_validators import ValidatePhoneNumber, ValidateEmail
 from sqlalchemy.sql import func
 
 from datetime import date
 from datetime import datetime
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-
 class User(db.Model, UserMixin):
     __tablename__ = "user"
 
@@ -22,20 +17,26 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(50), unique=True, nullable=False)
     phone_number = db.Column(db.String(30))
+    #   Whether the e-mail domain accepts mail, as last found by the
+    #   andromeda.email_checks checker: deliverable, undeliverable,
+    #   pending (not known yet) or NULL (not checked).
+    email_status = db.Column(db.String(20), index=True)
 
     _password = db.Column(db.String(128), nullable=False)
 
+    #   Not eager: load it with joinedload(User.passport) where it is used.
     passport = db.relationship('Passport',
                                back_populates="user",
                                uselist=False,
-                               lazy=False)
+                               lazy=True)
     employment = db.relationship('Employment',
                                  back_populates="user",
                                  uselist=False,
                                  lazy=True)
+    #   A query, not a list: use andromeda.history for pages of it.
     bookings = db.relationship('Booking',
                                back_populates="user",
-                               lazy=True)
+                               lazy='dynamic')
 
     def __init__(self,
                  username, email,
@@ -56,10 +57,26 @@ class User(db.Model, UserMixin):
 
     @password.setter
     def password(self, password):
-        self._password = bcrypt.generate_password_hash(password)
+        self._password = password_hasher.hash(password)
 
     def verify_password(self, password):
-        return bcrypt.check_password_hash(self._password, password)
+        return password_hasher.check(self._password, password)
+
+    @classmethod
+    def by_email(cls, email):
+        """The user with this e-mail address, whatever its case."""
+        return cls.query.filter(
+            func.lower(cls.email) == func.lower(email)).first()
+
+    def upgrade_password(self, password):
+        """Rehash a verified password if BCRYPT_LOG_ROUNDS has changed.
+
+        Returns True if the hash was replaced and needs committing.
+        """
+        if not password_hasher.needs_rehash(self._password):
+            return False
+        self.password = password
+        return True
 
     @classmethod
     def __declare_last__(cls):
@@ -67,8 +84,8 @@ class User(db.Model, UserMixin):
         # https://flask-validator.readthedocs.io/en/latest/
         # TODO: handle exception properly in admin panel
         ValidateEmail(User.email,
+                      checker=email_checker,
                       allow_smtputf8=True,
-                      check_deliverability=True,
                       throw_exception=True,
                       message="The e-mail is invalid.")
         ValidatePhoneNumber(User.phone_number,
@@ -77,6 +94,11 @@ class User(db.Model, UserMixin):
                             message="Phone number is invalid.")
 
 
+#   E-mail addresses are unique whatever their case, and looked up (by
+#   User.by_email) through this index.
+db.Index('ix_user_email_lower', func.lower(User.email), unique=True)
+
+
 class Company(db.Model):
     __tablename__ = "company"
 
@@ -85,7 +107,11 @@ class Company(db.Model):
     name = db.Column(db.String(150), unique=True, nullable=False)
     email = db.Column(db.String(50), unique=True, nullable=False)
     phone_number = db.Column(db.String(30))
-    ticket_quota = db.Column(db.Integer, default=0)
+    #   NULL: no quota. Zero: no bookings at all.
+    ticket_quota = db.Column(db.Integer)
+    #   Denormalized: bookings issued through the company's employees.
+    #   Maintained by andromeda.bookings so the quota check is one row.
+    tickets_used = db.Column(db.Integer, nullable=False, default=0)
 
     employees = db.relationship('Employment',
                                 back_populates="company",
@@ -96,6 +122,7 @@ class Company(db.Model):
         self.email = email
         self.phone_number = phone_number
         self.ticket_quota = ticket_quota
+        self.tickets_used = 0
 
     def __repr__(self):
         return (f"Company('{self.name}': '{self.email}')")
@@ -103,8 +130,8 @@ class Company(db.Model):
     @classmethod
     def __declare_last__(cls):
         ValidateEmail(Company.email,
+                      checker=email_checker,
                       allow_smtputf8=True,
-                      check_deliverability=True,
                       throw_exception=True,
                       message="The e-mail is invalid.")
         ValidatePhoneNumber(Company.phone_number,
@@ -143,6 +170,9 @@ class Country(db.Model):
 
 class City(db.Model):
     __tablename__ = "city"
+    __table_args__ = (
+        db.Index('ix_city_country_id', 'country_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -168,11 +198,18 @@ class City(db.Model):
         self.country = country
 
     def __repr__(self):
-        return (f"City('{self.name}') in {self.country}")
+        # Imported here: andromeda.refdata needs the models.
+        from andromeda.refdata import refdata
+        country = refdata.country_label(self.country_id) or self.country
+        return (f"City('{self.name}') in {country}")
 
 
 class Passport(db.Model):
     __tablename__ = "passport"
+    __table_args__ = (
+        db.Index('ix_passport_expiration_date', 'expiration_date'),
+        db.Index('ix_passport_country_id', 'country_id'),
+    )
 
     user_id = db.Column(db.Integer,
                         db.ForeignKey('user.id'),
@@ -187,6 +224,10 @@ class Passport(db.Model):
 
     issue_date = db.Column(db.Date, nullable=False)
     expiration_date = db.Column(db.Date, nullable=False)
+    #   For the incremental passport sweep (see andromeda.sweeps).
+    updated_at = db.Column(db.DateTime,
+                           default=datetime.now,
+                           onupdate=datetime.now)
 
     country_id = db.Column(db.Integer,
                            db.ForeignKey('country.id'),
@@ -218,6 +259,16 @@ class Passport(db.Model):
 
 class Flight(db.Model):
     __tablename__ = "flight"
+    __table_args__ = (
+        db.Index('ix_flight_route_departure',
+                 'departure_city_id', 'arrival_city_id', 'departure'),
+        db.Index('ix_flight_arrival', 'arrival'),
+        db.Index('ix_flight_departure', 'departure'),
+        #   Departures are covered by ix_flight_route_departure.
+        db.Index('ix_flight_arrival_city_id', 'arrival_city_id'),
+        db.CheckConstraint('seats_remaining >= 0',
+                           name='ck_flight_seats_remaining'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -241,13 +292,25 @@ class Flight(db.Model):
                                      back_populates="departures",
                                      lazy=True)
 
+    capacity = db.Column(db.Integer, nullable=False, default=180)
+    #   Denormalized: capacity minus bookings. Only ever changed with a
+    #   relative UPDATE (see andromeda.bookings), never read-modify-write.
+    seats_remaining = db.Column(db.Integer, nullable=False)
+    #   Before the rules in fare_rule are applied (see andromeda.fares).
+    base_fare = db.Column(db.Numeric(10, 2), nullable=False, default=100)
+    #   When the departure last changed, for the incremental passport
+    #   sweep (see andromeda.sweeps).
+    rescheduled_at = db.Column(db.DateTime)
+
     bookings = db.relationship('Booking',
                                back_populates="flight",
                                lazy=True)
 
     def __init__(self, name,
                  departure_city, arrival_city,
-                 departure, arrival):
+                 departure, arrival,
+                 capacity=180,
+                 base_fare=100):
         self.name = name
 
         self.departure_city = departure_city
@@ -256,14 +319,28 @@ class Flight(db.Model):
         self.departure = departure
         self.arrival = arrival
 
+        self.capacity = capacity
+        self.seats_remaining = capacity
+        self.base_fare = base_fare
+
     def __repr__(self):
+        # Cities come from the reference data cache, not a query each.
+        from andromeda.refdata import refdata
+        departure_city = refdata.city_label(self.departure_city_id) \
+            or self.departure_city
+        arrival_city = refdata.city_label(self.arrival_city_id) \
+            or self.arrival_city
         return (f"Flight('{self.name}'). "
-                f"Departing from: '{self.departure_city}'. "
-                f"Going to: '{self.arrival_city}'")
+                f"Departing from: '{departure_city}'. "
+                f"Going to: '{arrival_city}'")
 
 
 class Employment(db.Model):
     __tablename__ = "employment"
+    __table_args__ = (
+        db.Index('ix_employment_user_id', 'user_id'),
+        db.Index('ix_employment_company_id', 'company_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -299,6 +376,17 @@ class Employment(db.Model):
 
 class Booking(db.Model):
     __tablename__ = "booking"
+    __table_args__ = (
+        db.Index('ix_booking_cancellation_deadline', 'cancellation_deadline'),
+        #   Booking history pages (see andromeda.history); also the
+        #   index for the user_id foreign key.
+        db.Index('ix_booking_user_date_issued',
+                 'user_id', 'date_issued', 'id'),
+        db.Index('ix_booking_flight_id', 'flight_id'),
+        db.Index('ix_booking_issuing_employment_id',
+                 'issuing_employment_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     flight_id = db.Column(db.Integer,
                           db.ForeignKey('flight.id'),
@@ -325,6 +413,8 @@ class Booking(db.Model):
                                  back_populates="bookings",
                                  lazy=True)
 
+    #   Price paid, as quoted when booked.
+    fare = db.Column(db.Numeric(10, 2))
     cancellation_fee = db.Column(db.Float, default=0)
     cancellation_deadline = db.Column(db.Date, nullable=False)
 
@@ -332,15 +422,237 @@ class Booking(db.Model):
                  user,
                  cancellation_deadline,
                  issuing_employment=None,
-                 date_issued=datetime.now(),
-                 cancellation_fee=0):
+                 date_issued=None,
+                 cancellation_fee=0,
+                 fare=None):
         self.flight = flight
         self.user = user
-        self.issuing_employment = issuing_employment
-        self.date_issued = date_issued
+        self.employment = issuing_employment
+        self.date_issued = date_issued or datetime.now()
         self.cancellation_fee = cancellation_fee
         self.cancellation_deadline = cancellation_deadline
+        self.fare = fare
 
     def __repr__(self):
         return (f"{self.user}, "
                 f"{self.flight}")
+
+
+class FareRule(db.Model):
+    __tablename__ = "fare_rule"
+    __table_args__ = (
+        db.Index('ix_fare_rule_company_id', 'company_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    #   advance_purchase: min_days before departure the booking is made.
+    #   flexibility:      min_days between the cancellation deadline and
+    #                     departure; also sets the cancellation fee.
+    #   contract:         negotiated multiplier for company_id.
+    #   For the first two, the rule with the largest min_days that is
+    #   met applies.
+    kind = db.Column(db.String(30), nullable=False)
+    min_days = db.Column(db.Integer)
+    company_id = db.Column(db.Integer,
+                           db.ForeignKey('company.id'))
+    company = db.relationship('Company', lazy=True)
+
+    fare_multiplier = db.Column(db.Float, nullable=False, default=1)
+    #   Cancellation fee, as a fraction of the fare.
+    fee_rate = db.Column(db.Float, nullable=False, default=0)
+
+    def __init__(self, kind,
+                 min_days=None,
+                 company=None,
+                 fare_multiplier=1,
+                 fee_rate=0):
+        self.kind = kind
+        self.min_days = min_days
+        self.company = company
+        self.fare_multiplier = fare_multiplier
+        self.fee_rate = fee_rate
+
+    def __repr__(self):
+        return (f"FareRule('{self.kind}', {self.min_days} days). "
+                f"Fare x{self.fare_multiplier}, fee {self.fee_rate:.0%}")
+
+
+class Job(db.Model):
+    __tablename__ = "job"
+    #   Workers poll for queued jobs that are due.
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    #   Enqueueing twice with the same key gives back the first job.
+    idempotency_key = db.Column(db.String(200), unique=True)
+
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, name, payload,
+                 idempotency_key=None,
+                 run_at=None,
+                 max_attempts=5):
+        self.name = name
+        self.payload = payload
+        self.idempotency_key = idempotency_key
+        self.status = 'queued'
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.created_at = datetime.now()
+        self.run_at = run_at or self.created_at
+
+    def __repr__(self):
+        return (f"Job('{self.name}', {self.status}). "
+                f"Attempts: {self.attempts}/{self.max_attempts}")
+
+
+class SweepWatermark(db.Model):
+    __tablename__ = "sweep_watermark"
+
+    #   One row per sweep: the time it last ran up to.
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return (f"SweepWatermark('{self.name}': {self.value})")
+
+
+class SweepFinding(db.Model):
+    __tablename__ = "sweep_finding"
+    __table_args__ = (
+        db.UniqueConstraint('sweep', 'booking_id',
+                            name='uq_sweep_finding_booking'),
+        db.Index('ix_sweep_finding_open', 'sweep', 'resolved_at'),
+        db.Index('ix_sweep_finding_booking_id', 'booking_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    sweep = db.Column(db.String(50), nullable=False)
+    booking_id = db.Column(db.Integer,
+                           db.ForeignKey('booking.id', ondelete='CASCADE'),
+                           nullable=False)
+    booking = db.relationship('Booking', lazy=True)
+
+    found_at = db.Column(db.DateTime, nullable=False)
+    resolved_at = db.Column(db.DateTime)
+
+    def __init__(self, sweep, booking, found_at=None):
+        self.sweep = sweep
+        self.booking = booking
+        self.found_at = found_at or datetime.now()
+
+    def __repr__(self):
+        return (f"SweepFinding('{self.sweep}'): {self.booking}")
+
+
+#   Reporting rollups: sums over the bookings, kept up to date as
+#   bookings and flights change (see andromeda.reporting), so reports
+#   never aggregate the booking table.
+class FlightRollup(db.Model):
+    __tablename__ = "flight_rollup"
+
+    flight_id = db.Column(db.Integer,
+                          db.ForeignKey('flight.id', ondelete='CASCADE'),
+                          primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return (f"FlightRollup({self.flight_id}): "
+                f"{self.bookings} bookings, {self.revenue}")
+
+
+class RouteDayRollup(db.Model):
+    __tablename__ = "route_day_rollup"
+    __table_args__ = (
+        db.Index('ix_route_day_rollup_day', 'day'),
+    )
+
+    departure_city_id = db.Column(db.Integer,
+                                  db.ForeignKey('city.id'),
+                                  primary_key=True)
+    arrival_city_id = db.Column(db.Integer,
+                                db.ForeignKey('city.id'),
+                                primary_key=True)
+    #   Day of departure.
+    day = db.Column(db.Date, primary_key=True)
+    flights = db.Column(db.Integer, nullable=False, default=0)
+    seats = db.Column(db.Integer, nullable=False, default=0)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return (f"RouteDayRollup({self.departure_city_id} -> "
+                f"{self.arrival_city_id}, {self.day}): "
+                f"{self.bookings}/{self.seats} seats, {self.revenue}")
+
+
+class CompanyMonthRollup(db.Model):
+    __tablename__ = "company_month_rollup"
+
+    company_id = db.Column(db.Integer,
+                           db.ForeignKey('company.id', ondelete='CASCADE'),
+                           primary_key=True)
+    #   Month the bookings were issued in, as its first day.
+    month = db.Column(db.Date, primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return (f"CompanyMonthRollup({self.company_id}, {self.month}): "
+                f"{self.bookings} bookings, {self.revenue}")
+
+
+class CacheVersion(db.Model):
+    __tablename__ = "cache_version"
+
+    #   One row per in-memory copy of the data that processes keep (see
+    #   andromeda.itineraries): bumped by each transaction that changes
+    #   the data, so that every process can tell its copy is stale.
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, name, version=0):
+        self.name = name
+        self.version = version
+
+    def __repr__(self):
+        return (f"CacheVersion('{self.name}': {self.version})")
+
+
+class CacheChange(db.Model):
+    __tablename__ = "cache_change"
+    __table_args__ = (
+        db.Index('ix_cache_change_name_version', 'name', 'version'),
+    )
+
+    #   What each cache_version bump changed, so that other processes
+    #   can patch their copy instead of rebuilding it: one row per
+    #   changed item. A version with no rows may have changed anything.
+    #   Only the recent versions are kept.
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return (f"CacheChange('{self.name}' {self.version}): "
+                f"{self.item_id}")
@@ -0,0 +1,146 @@
+import hashlib
+import os
+
+from functools import wraps
+
+from flask import Response, current_app, request, session, url_for
+from flask_login import current_user
+from markupsafe import Markup
+
+from andromeda.cache import cache_from_url
+from andromeda.extension import Extension
+
+
+#   Versioned static URLs change whenever the file does, so they can be
+#   cached for as long as browsers allow.
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+class PageCache(Extension):
+    """Whole-response cache for public pages, layout fragment cache and
+    content-hashed static URLs.
+
+    Views decorated with cached() are served from the cache to
+    anonymous GET requests, with an ETag, so browsers revalidate with
+    If-None-Match and get a 304. Pages are not cached for logged-in
+    users, while there are flashed messages, or when rendering them
+    changed the session (a form's CSRF token, for instance).
+    PAGE_CACHE_URL selects a shared backend (redis://...); the default
+    is a per-process cache.
+    """
+
+    name = 'page_cache'
+
+    class State:
+        def __init__(self, enabled=True, url=None, maxsize=1024, ttl=300):
+            self.enabled = enabled
+            self.backend = cache_from_url(url, prefix='andromeda:page:',
+                                          maxsize=maxsize, ttl=ttl)
+            self.static_versions = {}
+
+    def __init__(self, app=None):
+        super().__init__()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_URL', None)
+        app.config.setdefault('PAGE_CACHE_SIZE', 1024)
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        self._bind(app, self.State(enabled=app.config['PAGE_CACHE_ENABLED'],
+                                   url=app.config['PAGE_CACHE_URL'],
+                                   maxsize=app.config['PAGE_CACHE_SIZE'],
+                                   ttl=app.config['PAGE_CACHE_TTL']))
+
+        app.add_template_global(self.fragment, 'cache_fragment')
+        app.add_template_global(self.static_url, 'static_url')
+        app.after_request(self._cache_static)
+
+    def clear(self):
+        self.state.backend.clear()
+
+    def cached(self, ttl=None):
+        """Decorator: cache the view's response for anonymous visitors."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable_request():
+                    return view(*args, **kwargs)
+
+                backend = self.state.backend
+                key = 'view:' + request.full_path
+                entry = backend.get(key)
+                if entry is None:
+                    response = current_app.make_response(
+                        view(*args, **kwargs))
+                    if not self._cacheable_response(response):
+                        return response
+                    body = response.get_data(as_text=True)
+                    entry = {'body': body,
+                             'status': response.status_code,
+                             'mimetype': response.mimetype,
+                             'etag': hashlib.sha1(
+                                 body.encode()).hexdigest()}
+                    backend.set(key, entry, ttl)
+
+                response = Response(entry['body'], status=entry['status'],
+                                    mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                response.cache_control.no_cache = True
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def _cacheable_request(self):
+        return self.state.enabled and \
+            request.method in ('GET', 'HEAD') and \
+            not current_user.is_authenticated and \
+            '_flashes' not in session
+
+    def _cacheable_response(self, response):
+        return response.status_code == 200 and \
+            not response.direct_passthrough and \
+            'Set-Cookie' not in response.headers and \
+            not session.modified
+
+    def fragment(self, *key, caller):
+        """Template global, for parts of a page that only depend on key:
+
+            {% call cache_fragment('nav', current_user.is_authenticated) %}
+        """
+        state = self.state
+        if not state.enabled:
+            return caller()
+        key = 'fragment:' + ':'.join(str(part) for part in key)
+        html = state.backend.get(key)
+        if html is None:
+            html = str(caller())
+            state.backend.set(key, html)
+        return Markup(html)
+
+    def static_version(self, filename):
+        static_versions = self.state.static_versions
+        version = static_versions.get(filename)
+        if version is None or current_app.debug:
+            path = os.path.join(current_app.static_folder, filename)
+            with open(path, 'rb') as f:
+                version = hashlib.sha1(f.read()).hexdigest()[:12]
+            static_versions[filename] = version
+        return version
+
+    def static_url(self, filename):
+        """URL of a static file, versioned by its content."""
+        return url_for('static', filename=filename,
+                       v=self.static_version(filename))
+
+    def _cache_static(self, response):
+        version = request.args.get('v')
+        if request.endpoint == 'static' and version and \
+                response.status_code in (200, 304) and \
+                version == self.static_version(request.view_args['filename']):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
@@ -0,0 +1,36 @@
+import base64
+import json
+
+from datetime import datetime
+
+
+#   Written with strftime rather than isoformat: datetime.fromisoformat
+#   does not exist before Python 3.7, and the %z offset strptime reads
+#   on 3.6 has no colon.
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+#   Keyset (cursor) pagination helpers.
+#   A cursor is the sort key of the last row of a page: the next page
+#   starts strictly after it, so the database seeks straight to it
+#   through an index instead of skipping OFFSET rows.
+def encode_cursor(timestamp, row_id):
+    format = TIMESTAMP_FORMAT + ('%z' if timestamp.tzinfo else '')
+    raw = json.dumps([timestamp.strftime(format), row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the (datetime, id) pair stored in a cursor.
+
+    Raises ValueError if the cursor was not produced by encode_cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        timestamp, row_id = json.loads(raw.decode('utf-8'))
+        # The fraction of a second is always 6 digits: anything after
+        # it is the offset.
+        format = TIMESTAMP_FORMAT + ('%z' if len(timestamp) > 26 else '')
+        return datetime.strptime(timestamp, format), int(row_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor.") from e
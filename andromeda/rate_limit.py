@@ -0,0 +1,108 @@
+import hashlib
+import math
+import threading
+import time
+
+from collections import namedtuple
+
+from andromeda.cache import cache_from_url
+from andromeda.extension import Extension
+
+
+#   burst requests at once, then rate requests per second.
+Limit = namedtuple('Limit', 'rate burst')
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded; retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class RateLimiter(Extension):
+    """Token buckets, one per limit and key (a client address, an
+    account), refused requests costing nothing but a cache lookup.
+
+    A bucket holds up to burst tokens and refills at rate tokens per
+    second; each hit takes one. Buckets are only stored while they
+    are not full, so a key that has been quiet for burst / rate
+    seconds takes no space. RATE_LIMIT_URL selects a shared backend
+    (redis://...), so that limits hold across worker processes; the
+    default is a per-process cache. A shared bucket is read and
+    written in two steps, so processes hitting the same key at the
+    same instant may each take the last token.
+    """
+
+    name = 'rate_limiter'
+
+    class State:
+        def __init__(self, enabled=True, url=None, maxsize=100000,
+                     limits=None):
+            self.enabled = enabled
+            self.backend = cache_from_url(url, prefix='andromeda:rate:',
+                                          maxsize=maxsize)
+            self.limits = limits or {}
+            self.lock = threading.Lock()
+
+    def __init__(self, app=None, timer=time.time):
+        super().__init__()
+        self.timer = timer
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMIT_URL', None)
+        app.config.setdefault('RATE_LIMIT_SIZE', 100000)
+        app.config.setdefault('LOGIN_IP_RATE', 20)
+        app.config.setdefault('LOGIN_IP_BURST', 20)
+        app.config.setdefault('LOGIN_ACCOUNT_RATE', 5)
+        app.config.setdefault('LOGIN_ACCOUNT_BURST', 10)
+        #   Rates are configured per minute.
+        limits = {
+            'login_ip': Limit(app.config['LOGIN_IP_RATE'] / 60,
+                              app.config['LOGIN_IP_BURST']),
+            'login_account': Limit(app.config['LOGIN_ACCOUNT_RATE'] / 60,
+                                   app.config['LOGIN_ACCOUNT_BURST']),
+        }
+        self._bind(app, self.State(enabled=app.config['RATE_LIMIT_ENABLED'],
+                                   url=app.config['RATE_LIMIT_URL'],
+                                   maxsize=app.config['RATE_LIMIT_SIZE'],
+                                   limits=limits))
+
+    def hit(self, name, key):
+        """Take a token from the bucket for key under limit name.
+
+        Raises RateLimitExceeded, with the seconds until a token is
+        available, if the bucket is empty.
+        """
+        state = self.state
+        if not state.enabled:
+            return
+        limit = state.limits[name]
+        key = f'{name}:{key}'
+        with state.lock:
+            now = self.timer()
+            tokens, updated = state.backend.get(key, (limit.burst, now))
+            tokens = min(limit.burst,
+                         tokens + (now - updated) * limit.rate)
+            if tokens < 1:
+                raise RateLimitExceeded(
+                    math.ceil((1 - tokens) / limit.rate))
+            tokens -= 1
+            state.backend.set(key, (tokens, now),
+                              ttl=math.ceil((limit.burst - tokens) /
+                                            limit.rate))
+
+    def reset(self, name, key):
+        self.state.backend.delete(f'{name}:{key}')
+
+    def clear(self):
+        self.state.backend.clear()
+
+
+def account_key(email):
+    """Bucket key for the account an e-mail address names, whatever its
+    case. Hashed, so that keys have a fixed length and the shared
+    backend holds no addresses."""
+    return hashlib.sha1(email.strip().lower().encode()).hexdigest()
@@ -0,0 +1,167 @@
+import threading
+import time
+
+from collections import namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+
+from andromeda import db
+from andromeda.extension import Extension
+from andromeda.models import City, Country
+
+
+CountryRecord = namedtuple('CountryRecord', ['id', 'name'])
+CityRecord = namedtuple('CityRecord', ['id', 'name', 'country_id'])
+
+
+class Snapshot:
+    """Every country and city, by id, with the select options built
+    from them. Never changed once built: a reload builds a new one."""
+
+    def __init__(self, countries, cities):
+        self.countries = {country.id: country for country in countries}
+        self.cities = {city.id: city for city in cities}
+        self.country_choices = [
+            (country.id, country.name)
+            for country in sorted(countries, key=lambda c: c.name)]
+        self.city_choices = [
+            (city.id, self.city_label(city.id))
+            for city in sorted(cities, key=lambda c: (c.name, c.id))]
+
+    def country_label(self, country_id):
+        country = self.countries.get(country_id)
+        return None if country is None else f"Country('{country.name}')"
+
+    def city_label(self, city_id):
+        city = self.cities.get(city_id)
+        if city is None:
+            return None
+        return (f"City('{city.name}') in "
+                f"{self.country_label(city.country_id)}")
+
+
+class ReferenceData(Extension):
+    """In-memory copy of the countries and cities, one per app.
+
+    Flight and city names, reprs and the admin selects are served from
+    it without a query. It is loaded on the first request (with
+    REFDATA_PRELOAD) or the first lookup, reloaded after REFDATA_TTL
+    seconds, so that edits made in other processes show up, and
+    dropped as soon as a transaction in this process changes a country
+    or a city.
+    """
+
+    name = 'refdata'
+
+    class State:
+        def __init__(self, ttl=300):
+            self.ttl = ttl
+            self.snapshot = None
+            self.loaded_at = None
+            self.lock = threading.Lock()
+
+    def __init__(self, app=None):
+        super().__init__()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REFDATA_TTL', 300)
+        app.config.setdefault('REFDATA_PRELOAD', True)
+        self._bind(app, self.State(ttl=app.config['REFDATA_TTL']))
+        if app.config['REFDATA_PRELOAD']:
+            app.before_first_request(self.snapshot)
+        app.add_template_global(self.city_name, 'city_name')
+
+    def invalidate(self):
+        state = self.state
+        with state.lock:
+            state.snapshot = None
+
+    def snapshot(self):
+        state = self.state
+        with state.lock:
+            if state.snapshot is not None and \
+                    time.monotonic() - state.loaded_at < state.ttl:
+                return state.snapshot
+        countries = Country.__table__
+        cities = City.__table__
+        snapshot = Snapshot(
+            [CountryRecord(*row) for row in db.session.execute(
+                select([countries.c.id, countries.c.name]))],
+            [CityRecord(*row) for row in db.session.execute(
+                select([cities.c.id, cities.c.name, cities.c.country_id]))])
+        with state.lock:
+            state.snapshot = snapshot
+            state.loaded_at = time.monotonic()
+        return snapshot
+
+    def country(self, country_id):
+        return self._lookup('countries', country_id)
+
+    def city(self, city_id):
+        return self._lookup('cities', city_id)
+
+    def city_name(self, city_id):
+        city = self.city(city_id)
+        return None if city is None else city.name
+
+    def country_label(self, country_id):
+        """repr() of the country, or None if there is no such country."""
+        if self.country(country_id) is None:
+            return None
+        return self.snapshot().country_label(country_id)
+
+    def city_label(self, city_id):
+        """repr() of the city, or None if there is no such city."""
+        if self.city(city_id) is None:
+            return None
+        return self.snapshot().city_label(city_id)
+
+    def _lookup(self, kind, id):
+        if id is None:
+            return None
+        record = getattr(self.snapshot(), kind).get(id)
+        if record is None:
+            # Ids are read from rows whose foreign keys point at existing
+            # countries and cities: a miss means this copy is out of date.
+            self.invalidate()
+            record = getattr(self.snapshot(), kind).get(id)
+        return record
+
+    def country_choices(self):
+        return self.snapshot().country_choices
+
+    def city_choices(self):
+        return self.snapshot().city_choices
+
+
+refdata = ReferenceData()
+
+
+#   Bulk inserts (andromeda.schedule_import) skip these events and mark
+#   the session themselves.
+@event.listens_for(Country, 'after_insert')
+@event.listens_for(Country, 'after_update')
+@event.listens_for(Country, 'after_delete')
+@event.listens_for(City, 'after_insert')
+@event.listens_for(City, 'after_update')
+@event.listens_for(City, 'after_delete')
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['refdata_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed(session):
+    if session.info.pop('refdata_changed', False):
+        refdata.invalidate()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_changed(session, previous_transaction):
+    # The copy may have been loaded from the rolled back changes.
+    if session.info.pop('refdata_changed', False):
+        refdata.invalidate()
@@ -0,0 +1,410 @@
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, event, func, inspect, select
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.orm.util import identity_key
+
+from andromeda import db
+from andromeda.models import Booking, Company, Employment, Flight
+from andromeda.models import CompanyMonthRollup, FlightRollup, RouteDayRollup
+
+
+FlightState = namedtuple('FlightState', ['id', 'departure_city_id',
+                                         'arrival_city_id', 'departure',
+                                         'capacity'])
+BookingState = namedtuple('BookingState', ['flight_id',
+                                           'issuing_employment_id',
+                                           'date_issued', 'fare'])
+
+
+def route_day(flight):
+    return (flight.departure_city_id, flight.arrival_city_id,
+            flight.departure.date())
+
+
+def month_of(moment):
+    return date(moment.year, moment.month, 1)
+
+
+class Deltas:
+    """Changes to the rollup rows, summed by row, so that each row is
+    written once however many bookings changed it."""
+
+    def __init__(self):
+        self.flights = defaultdict(Counter)
+        self.route_days = defaultdict(Counter)
+        self.company_months = defaultdict(Counter)
+        self.removed_flights = set()
+
+    def flight(self, flight, sign=1):
+        if flight.id is not None and sign > 0:
+            # The row is created now, so that bookings only update it.
+            self.flights[flight.id]
+        self.route_days[route_day(flight)].update(
+            flights=sign, seats=sign * (flight.capacity or 0))
+
+    def remove_flight(self, flight):
+        self.flight(flight, -1)
+        self.removed_flights.add(flight.id)
+
+    def booking(self, booking, flight, company_id, sign=1):
+        counts = {'bookings': sign, 'revenue': sign * (booking.fare or 0)}
+        self.flights[booking.flight_id].update(counts)
+        self.route_days[route_day(flight)].update(counts)
+        if company_id is not None:
+            self.company_months[
+                (company_id, month_of(booking.date_issued))].update(counts)
+
+    def move_flight(self, old, new, bookings, revenue):
+        """A flight's bookings move with it to another route or day."""
+        counts = {'bookings': bookings, 'revenue': revenue}
+        self.route_days[route_day(old)].subtract(counts)
+        self.route_days[route_day(new)].update(counts)
+
+    def rows(self):
+        """(table, key columns, rows) for every rollup; each row is a
+        dict of the key and every count, as executemany parameters."""
+        for table, keys, changes in (
+                (FlightRollup.__table__, ['flight_id'],
+                 {(flight_id,): counts
+                  for flight_id, counts in self.flights.items()
+                  if flight_id not in self.removed_flights}),
+                (RouteDayRollup.__table__,
+                 ['departure_city_id', 'arrival_city_id', 'day'],
+                 self.route_days),
+                (CompanyMonthRollup.__table__, ['company_id', 'month'],
+                 self.company_months)):
+            counted = [column.name for column in table.columns
+                       if column.name not in keys]
+            yield table, keys, [
+                dict(zip(keys, key),
+                     **{name: counts.get(name, 0) for name in counted})
+                for key, counts in changes.items()]
+
+    def apply(self, connection):
+        for table, keys, rows in self.rows():
+            for row in rows:
+                key = {name: row.pop(name) for name in keys}
+                increment(connection, table, key,
+                          {name: value for name, value in row.items()
+                           if value})
+        if self.removed_flights:
+            table = FlightRollup.__table__
+            connection.execute(table.delete().where(
+                table.c.flight_id.in_(self.removed_flights)))
+
+
+def increment(connection, table, key, counts):
+    """Add counts to the row of table at key, creating the row if there
+    is none: an upsert on PostgreSQL and MySQL, elsewhere an UPDATE and,
+    if it matched nothing, an INSERT (SQLite has one writer at a time,
+    so no other transaction can insert the row in between). With no
+    counts, the row is only created."""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql.insert(table).values(dict(key, **counts))
+        if counts:
+            insert = insert.on_conflict_do_update(
+                index_elements=list(key),
+                set_={name: table.c[name] + insert.excluded[name]
+                      for name in counts})
+        else:
+            insert = insert.on_conflict_do_nothing()
+        connection.execute(insert)
+    elif dialect == 'mysql':
+        insert = mysql.insert(table).values(dict(key, **counts))
+        if counts:
+            insert = insert.on_duplicate_key_update(
+                {name: table.c[name] + insert.inserted[name]
+                 for name in counts})
+        else:
+            insert = insert.prefix_with('IGNORE')
+        connection.execute(insert)
+    else:
+        where = and_(*(table.c[name] == value
+                       for name, value in key.items()))
+        if counts:
+            updated = connection.execute(table.update().where(where).values(
+                {name: table.c[name] + value
+                 for name, value in counts.items()}))
+            if updated.rowcount:
+                return
+        elif connection.execute(
+                select([func.count()]).select_from(table).where(where)) \
+                .scalar():
+            return
+        connection.execute(table.insert().values(dict(key, **counts)))
+
+
+def flight_state(flight):
+    return FlightState(*(getattr(flight, name)
+                         for name in FlightState._fields))
+
+
+def booking_state(booking):
+    return BookingState(*(getattr(booking, name)
+                          for name in BookingState._fields))
+
+
+def loaded(obj, names):
+    """obj, if it has every attribute in names loaded (so reading them
+    runs no query), otherwise None."""
+    if obj is None or set(names) & inspect(obj).unloaded:
+        return None
+    return obj
+
+
+def related(obj, name, names):
+    """The object at relationship name of obj, if it is loaded, with
+    every attribute in names loaded, otherwise None."""
+    if name in inspect(obj).unloaded:
+        return None
+    return loaded(getattr(obj, name), names)
+
+
+class Changes:
+    """Bookings and flights a flush adds, removes or moves, and what is
+    already loaded about them; turned into Deltas once it has run."""
+
+    def __init__(self):
+        self.bookings = []
+        self.flights = []
+        self.moved_flights = []
+        self.flight_states = {}
+        self.company_ids = {}
+
+    def add_booking(self, booking, sign):
+        self.bookings.append((sign, booking_state(booking)))
+        flight = related(booking, 'flight', FlightState._fields)
+        if flight is not None:
+            self.flight_states[flight.id] = flight_state(flight)
+        employment = related(booking, 'employment',
+                             ['user_id', 'company_id'])
+        if employment is not None:
+            self.company_ids[employment.user_id] = employment.company_id
+
+    def add_flight(self, flight, sign):
+        state = flight_state(flight)
+        self.flights.append((sign, state))
+        self.flight_states[state.id] = state
+
+    def move_flight(self, session, flight):
+        """Record the change if the flight changed route, day or size.
+        Called before the flush, while the database has the old state."""
+        attrs = inspect(flight).attrs
+        if not any(attrs[name].history.has_changes()
+                   for name in FlightState._fields):
+            return
+        table = Flight.__table__
+        old = session.execute(
+            select([table.c[name] for name in FlightState._fields])
+            .where(table.c.id == flight.id)).first()
+        if old is not None:
+            self.moved_flights.append((FlightState(*old),
+                                       flight_state(flight)))
+
+    def deltas(self, session):
+        self._resolve_flight_states(session)
+        self._resolve_company_ids(session)
+        deltas = Deltas()
+        for sign, flight in self.flights:
+            if sign > 0:
+                deltas.flight(flight)
+            else:
+                deltas.remove_flight(flight)
+        if self.moved_flights:
+            self._move_flights(session, deltas)
+        for sign, booking in self.bookings:
+            deltas.booking(booking, self.flight_states[booking.flight_id],
+                           self.company_ids.get(
+                               booking.issuing_employment_id), sign)
+        return deltas
+
+    def _resolve_flight_states(self, session):
+        """Fill in the flights of the bookings, from the identity map if
+        they are loaded there, otherwise in one query."""
+        flight_ids = {booking.flight_id for sign, booking in self.bookings}
+        missing = flight_ids - self.flight_states.keys()
+        for flight_id in list(missing):
+            flight = loaded(session.identity_map.get(
+                identity_key(Flight, flight_id)), FlightState._fields)
+            if flight is not None:
+                self.flight_states[flight_id] = flight_state(flight)
+                missing.discard(flight_id)
+        if missing:
+            table = Flight.__table__
+            self.flight_states.update(
+                (row.id, FlightState(*row)) for row in session.execute(
+                    select([table.c[name] for name in FlightState._fields])
+                    .where(table.c.id.in_(missing))))
+
+    def _resolve_company_ids(self, session):
+        """Fill in the companies of the bookings' issuing employments."""
+        employment_ids = {booking.issuing_employment_id
+                          for sign, booking in self.bookings} \
+            - self.company_ids.keys()
+        if employment_ids:
+            table = Employment.__table__
+            self.company_ids.update(
+                (row.user_id, row.company_id) for row in session.execute(
+                    select([table.c.user_id, table.c.company_id])
+                    .where(table.c.user_id.in_(employment_ids))))
+
+    def _move_flights(self, session, deltas):
+        """Move the moved flights, and their bookings' totals if they
+        changed route or day, from their old rollup rows to the new."""
+        table = FlightRollup.__table__
+        totals = dict((row.flight_id, row) for row in session.execute(
+            select([table.c.flight_id, table.c.bookings, table.c.revenue])
+            .where(table.c.flight_id.in_(
+                old.id for old, new in self.moved_flights))))
+        for old, new in self.moved_flights:
+            deltas.flight(old, -1)
+            deltas.flight(new)
+            total = totals.get(old.id)
+            if total is not None and route_day(old) != route_day(new):
+                deltas.move_flight(old, new, total.bookings, total.revenue)
+
+
+#   The rollups are written by the flush that changes the bookings, in
+#   the same transaction, so they commit or roll back with them.
+#   Removed rows are read before the flush, while they can still be
+#   loaded; everything else after it, once new rows have their ids.
+@event.listens_for(db.session, 'before_flush')
+def _collect_removed(session, flush_context, instances):
+    changes = Changes()
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            changes.add_booking(obj, -1)
+        elif isinstance(obj, Flight):
+            changes.add_flight(obj, -1)
+    for obj in session.dirty:
+        if isinstance(obj, Flight):
+            changes.move_flight(session, obj)
+    session.info['rollup_changes'] = changes
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_rollups(session, flush_context):
+    changes = session.info.pop('rollup_changes', None) or Changes()
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            changes.add_booking(obj, 1)
+        elif isinstance(obj, Flight):
+            changes.add_flight(obj, 1)
+    if changes.bookings or changes.flights or changes.moved_flights:
+        changes.deltas(session).apply(session.connection())
+
+
+def record_flights(rows):
+    """Count flights inserted without the ORM (as dicts of column
+    values) in the rollups. Their flight rows are created with their
+    first booking."""
+    deltas = Deltas()
+    for row in rows:
+        deltas.flight(FlightState(
+            None, row['departure_city_id'], row['arrival_city_id'],
+            row['departure'], row['capacity']))
+    deltas.apply(db.session.connection())
+
+
+def rebuild_rollups(chunk_size=10000):
+    """Recompute every rollup from the flights and bookings, and commit.
+
+    The rollups are maintained incrementally; this is the repair path,
+    and fills them after bulk loads. Bookings are streamed and summed
+    in memory, by row of the rollups.
+    """
+    deltas = Deltas()
+    flights = {}
+    table = Flight.__table__
+    for row in db.session.execute(
+            select([table.c[name] for name in FlightState._fields])):
+        flights[row.id] = state = FlightState(*row)
+        deltas.flight(state)
+
+    booking, employment = Booking.__table__, Employment.__table__
+    rows = db.session.execute(
+        select([booking.c[name] for name in BookingState._fields] +
+               [employment.c.company_id])
+        .select_from(booking.outerjoin(
+            employment,
+            employment.c.user_id == booking.c.issuing_employment_id))
+        .execution_options(stream_results=True))
+    while True:
+        chunk = rows.fetchmany(chunk_size)
+        if not chunk:
+            break
+        for row in chunk:
+            deltas.booking(BookingState(*row[:-1]), flights[row.flight_id],
+                           row.company_id)
+
+    counts = {}
+    for table, keys, rows in deltas.rows():
+        db.session.execute(table.delete())
+        for start in range(0, len(rows), chunk_size):
+            db.session.execute(table.insert(),
+                               rows[start:start + chunk_size])
+        counts[table.name] = len(rows)
+    db.session.commit()
+    return counts
+
+
+#   Reports: these read the rollups only, never the bookings.
+def route_load_factors(start, end, limit=50):
+    """Routes by load factor (bookings per seat) over departures from
+    start to end, inclusive."""
+    table = RouteDayRollup.__table__
+    seats = func.sum(table.c.seats)
+    bookings = func.sum(table.c.bookings)
+    return db.session.execute(
+        select([table.c.departure_city_id, table.c.arrival_city_id,
+                func.sum(table.c.flights).label('flights'),
+                seats.label('seats'), bookings.label('bookings'),
+                func.sum(table.c.revenue).label('revenue')])
+        .where(table.c.day.between(start, end))
+        .group_by(table.c.departure_city_id, table.c.arrival_city_id)
+        .having(seats > 0)
+        .order_by((bookings * 1.0 / seats).desc(), bookings.desc())
+        .limit(limit)).fetchall()
+
+
+def bookings_per_day(start, end):
+    table = RouteDayRollup.__table__
+    return db.session.execute(
+        select([table.c.day,
+                func.sum(table.c.flights).label('flights'),
+                func.sum(table.c.seats).label('seats'),
+                func.sum(table.c.bookings).label('bookings'),
+                func.sum(table.c.revenue).label('revenue')])
+        .where(table.c.day.between(start, end))
+        .group_by(table.c.day)
+        .order_by(table.c.day)).fetchall()
+
+
+def company_months(start, end):
+    """Bookings issued through each company, per month, from the month
+    of start to the month of end."""
+    table, company = CompanyMonthRollup.__table__, Company.__table__
+    return db.session.execute(
+        select([company.c.name, table.c.month, table.c.bookings,
+                table.c.revenue])
+        .select_from(table.join(company, company.c.id == table.c.company_id))
+        .where(table.c.month.between(month_of(start), month_of(end)))
+        .order_by(table.c.month.desc(), table.c.revenue.desc())).fetchall()
+
+
+def top_flights(start, end, limit=20):
+    """Flights departing from start to end (dates), by revenue."""
+    table, flight = FlightRollup.__table__, Flight.__table__
+    return db.session.execute(
+        select([flight.c.id, flight.c.name, flight.c.departure_city_id,
+                flight.c.arrival_city_id, flight.c.departure,
+                flight.c.capacity, table.c.bookings, table.c.revenue])
+        .select_from(table.join(flight, flight.c.id == table.c.flight_id))
+        .where(and_(flight.c.departure >= datetime.combine(start, time.min),
+                    flight.c.departure <
+                    datetime.combine(end + timedelta(days=1), time.min)))
+        .order_by(table.c.revenue.desc())
+        .limit(limit)).fetchall()
@@ -1,60 +1,110 @@
+from flask import Blueprint
 from flask import render_template, flash, redirect, url_for, request
-from andromeda import app, db, bcrypt
-from andromeda.forms import RegistrationForm, LoginForm
-from andromeda.models import User
+from flask import jsonify, abort, Response
+from andromeda import db, page_cache, password_hasher, rate_limiter
+from andromeda.forms import RegistrationForm, LoginForm, FlightSearchForm
+from andromeda.forms import ItinerarySearchForm, BookingForm
+from andromeda.forms import UpdateAccountForm
+from andromeda.models import User, Flight
+from andromeda.bookings import book_flight, BookingError
+from andromeda.fares import fare_engine
+from andromeda.search import search_flights, DEFAULT_PAGE_SIZE
+from andromeda.itineraries import DEFAULT_LIMIT, search_itineraries
+from andromeda.history import booking_history
+from andromeda.history import DEFAULT_PAGE_SIZE as HISTORY_PAGE_SIZE
+from andromeda.hashing import HashingBusyError
+from andromeda.rate_limit import RateLimitExceeded, account_key
+from andromeda.jobs import job_queue
+from andromeda.events import event_bus, flight_channel, flight_state
+from andromeda.events import stream
+from andromeda.refdata import refdata
+
+from datetime import timedelta
 
 from flask_login import login_user, current_user, logout_user, login_required
 
 
-@app.route("/")
-@app.route("/home")
+main = Blueprint('main', __name__)
+
+
+@main.app_errorhandler(HashingBusyError)
+def hashing_busy(error):
+    return render_template('busy.html', title='Busy'), 503, \
+        {'Retry-After': '1'}
+
+
+@main.app_errorhandler(RateLimitExceeded)
+def rate_limited(error):
+    return render_template('too_many_requests.html',
+                           title='Too many attempts'), 429, \
+        {'Retry-After': str(error.retry_after)}
+
+
+@main.route("/")
+@main.route("/home")
+@page_cache.cached()
 def home():
     return render_template('home.html', title='Home')
 
 
-@app.route("/about")
+@main.route("/about")
+@page_cache.cached()
 def about():
     return render_template('about.html')
 
 
-@app.route("/register",
+@main.route("/register",
            methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data)\
-                                .decode('utf-8')
+        # The model hashes the password; it must be given the plain one.
         user = User(username=form.username.data,
                     email=form.email.data,
-                    password=hashed_password)
+                    password=form.password.data)
         db.session.add(user)
+        db.session.flush()
+        job_queue.enqueue('send_welcome_email',
+                          idempotency_key=f'welcome:{user.id}',
+                          user_id=user.id)
         db.session.commit()
 
         flash('Account created! You can now log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html',
                            title='Register',
                            form=form)
 
 
-@app.route("/login",
+@main.route("/login",
            methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
+    #   Attempts are limited per client address before the form is even
+    #   read, and per account before any password is hashed: bcrypt is
+    #   what an attacker would make us spend.
+    if request.method == 'POST':
+        rate_limiter.hit('login_ip', request.remote_addr)
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password,
-                                               form.password.data):
+        rate_limiter.hit('login_account', account_key(form.email.data))
+        user = User.by_email(form.email.data)
+        if user is None:
+            verified = password_hasher.check_unknown(form.password.data)
+        else:
+            verified = user.verify_password(form.password.data)
+        if verified:
+            if user.upgrade_password(form.password.data):
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page \
-                else redirect(url_for('home'))
+                else redirect(url_for('main.home'))
         else:
             flash("Login unsuccessful!", 'danger')
 
@@ -63,15 +113,284 @@ def login():
                            form=form)
 
 
-@app.route("/logout",
+@main.route("/logout",
            methods=['GET'])
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
-@app.route("/account")
+@main.route("/account",
+           methods=['GET', 'POST'])
 @login_required
 def account():
+    form = UpdateAccountForm()
+    if form.validate_on_submit():
+        current_user.username = form.username.data
+        current_user.email = form.email.data
+        db.session.commit()
+
+        flash('Your account has been updated!', 'success')
+        return redirect(url_for('main.account'))
+    elif request.method == 'GET':
+        form.username.data = current_user.username
+        form.email.data = current_user.email
+
     return render_template('account.html',
-                           title='Account')
+                           title='Account',
+                           form=form)
+
+
+def wants_json():
+    if request.args.get('format') == 'json':
+        return True
+    best = request.accept_mimetypes.best_match(['text/html',
+                                                'application/json'])
+    return best == 'application/json'
+
+
+def search_city_choices():
+    # API clients send raw city ids: an unknown one finds nothing.
+    return None if wants_json() else refdata.city_choices()
+
+
+def quoting_company_id():
+    # Contract fares apply to employees of the company.
+    if current_user.is_authenticated and current_user.employment:
+        return current_user.employment.company_id
+    return None
+
+
+def money_as_dict(money):
+    return {'amount': str(money.amount), 'currency': money.currency.code}
+
+
+def flight_as_dict(flight, quote):
+    return {
+        'id': flight.id,
+        'name': flight.name,
+        'departure_city': refdata.city_name(flight.departure_city_id),
+        'arrival_city': refdata.city_name(flight.arrival_city_id),
+        'departure': flight.departure.isoformat(),
+        'arrival': flight.arrival.isoformat(),
+        'seats_remaining': flight.seats_remaining,
+        'fare': money_as_dict(quote.fare),
+    }
+
+
+@main.route("/flights/search",
+           methods=['GET'])
+@db.reads_from_replica
+def flight_search():
+    form = FlightSearchForm(cities=search_city_choices(),
+                            formdata=request.args or None)
+    flights, next_cursor = [], None
+
+    if request.args:
+        if not form.validate():
+            if wants_json():
+                return jsonify(errors=form.errors), 400
+        else:
+            try:
+                flights, next_cursor = search_flights(
+                    form.origin.data,
+                    form.destination.data,
+                    form.departure_from.data,
+                    form.departure_to.data,
+                    cursor=form.cursor.data or None,
+                    limit=form.limit.data or DEFAULT_PAGE_SIZE)
+            except ValueError:
+                abort(400)
+
+    quotes = fare_engine.quote_flights(flights,
+                                       company_id=quoting_company_id())
+    if wants_json():
+        return jsonify(flights=[flight_as_dict(f, q)
+                                for f, q in zip(flights, quotes)],
+                       next_cursor=next_cursor)
+
+    next_url = None
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        next_url = url_for('main.flight_search', **args)
+
+    return render_template('flights.html',
+                           title='Search flights',
+                           form=form,
+                           flights=list(zip(flights, quotes)),
+                           next_url=next_url)
+
+
+@main.route("/itineraries/search",
+           methods=['GET'])
+@db.reads_from_replica
+def itinerary_search():
+    form = ItinerarySearchForm(cities=search_city_choices(),
+                               formdata=request.args or None)
+    itineraries = []
+
+    if request.args:
+        if not form.validate():
+            if wants_json():
+                return jsonify(errors=form.errors), 400
+        else:
+            min_layover = form.min_layover.data
+            if min_layover is None:
+                min_layover = form.min_layover.default
+            itineraries = search_itineraries(
+                form.origin.data,
+                form.destination.data,
+                form.departure_from.data,
+                form.departure_to.data,
+                min_layover=timedelta(minutes=min_layover),
+                max_hops=form.max_hops.data or form.max_hops.default,
+                limit=form.limit.data or DEFAULT_LIMIT)
+
+    # Every leg of every itinerary is priced in one batch.
+    legs = {leg.flight_id: leg
+            for itinerary in itineraries
+            for leg in itinerary}
+    fares = {}
+    if legs:
+        base_fares = dict(Flight.query
+                          .with_entities(Flight.id, Flight.base_fare)
+                          .filter(Flight.id.in_(legs)))
+        amounts, fees = fare_engine.quote_arrays(
+            [base_fares[flight_id] for flight_id in legs],
+            [leg.departure for leg in legs.values()],
+            company_id=quoting_company_id())
+        fares = dict(zip(legs, amounts))
+
+    results = [{
+        'departure': itinerary[0].departure.isoformat(),
+        'arrival': itinerary[-1].arrival.isoformat(),
+        'fare': money_as_dict(fare_engine.money(
+            sum(fares[leg.flight_id] for leg in itinerary))),
+        'legs': [{
+            'id': leg.flight_id,
+            'name': leg.name,
+            'departure_city': refdata.city_name(leg.departure_city_id),
+            'arrival_city': refdata.city_name(leg.arrival_city_id),
+            'departure': leg.departure.isoformat(),
+            'arrival': leg.arrival.isoformat(),
+            'fare': money_as_dict(fare_engine.money(fares[leg.flight_id])),
+        } for leg in itinerary],
+    } for itinerary in itineraries]
+
+    if wants_json():
+        return jsonify(itineraries=results)
+
+    return render_template('itineraries.html',
+                           title='Search connections',
+                           form=form,
+                           itineraries=results)
+
+
+@main.route("/flights/<int:flight_id>/events",
+           methods=['GET'])
+def flight_events(flight_id):
+    """Server-sent events: the flight's state now, then after each change
+    to its times or seats."""
+    # Subscribe first, so no change is missed between the two.
+    subscription = event_bus.subscribe(flight_channel(flight_id))
+    flight = Flight.query.get(flight_id)
+    if flight is None:
+        subscription.close()
+        abort(404)
+
+    # The stream outlives the request, and the database session with it.
+    return Response(stream(subscription, flight_state(flight),
+                           keepalive=event_bus.state.keepalive),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
+@main.route("/flights/<int:flight_id>/book",
+           methods=['GET', 'POST'])
+@login_required
+def book(flight_id):
+    flight = Flight.query.get_or_404(flight_id)
+
+    form = BookingForm(departure=flight.departure)
+    if form.validate_on_submit():
+        try:
+            booking = book_flight(flight_id,
+                                  current_user,
+                                  form.cancellation_deadline.data)
+        except BookingError as e:
+            if wants_json():
+                return jsonify(error=str(e)), 409
+            flash(str(e), 'danger')
+        else:
+            if wants_json():
+                return jsonify(id=booking.id,
+                               flight=flight_id,
+                               fare=money_as_dict(
+                                   fare_engine.money(booking.fare)),
+                               cancellation_fee=money_as_dict(
+                                   fare_engine.money(
+                                       booking.cancellation_fee))), 201
+            flash('Your flight is booked!', 'success')
+            return redirect(url_for('main.account'))
+    elif wants_json() and request.method == 'POST':
+        return jsonify(errors=form.errors), 400
+
+    quote = fare_engine.quote_flight(
+        flight,
+        cancellation_deadline=form.cancellation_deadline.data,
+        company_id=quoting_company_id())
+    return render_template('book.html',
+                           title='Book',
+                           form=form,
+                           flight=flight,
+                           quote=quote)
+
+
+def booking_as_dict(row):
+    return {
+        'id': row.id,
+        'date_issued': row.date_issued.isoformat(),
+        'cancellation_deadline': row.cancellation_deadline.isoformat(),
+        'fare': money_as_dict(fare_engine.money(row.fare))
+        if row.fare is not None else None,
+        'cancellation_fee': money_as_dict(
+            fare_engine.money(row.cancellation_fee or 0)),
+        'flight': {
+            'id': row.flight_id,
+            'name': row.flight,
+            'departure_city': row.departure_city,
+            'arrival_city': row.arrival_city,
+            'departure': row.departure.isoformat(),
+            'arrival': row.arrival.isoformat(),
+        },
+    }
+
+
+@main.route("/account/bookings",
+           methods=['GET'])
+@login_required
+def account_bookings():
+    try:
+        bookings, next_cursor = booking_history(
+            current_user.id,
+            cursor=request.args.get('cursor') or None,
+            limit=request.args.get('limit', HISTORY_PAGE_SIZE, type=int))
+    except ValueError:
+        abort(400)
+
+    if wants_json():
+        return jsonify(bookings=[booking_as_dict(row) for row in bookings],
+                       next_cursor=next_cursor)
+
+    next_url = None
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        next_url = url_for('main.account_bookings', **args)
+
+    return render_template('account_bookings.html',
+                           title='Your bookings',
+                           bookings=bookings,
+                           next_url=next_url)
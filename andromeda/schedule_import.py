@@ -0,0 +1,262 @@
+import csv
+import itertools
+import json
+import os
+
+from datetime import datetime
+
+from iso3166 import countries
+
+from andromeda import db
+from andromeda.itineraries import bump_version, route_graph
+from andromeda.models import Country, City, Flight
+from andromeda.reporting import record_flights
+
+
+FIELDS = ('name',
+          'departure_city', 'departure_country',
+          'arrival_city', 'arrival_country',
+          'departure', 'arrival')
+DEFAULT_CAPACITY = 180
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+#   Errors kept for the report; the rest are only counted.
+MAX_ERRORS = 100
+
+
+class ScheduleError(Exception):
+    pass
+
+
+class InvalidRow:
+    """Stands in for a line of the file that could not be read, so that
+    it is reported as an error of that row."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def read_schedule(path):
+    """Yield one dict per flight from a CSV or JSON Lines file, lazily.
+
+    A .json file would have to be read whole to be parsed, so schedules
+    in JSON go one object per line, in a .jsonl or .ndjson file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.csv', '.jsonl', '.ndjson'):
+        raise ScheduleError(f"Unsupported schedule format: {path} "
+                            f"(use .csv, or .jsonl with one flight per "
+                            f"line)")
+    with open(path, newline='', encoding='utf-8') as f:
+        if extension == '.csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield InvalidRow(f"invalid JSON: {e}")
+
+
+def parse_datetime(value):
+    """ISO 8601 date and time, to the minute or second, such as
+    2030-01-01T08:00."""
+    value = value.replace('T', ' ', 1)
+    for format in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date and time {value!r}")
+
+
+class ScheduleImporter:
+    """Load a flight schedule in chunks of set-based statements.
+
+    Countries and cities are resolved through name -> id maps held in
+    memory, so each chunk costs a handful of queries: one to find the
+    flights that already exist, one executemany INSERT for the new
+    flights, and inserts for any new countries or cities. Countries are
+    checked against ISO 3166 once per name, not once per row.
+    Each chunk is committed with a checkpoint, so an interrupted load
+    can resume after the last committed row.
+    """
+
+    def __init__(self, chunk_size=5000, checkpoint=None):
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.inserted = 0
+        self.skipped = 0
+        #   The first MAX_ERRORS (row number, message) pairs, and how
+        #   many there were in all.
+        self.errors = []
+        self.error_count = 0
+        self._countries = None
+        self._unknown_countries = set()
+        self._cities = None
+
+    def load_maps(self):
+        self._countries = {name: id for id, name
+                           in db.session.query(Country.id, Country.name)}
+        self._cities = {(country_id, name): id for id, name, country_id
+                        in db.session.query(City.id, City.name,
+                                            City.country_id)}
+
+    def run(self, rows):
+        if self._countries is None:
+            self.load_maps()
+
+        start = self.read_checkpoint()
+        numbered = itertools.islice(enumerate(rows, 1), start, None)
+        while True:
+            chunk = list(itertools.islice(numbered, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+            self.write_checkpoint(chunk[-1][0])
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        # Searches in this process rebuild the graph with the new flights
+        # straight away; other processes see the new version.
+        route_graph.reset()
+        return self
+
+    def error(self, number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((number, message))
+
+    def import_chunk(self, chunk):
+        parsed = []
+        for number, row in chunk:
+            try:
+                parsed.append((number, self.parse(row)))
+            except (KeyError, TypeError, ValueError) as e:
+                self.error(number, str(e))
+
+        self.add_countries({name
+                            for number, row in parsed
+                            for name in (row['departure_country'],
+                                         row['arrival_country'])})
+        valid = []
+        for number, row in parsed:
+            unknown = [name for name in (row['departure_country'],
+                                         row['arrival_country'])
+                       if name not in self._countries]
+            if unknown:
+                self.error(number, f"unknown country {unknown[0]!r}")
+            else:
+                valid.append(row)
+
+        self.add_cities({(self._countries[row[f'{end}_country']],
+                          row[f'{end}_city'])
+                         for row in valid
+                         for end in ('departure', 'arrival')})
+
+        names = {row['name'] for row in valid}
+        existing = {name for name, in db.session.query(Flight.name)
+                    .filter(Flight.name.in_(names))}
+
+        flights, seen = [], set()
+        for row in valid:
+            if row['name'] in existing or row['name'] in seen:
+                self.skipped += 1
+                continue
+            seen.add(row['name'])
+            flights.append({
+                'name': row['name'],
+                'departure_city_id': self.city_id(row, 'departure'),
+                'arrival_city_id': self.city_id(row, 'arrival'),
+                'departure': row['departure'],
+                'arrival': row['arrival'],
+                'capacity': row['capacity'],
+                'seats_remaining': row['capacity'],
+            })
+
+        if flights:
+            db.session.execute(Flight.__table__.insert(), flights)
+            record_flights(flights)
+            bump_version(db.session.connection())
+        db.session.commit()
+        self.inserted += len(flights)
+
+    def parse(self, row):
+        if isinstance(row, InvalidRow):
+            raise ValueError(row.message)
+        if not isinstance(row, dict):
+            raise ValueError("not an object")
+        # JSON values may be numbers: every field is read as text.
+        values = {field: str(row[field]).strip() for field in FIELDS
+                  if row.get(field) is not None}
+        missing = [field for field in FIELDS if not values.get(field)]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+
+        departure = parse_datetime(values['departure'])
+        arrival = parse_datetime(values['arrival'])
+        if arrival <= departure:
+            raise ValueError("arrival is not after departure")
+
+        capacity = int(row.get('capacity') or DEFAULT_CAPACITY)
+        if capacity < 0:
+            raise ValueError("capacity is negative")
+
+        return dict(values,
+                    departure=departure,
+                    arrival=arrival,
+                    capacity=capacity)
+
+    def add_countries(self, names):
+        new = []
+        for name in names - self._countries.keys() - self._unknown_countries:
+            try:
+                countries.get(name)
+            except KeyError:
+                # Remember it so the name is only checked once.
+                self._unknown_countries.add(name)
+                continue
+            new.append(name)
+
+        if new:
+            db.session.execute(Country.__table__.insert(),
+                               [{'name': name} for name in new])
+            db.session.info['refdata_changed'] = True
+            self._countries.update(
+                (name, id) for id, name in
+                db.session.query(Country.id, Country.name)
+                .filter(Country.name.in_(new)))
+
+    def add_cities(self, keys):
+        new = keys - self._cities.keys()
+        if not new:
+            return
+        db.session.execute(City.__table__.insert(),
+                           [{'country_id': country_id, 'name': name}
+                            for country_id, name in new])
+        db.session.info['refdata_changed'] = True
+        country_ids = {country_id for country_id, name in new}
+        self._cities.update(
+            ((country_id, name), id) for id, name, country_id in
+            db.session.query(City.id, City.name, City.country_id)
+            .filter(City.country_id.in_(country_ids),
+                    City.name.in_({name for country_id, name in new})))
+
+    def city_id(self, row, end):
+        country_id = self._countries[row[f'{end}_country']]
+        return self._cities[(country_id, row[f'{end}_city'])]
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            return json.load(f)['rows']
+
+    def write_checkpoint(self, rows):
+        if not self.checkpoint:
+            return
+        temporary = self.checkpoint + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'rows': rows}, f)
+        os.replace(temporary, self.checkpoint)
@@ -0,0 +1,45 @@
+import sqlalchemy as sa
+
+from alembic import op
+
+
+#   Helpers for the revisions in migrations/versions.
+#
+#   Indexes on existing tables are built with create_index_online, so
+#   that rolling out a new index does not block writes:
+#   - PostgreSQL builds it CONCURRENTLY, outside the migration's
+#     transaction (a failed build leaves an INVALID index behind, which
+#     is dropped when the upgrade is run again);
+#   - MySQL (InnoDB) builds secondary indexes online already;
+#   - SQLite has no online build: the database is locked while the
+#     index is written.
+#
+#   Column changes go through op.batch_alter_table, which SQLite, that
+#   cannot ALTER most things, carries out by copying the table, and
+#   other databases as plain ALTER TABLE statements.
+def create_index_online(index_name, table_name, columns, **kw):
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+            op.create_index(index_name, table_name, columns,
+                            postgresql_concurrently=True, **kw)
+    else:
+        op.create_index(index_name, table_name, columns, **kw)
+
+
+def drop_index_online(index_name, table_name):
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+    else:
+        op.drop_index(index_name, table_name=table_name)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Autogenerate filter: leave out indexes on expressions, such as
+    ix_user_email_lower. Not every database reflects them, so each new
+    revision would add them again; write them into revisions by hand."""
+    if type_ == 'index' and not reflected:
+        return all(isinstance(expression, sa.Column)
+                   for expression in object.expressions)
+    return True
@@ -0,0 +1,50 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import and_, or_
+
+from andromeda.models import Flight
+from andromeda.pagination import encode_cursor, decode_cursor
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def search_flights(origin_id, destination_id,
+                   earliest, latest=None,
+                   cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one page of flights on a route, plus the cursor of the next.
+
+    Flights are those leaving origin_id for destination_id on any day
+    between earliest and latest (inclusive), ordered by departure time.
+    The query is answered by the (departure_city_id, arrival_city_id,
+    departure) index, and pages are fetched with keyset pagination so
+    that page N costs the same as page 1. City names come from
+    andromeda.refdata, not a join.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    start = datetime.combine(earliest, time.min)
+    end = datetime.combine(latest or earliest, time.min) + timedelta(days=1)
+
+    query = Flight.query\
+        .filter(Flight.departure_city_id == origin_id,
+                Flight.arrival_city_id == destination_id,
+                Flight.departure >= start,
+                Flight.departure < end)
+
+    if cursor:
+        departure, flight_id = decode_cursor(cursor)
+        query = query.filter(or_(Flight.departure > departure,
+                                 and_(Flight.departure == departure,
+                                      Flight.id > flight_id)))
+
+    flights = query.order_by(Flight.departure, Flight.id)\
+                   .limit(limit + 1)\
+                   .all()
+
+    next_cursor = None
+    if len(flights) > limit:
+        flights = flights[:limit]
+        next_cursor = encode_cursor(flights[-1].departure, flights[-1].id)
+
+    return flights, next_cursor
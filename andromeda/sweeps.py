@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, exists, inspect, literal, or_, select
+
+from andromeda import db
+from andromeda.models import Booking, Flight, Passport
+from andromeda.models import SweepFinding, SweepWatermark
+
+
+PASSPORT_EXPIRY = 'passport_expiry'
+CANCELLATION_DEADLINE = 'cancellation_deadline'
+
+#   Rows changed this long before the last run are examined again, in
+#   case their transaction was still open when it ran. Bookings that
+#   already have a finding are skipped, so this only costs a wider scan.
+OVERLAP = timedelta(minutes=10)
+
+
+def _watermark(name):
+    row = SweepWatermark.query.get(name)
+    return row.value if row is not None else None
+
+
+def _set_watermark(name, value):
+    db.session.merge(SweepWatermark(name, value))
+
+
+def _record(sweep, bookings, now):
+    """Insert a finding for each booking id selected by bookings, in one
+    INSERT ... SELECT, skipping bookings that already have one."""
+    table = SweepFinding.__table__
+    already_found = exists().where(and_(table.c.sweep == sweep,
+                                        table.c.booking_id == Booking.id))
+    rows = bookings.where(~already_found).with_only_columns(
+        [literal(sweep), Booking.id, literal(now)])
+    return db.session.execute(
+        table.insert().from_select(['sweep', 'booking_id', 'found_at'],
+                                   rows)).rowcount
+
+
+def sweep_passport_expiry(now=None, horizon=timedelta(days=30)):
+    """Find bookings on flights departing within horizon whose
+    passenger's passport expires before departure.
+
+    Only bookings issued, passports changed and flights rescheduled
+    since the last run, and flights that entered the horizon, are
+    examined; open findings whose passport has been renewed, or whose
+    flight has left, are resolved. Returns the number of new findings.
+    """
+    now = now or datetime.now()
+    last_run = _watermark(PASSPORT_EXPIRY)
+    end = now + horizon
+
+    changed = Flight.departure > now
+    if last_run is not None:
+        since = last_run - OVERLAP
+        changed = and_(changed,
+                       or_(Flight.departure > last_run + horizon,
+                           Booking.date_issued > since,
+                           Passport.updated_at > since,
+                           Flight.rescheduled_at > since))
+
+    bookings = select([Booking.id]) \
+        .select_from(Booking.__table__
+                     .join(Flight.__table__, Booking.flight_id == Flight.id)
+                     .join(Passport.__table__,
+                           Passport.user_id == Booking.user_id)) \
+        .where(and_(changed,
+                    Flight.departure <= end,
+                    # Redundant with the next condition, but lets the
+                    # passport index narrow the scan.
+                    Passport.expiration_date < end,
+                    Passport.expiration_date < Flight.departure))
+    found = _record(PASSPORT_EXPIRY, bookings, now)
+
+    still_expired = select([Booking.id]) \
+        .select_from(Booking.__table__
+                     .join(Flight.__table__, Booking.flight_id == Flight.id)
+                     .join(Passport.__table__,
+                           Passport.user_id == Booking.user_id)) \
+        .where(and_(Flight.departure > now,
+                    Passport.expiration_date < Flight.departure))
+    SweepFinding.query \
+        .filter(SweepFinding.sweep == PASSPORT_EXPIRY,
+                SweepFinding.resolved_at.is_(None),
+                ~SweepFinding.booking_id.in_(still_expired)) \
+        .update({SweepFinding.resolved_at: now}, synchronize_session=False)
+
+    _set_watermark(PASSPORT_EXPIRY, now)
+    db.session.commit()
+    return found
+
+
+def sweep_cancellation_deadlines(now=None):
+    """Find bookings whose cancellation deadline has passed since the
+    last run, or that were issued since then with a deadline already
+    passed. Returns the number of new findings."""
+    now = now or datetime.now()
+    last_run = _watermark(CANCELLATION_DEADLINE)
+
+    passed = Booking.cancellation_deadline < now.date()
+    if last_run is not None:
+        passed = and_(passed,
+                      or_(Booking.cancellation_deadline >= last_run.date(),
+                          Booking.date_issued > last_run - OVERLAP))
+
+    found = _record(CANCELLATION_DEADLINE,
+                    select([Booking.id]).where(passed), now)
+    _set_watermark(CANCELLATION_DEADLINE, now)
+    db.session.commit()
+    return found
+
+
+@event.listens_for(Flight, 'before_update')
+def _mark_rescheduled(mapper, connection, target):
+    if inspect(target).attrs.departure.history.has_changes():
+        target.rescheduled_at = datetime.now()
+
+
+SWEEPS = {
+    PASSPORT_EXPIRY: sweep_passport_expiry,
+    CANCELLATION_DEADLINE: sweep_cancellation_deadlines,
+}
+
+
+def run_sweep(name, now=None):
+    if name == PASSPORT_EXPIRY:
+        days = current_app.config['SWEEP_PASSPORT_HORIZON_DAYS']
+        return sweep_passport_expiry(now, horizon=timedelta(days=days))
+    return SWEEPS[name](now)
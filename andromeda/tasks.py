@@ -0,0 +1,125 @@
+import logging
+import smtplib
+
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import joinedload
+
+from andromeda import db, email_checker
+from andromeda.email_checks import PENDING, UNDELIVERABLE
+from andromeda.jobs import job_queue
+from andromeda.models import Booking, Flight, User
+from andromeda.sweeps import run_sweep
+
+
+mail_log = logging.getLogger('andromeda.mail')
+
+
+def send_mail(to, subject, body):
+    """Send a plain-text e-mail through MAIL_SERVER, or log it if no
+    server is configured."""
+    config = current_app.config
+    if not config.get('MAIL_SERVER'):
+        mail_log.info("To: %s\nSubject: %s\n\n%s", to, subject, body)
+        return
+
+    message = EmailMessage()
+    message['From'] = config['MAIL_DEFAULT_SENDER']
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+
+    with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'],
+                      timeout=config['MAIL_TIMEOUT']) as smtp:
+        if config['MAIL_USE_TLS']:
+            smtp.starttls()
+        if config.get('MAIL_USERNAME'):
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        smtp.send_message(message)
+
+
+@job_queue.task('send_booking_confirmation')
+def send_booking_confirmation(booking_id):
+    booking = Booking.query.options(
+        joinedload(Booking.user),
+        joinedload(Booking.flight).joinedload(Flight.departure_city),
+        joinedload(Booking.flight).joinedload(Flight.arrival_city),
+    ).get(booking_id)
+    if booking is None:
+        # Cancelled before the job ran.
+        return
+
+    if booking.user.email_status == UNDELIVERABLE:
+        mail_log.warning("Not sending to %s: domain does not accept mail.",
+                         booking.user.email)
+        return
+
+    flight = booking.flight
+    send_mail(booking.user.email,
+              f"Booking confirmed: {flight.name}",
+              f"Hello {booking.user.username},\n\n"
+              f"Your seat on {flight.name} from "
+              f"{flight.departure_city.name} to {flight.arrival_city.name}, "
+              f"departing {flight.departure:%Y-%m-%d %H:%M}, is booked.\n"
+              f"It can be cancelled until "
+              f"{booking.cancellation_deadline:%Y-%m-%d}.\n")
+
+
+@job_queue.task('send_welcome_email')
+def send_welcome_email(user_id):
+    user = User.query.get(user_id)
+    if user is None:
+        return
+
+    # The DNS check runs here, off the request, unless it is disabled.
+    # It also settles a status left pending because the background
+    # lookup finished before the user was committed.
+    if email_checker.state.mode != 'offline':
+        user.email_status = email_checker.resolve(_domain(user.email))
+        db.session.commit()
+    if user.email_status == UNDELIVERABLE:
+        mail_log.warning("Not sending to %s: domain does not accept mail.",
+                         user.email)
+        return
+
+    send_mail(user.email,
+              "Welcome to Andromeda",
+              f"Hello {user.username},\n\n"
+              f"Your account is ready. You can now log in and book "
+              f"flights.\n")
+
+
+def _domain(email):
+    return email.rsplit('@', 1)[-1].lower()
+
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _record_email_status(mapper, connection, target):
+    # The domain was checked when the address was set; in background
+    # mode the result is usually still pending.
+    if inspect(target).attrs.email.history.has_changes():
+        target.email_status = email_checker.status(_domain(target.email))
+
+
+@email_checker.on_resolved
+def _update_pending_users(domain, status):
+    if status == PENDING:
+        return
+    updated = User.query \
+        .filter(User.email_status == PENDING,
+                func.lower(User.email).endswith('@' + domain,
+                                                autoescape=True)) \
+        .update({User.email_status: status}, synchronize_session=False)
+    db.session.commit()
+    db.session.remove()
+    if updated and status == UNDELIVERABLE:
+        mail_log.warning("%d users have addresses at %s, which does not "
+                         "accept mail.", updated, domain)
+
+
+@job_queue.task('run_sweep')
+def run_sweep_job(name):
+    run_sweep(name)
@@ -0,0 +1,182 @@
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Booking
+from andromeda.config import TestConfig
+
+
+COUNTRIES = ["France", "Germany", "Italy", "Spain", "Sweden", "Norway",
+             "Poland", "Greece", "Austria", "Chile", "Peru", "Japan"]
+
+
+class AdminConfig(TestConfig):
+    ENABLE_ADMIN = True
+
+
+class AdminListQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AdminConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.bookings = 0
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def add_bookings(self, n):
+        departure = datetime(2030, 1, 1, 8, 0)
+        for i in range(self.bookings, self.bookings + n):
+            origin = Country(name=COUNTRIES[2 * i])
+            destination = Country(name=COUNTRIES[2 * i + 1])
+            flight = Flight(name=f"AN{i}",
+                            departure_city=City(f"From {i}", origin),
+                            arrival_city=City(f"To {i}", destination),
+                            departure=departure,
+                            arrival=departure + timedelta(hours=2))
+            user = User(username=f"user{i}",
+                        email=f"user{i}@gmail.com",
+                        password="cat")
+            company = Company(name=f"Company {i}",
+                              email=f"company{i}@gmail.com",
+                              phone_number=None,
+                              ticket_quota=None)
+            employment = Employment(user=user, company=company)
+            db.session.add(Booking(flight, user, date(2029, 12, 1),
+                                   issuing_employment=employment))
+        db.session.commit()
+        db.session.remove()
+        self.bookings += n
+
+    def queries_for(self, url):
+        del self.statements[:]
+        response = self.app.test_client().get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(self.statements)
+
+    def assertConstantQueries(self, url):
+        self.add_bookings(2)
+        few = self.queries_for(url)
+        self.add_bookings(4)
+        self.assertEqual(self.queries_for(url), few)
+
+    def test_booking_list(self):
+        self.assertConstantQueries('/admin/booking/')
+
+    def test_booking_cancel_action(self):
+        self.add_bookings(1)
+        booking = Booking.query.one()
+        flight_id = booking.flight_id
+        seats = booking.flight.seats_remaining
+        response = self.app.test_client().post(
+            '/admin/booking/action/',
+            data={'action': 'cancel', 'rowid': str(booking.id)})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.query.count(), 0)
+        self.assertEqual(Flight.query.get(flight_id).seats_remaining,
+                         seats + 1)
+
+        # Rows are not added or deleted around the counters.
+        response = self.app.test_client().get('/admin/booking/new/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_flight_list(self):
+        self.assertConstantQueries('/admin/flight/')
+
+    def test_city_list(self):
+        self.assertConstantQueries('/admin/city/')
+
+    def test_employment_list(self):
+        self.assertConstantQueries('/admin/employment/')
+
+    def test_estimated_count(self):
+        self.add_bookings(3)
+        self.app.config['ADMIN_ESTIMATED_COUNT_THRESHOLD'] = 1
+        self.queries_for('/admin/flight/')
+        self.assertTrue(any('count(' in s.lower() for s in self.statements))
+
+        db.session.execute('ANALYZE')
+        self.queries_for('/admin/flight/')
+        self.assertFalse(any('count(' in s.lower()
+                             for s in self.statements))
+
+        # Searches still count exactly.
+        self.queries_for('/admin/user/?search=user1')
+        self.assertTrue(any('count(' in s.lower() for s in self.statements))
+
+
+class AdminUserFormTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AdminConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        user = User(username="mrh26",
+                    email="justatest@gmail.com",
+                    password="cat")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.hash = user.password
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def edit(self, **data):
+        data = dict({'username': "mrh26",
+                     'email': "justatest@gmail.com",
+                     'phone_number': ""}, **data)
+        response = self.app.test_client().post(
+            f'/admin/user/edit/?id={self.user_id}', data=data)
+        self.assertEqual(response.status_code, 302)
+        db.session.remove()
+        return User.query.get(self.user_id)
+
+    def test_hash_is_not_shown(self):
+        client = self.app.test_client()
+        for url in ['/admin/user/', f'/admin/user/edit/?id={self.user_id}']:
+            page = client.get(url).get_data(as_text=True)
+            self.assertIn("mrh26", page)
+            self.assertNotIn(self.hash, page)
+
+    def test_password_kept_unless_given(self):
+        user = self.edit(username="mrh27")
+        self.assertEqual(user.username, "mrh27")
+        self.assertEqual(user.password, self.hash)
+        self.assertTrue(user.verify_password("cat"))
+
+        user = self.edit(new_password="dog")
+        self.assertFalse(user.verify_password("cat"))
+        self.assertTrue(user.verify_password("dog"))
+
+    def test_new_user_needs_password(self):
+        client = self.app.test_client()
+        data = {'username': "orion", 'email': "orion@gmail.com"}
+        client.post('/admin/user/new/', data=data)
+        self.assertIsNone(User.query.filter_by(username="orion").first())
+
+        client.post('/admin/user/new/', data=dict(data, new_password="owl"))
+        db.session.remove()
+        user = User.query.filter_by(username="orion").one()
+        self.assertTrue(user.verify_password("owl"))
+
+
+if __name__ == "__main__":
+    unittest.main()
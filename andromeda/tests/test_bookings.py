@@ -0,0 +1,171 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Booking
+from andromeda.config import TestConfig
+from andromeda.bookings import book_flight, cancel_booking
+from andromeda.bookings import recount_tickets_used
+from andromeda.bookings import BookingError, FlightFullError
+from andromeda.bookings import QuotaExceededError
+
+
+class BookingTestCase(unittest.TestCase):
+    capacity = 3
+    ticket_quota = 100
+
+    def database_uri(self):
+        return TestConfig.SQLALCHEMY_DATABASE_URI
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = self.database_uri()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        germany = Country(name="Germany")
+        lebanon = Country(name="Lebanon")
+        departure = datetime(2030, 9, 4, 8, 0)
+        self.flight = Flight(name="MEA200",
+                             departure_city=City("Berlin", germany),
+                             arrival_city=City("Beirut", lebanon),
+                             departure=departure,
+                             arrival=departure + timedelta(hours=4),
+                             capacity=self.capacity)
+        db.session.add(self.flight)
+
+        self.user = User(username="mrh26",
+                         email="justatest@gmail.com",
+                         password="1234")
+        self.company = Company(name="Andromeda",
+                               email="company@gmail.com",
+                               phone_number=None,
+                               ticket_quota=self.ticket_quota)
+        db.session.add(Employment(user=self.user, company=self.company))
+        db.session.commit()
+
+        self.flight_id = self.flight.id
+        self.user_id = self.user.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_book_and_cancel(self):
+        booking = book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        self.assertEqual(booking.flight, self.flight)
+        self.assertEqual(booking.employment, self.user.employment)
+        self.assertEqual(self.flight.seats_remaining, self.capacity - 1)
+        self.assertEqual(self.company.tickets_used, 1)
+
+        cancel_booking(booking)
+        self.assertEqual(self.flight.seats_remaining, self.capacity)
+        self.assertEqual(self.company.tickets_used, 0)
+        self.assertEqual(Booking.query.count(), 0)
+
+    def test_quota_exhausted(self):
+        self.company.ticket_quota = 1
+        db.session.commit()
+
+        book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        with self.assertRaises(QuotaExceededError):
+            book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        # The seat claimed before the quota check was rolled back.
+        self.assertEqual(self.flight.seats_remaining, self.capacity - 1)
+        self.assertEqual(self.company.tickets_used, 1)
+
+    def test_no_quota(self):
+        self.company.ticket_quota = None
+        db.session.commit()
+        self.assertIsNone(self.company.ticket_quota)
+
+        book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        self.assertEqual(self.company.tickets_used, 1)
+
+    def test_recount_tickets_used(self):
+        book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        self.company.tickets_used = 7
+        db.session.commit()
+
+        recount_tickets_used()
+        self.assertEqual(self.company.tickets_used, 2)
+
+    def test_sold_out(self):
+        for _ in range(self.capacity):
+            book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        with self.assertRaises(FlightFullError):
+            book_flight(self.flight_id, self.user, date(2030, 9, 1))
+        self.assertEqual(self.flight.seats_remaining, 0)
+        self.assertEqual(Booking.query.count(), self.capacity)
+
+    def test_missing_flight(self):
+        with self.assertRaises(BookingError):
+            book_flight(self.flight_id + 1, self.user, date(2030, 9, 1))
+
+
+class ConcurrentBookingTestCase(BookingTestCase):
+    capacity = 10
+    threads = 40
+
+    def database_uri(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.app.config['SQLITE_BUSY_TIMEOUT'] = 30000
+        return 'sqlite:///' + self.path
+
+    def tearDown(self):
+        super().tearDown()
+        if hasattr(self, 'path'):
+            os.remove(self.path)
+
+    def test_no_oversell_under_contention(self):
+        barrier = threading.Barrier(self.threads)
+        outcomes = []
+
+        def attempt():
+            with self.app.app_context():
+                user = User.query.get(self.user_id)
+                barrier.wait()
+                try:
+                    book_flight(self.flight_id, user, date(2030, 9, 1))
+                    outcomes.append('booked')
+                except FlightFullError:
+                    outcomes.append('full')
+                finally:
+                    db.session.remove()
+
+        workers = [threading.Thread(target=attempt)
+                   for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(outcomes.count('booked'), self.capacity)
+        self.assertEqual(outcomes.count('full'),
+                         self.threads - self.capacity)
+        db.session.expire_all()
+        self.assertEqual(Booking.query.count(), self.capacity)
+        self.assertEqual(Flight.query.get(self.flight_id).seats_remaining, 0)
+        self.assertEqual(Company.query.get(self.company.id).tickets_used,
+                         self.capacity)
+
+
+@unittest.skipUnless(os.environ.get('ANDROMEDA_TEST_POSTGRES_URI'),
+                     "set ANDROMEDA_TEST_POSTGRES_URI to run against "
+                     "a local PostgreSQL server")
+class PostgresConcurrentBookingTestCase(ConcurrentBookingTestCase):
+    def database_uri(self):
+        return os.environ['ANDROMEDA_TEST_POSTGRES_URI']
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+from flask_validator import ValidateError
+
+from andromeda import create_app, db
+from andromeda import User
+from andromeda.config import TestConfig
+from andromeda.custom_validators import normalize_phone_number
+from andromeda.custom_validators import normalize_phone_numbers
+
+
+class AdminConfig(TestConfig):
+    ENABLE_ADMIN = True
+
+
+class PhoneNumberTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = create_app(TestConfig).app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_stored_in_e164(self):
+        user = User(username="mrh26",
+                    email="justatest@gmail.com",
+                    password="cat",
+                    phone_number="+961 70 405 060")
+        self.assertEqual(user.phone_number, "+96170405060")
+
+    def test_unparseable_number_is_invalid(self):
+        self.assertIsNone(normalize_phone_number("not a number"))
+        with self.assertRaises(ValidateError):
+            User(username="mrh26",
+                 email="justatest@gmail.com",
+                 password="cat",
+                 phone_number="not a number")
+
+    def test_results_are_memoized(self):
+        normalize_phone_number.cache_clear()
+        normalize_phone_number("+96170405060")
+        normalize_phone_number("+96170405060")
+        info = normalize_phone_number.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_batch(self):
+        self.assertEqual(normalize_phone_numbers(["+961 70 405 060",
+                                                  "+96170405060",
+                                                  "12",
+                                                  None]),
+                         {"+961 70 405 060": "+96170405060",
+                          "+96170405060": "+96170405060",
+                          "12": None})
+
+
+class PhoneNumberActionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AdminConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        # Rows written before numbers were normalized.
+        db.session.execute(User.__table__.insert(), [
+            {'username': 'a', 'email': 'a@gmail.com', '_password': 'x',
+             'phone_number': '+961 70 405 060'},
+            {'username': 'b', 'email': 'b@gmail.com', '_password': 'x',
+             'phone_number': 'garbage'},
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_normalize_action(self):
+        ids = [str(id) for id, in db.session.query(User.id)]
+        tester = self.app.test_client()
+        response = tester.post('/admin/user/action/',
+                               data={'action': 'normalize_phone_numbers',
+                                     'rowid': ids},
+                               follow_redirects=True)
+        self.assertIn(b'Normalized 1 phone numbers', response.data)
+        self.assertIn(b'1 phone numbers are invalid', response.data)
+
+        db.session.remove()
+        self.assertEqual(sorted(phone for phone, in
+                                db.session.query(User.phone_number)),
+                         ['+96170405060', 'garbage'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import orm
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight
+from andromeda.config import TestConfig
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.paths = []
+        self.app = create_app(TestConfig)
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI=self.temp_database(),
+            SQLALCHEMY_BINDS={'replica_0': self.temp_database()},
+            SQLALCHEMY_REPLICA_BINDS=['replica_0'])
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+        self.replica = db.get_engine(self.app, bind='replica_0')
+        db.create_all()
+        db.Model.metadata.create_all(self.replica)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.Model.metadata.drop_all(self.replica)
+        self.ctx.pop()
+        for path in self.paths:
+            os.remove(path)
+
+    def temp_database(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.paths.append(path)
+        return 'sqlite:///' + path
+
+    def test_sqlite_pragmas(self):
+        connection = db.engine.connect()
+        try:
+            self.assertEqual(
+                connection.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(
+                connection.execute('PRAGMA busy_timeout').scalar(), 5000)
+        finally:
+            connection.close()
+
+    def test_reads_are_routed_to_replica(self):
+        # Only the replica knows this flight.
+        session = orm.Session(bind=self.replica)
+        departure = datetime(2020, 9, 4, 8, 0)
+        flight = Flight(name="MEA200",
+                        departure_city=City("Berlin", Country("Germany")),
+                        arrival_city=City("Beirut", Country("Lebanon")),
+                        departure=departure,
+                        arrival=departure + timedelta(hours=4))
+        session.add(flight)
+        session.commit()
+        route = flight.departure_city_id, flight.arrival_city_id
+        session.close()
+
+        self.assertEqual(Flight.query.count(), 0)
+        with db.replica():
+            self.assertEqual(Flight.query.count(), 1)
+        self.assertEqual(Flight.query.count(), 0)
+
+        tester = self.app.test_client()
+        response = tester.get('/flights/search', query_string={
+            'origin': route[0],
+            'destination': route[1],
+            'departure_from': date(2020, 9, 4).isoformat(),
+            'format': 'json',
+        })
+        self.assertEqual(response.get_json()['flights'][0]['name'],
+                         "MEA200")
+
+    def test_writes_go_to_primary(self):
+        with db.replica():
+            db.session.add(Country("France"))
+            db.session.commit()
+
+        self.assertEqual(Country.query.count(), 1)
+        with db.replica():
+            self.assertEqual(Country.query.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import threading
+import unittest
+
+from andromeda import create_app, db
+from andromeda import User
+from andromeda import email_checker
+from andromeda.cache import TTLCache
+from andromeda.config import Config, TestConfig
+from andromeda.email_checks import DeliverabilityChecker
+from andromeda.email_checks import DELIVERABLE, UNDELIVERABLE, PENDING
+from flask import Flask
+from flask_validator import ValidateError
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResolver:
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def __call__(self, domain):
+        self.calls.append(domain)
+        return self.answers.get(domain)
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_entries_expire(self):
+        timer = FakeTimer()
+        cache = TTLCache(maxsize=10, ttl=60, timer=timer)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=5)
+
+        timer.now = 10
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+        timer.now = 60
+        self.assertIsNone(cache.get('a'))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+
+class DeliverabilityCheckerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.resolver = FakeResolver({'gmail.com': True,
+                                      'nowhere.invalid': False})
+        self.checker = DeliverabilityChecker(resolver=self.resolver)
+        self.checker.state.mode = 'sync'
+
+    def test_background_by_default(self):
+        app = Flask(__name__)
+        checker = DeliverabilityChecker(app, resolver=self.resolver)
+        with app.app_context():
+            self.assertEqual(checker.state.mode, 'background')
+        self.assertEqual(Config.EMAIL_DELIVERABILITY_MODE, 'background')
+
+    def test_results_are_cached(self):
+        self.assertTrue(self.checker.check('gmail.com'))
+        self.assertTrue(self.checker.check('GMAIL.com'))
+        self.assertFalse(self.checker.check('nowhere.invalid'))
+        self.assertFalse(self.checker.check('nowhere.invalid'))
+
+        self.assertEqual(self.resolver.calls, ['gmail.com',
+                                               'nowhere.invalid'])
+        self.assertEqual(self.checker.status('gmail.com'), DELIVERABLE)
+        self.assertEqual(self.checker.status('nowhere.invalid'),
+                         UNDELIVERABLE)
+
+    def test_unanswered_lookup_does_not_block(self):
+        self.assertTrue(self.checker.check('slow.example'))
+        self.assertEqual(self.checker.status('slow.example'), PENDING)
+
+    def test_offline_mode_never_resolves(self):
+        self.checker.state.mode = 'offline'
+        self.assertTrue(self.checker.check('nowhere.invalid'))
+        self.assertEqual(self.resolver.calls, [])
+
+    def test_background_mode_marks_pending(self):
+        released = threading.Event()
+        resolved = threading.Event()
+
+        def slow_resolver(domain):
+            released.wait(5)
+            resolved.set()
+            return False
+
+        self.checker.resolver = slow_resolver
+        self.checker.state.mode = 'background'
+
+        self.assertTrue(self.checker.check('nowhere.invalid'))
+        self.assertEqual(self.checker.status('nowhere.invalid'), PENDING)
+
+        released.set()
+        resolved.wait(5)
+        self.checker.state.executor.shutdown(wait=True)
+        self.assertEqual(self.checker.status('nowhere.invalid'),
+                         UNDELIVERABLE)
+        self.assertFalse(self.checker.check('nowhere.invalid'))
+
+
+class BackgroundConfig(TestConfig):
+    EMAIL_DELIVERABILITY_MODE = 'background'
+
+
+class PendingUserTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(BackgroundConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.released = threading.Event()
+        self.resolver = email_checker.resolver
+
+        def slow_resolver(domain):
+            self.released.wait(5)
+            return domain != 'nowhere.invalid'
+
+        email_checker.resolver = slow_resolver
+
+    def tearDown(self):
+        self.released.set()
+        if email_checker.state.executor is not None:
+            email_checker.state.executor.shutdown(wait=True)
+        email_checker.resolver = self.resolver
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_status_recorded_when_lookup_finishes(self):
+        user = User(username="mrh26", email="mrh26@Nowhere.invalid",
+                    password="cat")
+        other = User(username="ada", email="ada@example.com",
+                     password="cat")
+        db.session.add_all([user, other])
+        db.session.commit()
+        self.assertEqual(user.email_status, PENDING)
+
+        with self.assertLogs('andromeda.mail'):
+            self.released.set()
+            email_checker.state.executor.shutdown(wait=True)
+        db.session.expire_all()
+        self.assertEqual(user.email_status, UNDELIVERABLE)
+        self.assertEqual(other.email_status, DELIVERABLE)
+
+
+class EmailValidatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = create_app(TestConfig).app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_syntax_is_checked_offline(self):
+        self.assertEqual(email_checker.state.mode, 'offline')
+        with self.assertRaises(ValidateError):
+            User(username="Test", email="not-an-email", password='cat')
+
+
+if __name__ == "__main__":
+    unittest.main()
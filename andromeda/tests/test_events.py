@@ -0,0 +1,134 @@
+import json
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda.bookings import book_flight, cancel_booking
+from andromeda.config import TestConfig
+from andromeda.events import BrokerTransport, EventBus, LocalBroker
+from andromeda.events import event_bus, flight_channel
+
+
+class EventBusTestCase(unittest.TestCase):
+    def test_fan_out_to_channel(self):
+        bus = EventBus()
+        first = bus.subscribe('flight:1')
+        second = bus.subscribe('flight:1')
+        other = bus.subscribe('flight:2')
+
+        bus.publish('flight:1', {'id': 1})
+        self.assertEqual(first.get(timeout=0), {'id': 1})
+        self.assertEqual(second.get(timeout=0), {'id': 1})
+        self.assertIsNone(other.get(timeout=0))
+
+        first.close()
+        second.close()
+        self.assertFalse(bus.listening('flight:1'))
+        self.assertTrue(bus.listening('flight:2'))
+
+    def test_slow_listener_keeps_latest(self):
+        bus = EventBus()
+        bus.state.queue_size = 2
+        with bus.subscribe('flight:1') as subscription:
+            for i in range(5):
+                bus.publish('flight:1', {'seats_remaining': i})
+            self.assertEqual(subscription.get(timeout=0),
+                             {'seats_remaining': 3})
+            self.assertEqual(subscription.get(timeout=0),
+                             {'seats_remaining': 4})
+
+    def test_broker_reaches_every_worker(self):
+        broker = LocalBroker()
+        workers = [EventBus(), EventBus()]
+        for bus in workers:
+            bus.set_transport(BrokerTransport(broker))
+        subscriptions = [bus.subscribe('flight:1') for bus in workers]
+
+        workers[0].publish('flight:1', {'id': 1})
+        for subscription in subscriptions:
+            self.assertEqual(subscription.get(timeout=1), {'id': 1})
+
+        for bus in workers:
+            bus.set_transport(None)
+
+
+class FlightEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        germany = Country(name="Germany")
+        departure = datetime(2030, 1, 1, 8, 0)
+        self.flight = Flight(name="AN1",
+                             departure_city=City("Berlin", germany),
+                             arrival_city=City("Munich", germany),
+                             departure=departure,
+                             arrival=departure + timedelta(hours=1),
+                             capacity=1)
+        company = Company(name="Andromeda",
+                          email="company@gmail.com",
+                          phone_number=None,
+                          ticket_quota=10)
+        self.user = User(username="mrh26",
+                         email="justatest@gmail.com",
+                         password="cat")
+        db.session.add_all([self.flight,
+                            Employment(user=self.user, company=company)])
+        db.session.commit()
+        self.flight_id = self.flight.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_booking_publishes_seats(self):
+        with event_bus.subscribe(flight_channel(self.flight_id)) as events:
+            booking = book_flight(self.flight_id, self.user,
+                                  date(2029, 12, 1))
+            state = events.get(timeout=0)
+            self.assertEqual(state['seats_remaining'], 0)
+            self.assertTrue(state['sold_out'])
+
+            cancel_booking(booking)
+            self.assertEqual(events.get(timeout=0)['seats_remaining'], 1)
+
+    def test_schedule_change_publishes_after_commit(self):
+        with event_bus.subscribe(flight_channel(self.flight_id)) as events:
+            self.flight.departure = datetime(2030, 1, 1, 9, 0)
+            db.session.flush()
+            db.session.rollback()
+            self.assertIsNone(events.get(timeout=0))
+
+            self.flight.departure = datetime(2030, 1, 1, 9, 30)
+            db.session.commit()
+            self.assertEqual(events.get(timeout=0)['departure'],
+                             '2030-01-01T09:30:00')
+
+    def test_stream(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/flights/999/events').status_code, 404)
+        self.assertFalse(event_bus.listening(flight_channel(999)))
+
+        response = client.get(f'/flights/{self.flight_id}/events')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 5000\n\n')
+        self.assertIn(b'"seats_remaining": 1', next(chunks))
+
+        book_flight(self.flight_id, self.user, date(2029, 12, 1))
+        event, data = next(chunks).decode().split('\n')[:2]
+        self.assertEqual(event, 'event: flight')
+        self.assertEqual(json.loads(data[len('data: '):])['seats_remaining'],
+                         0)
+
+        response.close()
+        self.assertFalse(event_bus.listening(flight_channel(self.flight_id)))
+
+
+if __name__ == "__main__":
+    unittest.main()
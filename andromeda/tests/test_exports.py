@@ -0,0 +1,130 @@
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Booking, Passport
+from andromeda.config import TestConfig
+from andromeda.exports import company_bookings_query, manifest_query
+from andromeda.exports import csv_chunks, write_parquet
+
+
+class AdminConfig(TestConfig):
+    ENABLE_ADMIN = True
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AdminConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        germany = Country(name="Germany")
+        departure = datetime(2030, 1, 1, 8, 0)
+        flight = Flight(name="AN100",
+                        departure_city=City("Berlin", germany),
+                        arrival_city=City("Munich", germany),
+                        departure=departure,
+                        arrival=departure + timedelta(hours=1))
+        andromeda = Company(name="Andromeda",
+                            email="company@gmail.com",
+                            phone_number=None,
+                            ticket_quota=None)
+        other = Company(name="Other",
+                        email="other@gmail.com",
+                        phone_number=None,
+                        ticket_quota=None)
+
+        for i, company in enumerate([andromeda, andromeda, other]):
+            user = User(username=f"user{i}",
+                        email=f"user{i}@gmail.com",
+                        password="cat")
+            employment = Employment(user=user, company=company)
+            db.session.add(Booking(flight, user, date(2029, 12, 1),
+                                   issuing_employment=employment))
+        db.session.add(Passport(user=user,
+                                first_name="Ada",
+                                last_name="Lovelace",
+                                date_of_birth=date(1990, 1, 1),
+                                country=germany,
+                                issue_date=date(2025, 1, 1),
+                                expiration_date=date(2035, 1, 1)))
+        db.session.commit()
+        self.flight_id = flight.id
+        self.company_id = andromeda.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def read_csv(self, text):
+        return list(csv.DictReader(io.StringIO(text)))
+
+    def test_manifest(self):
+        chunks = list(csv_chunks(manifest_query(self.flight_id),
+                                 chunk_size=2))
+        self.assertEqual(len(chunks), 2)
+
+        rows = self.read_csv(''.join(chunks))
+        self.assertEqual([row['username'] for row in rows],
+                         ['user0', 'user1', 'user2'])
+        self.assertEqual(rows[0]['first_name'], '')
+        self.assertEqual(rows[2]['last_name'], 'Lovelace')
+        self.assertEqual(rows[2]['nationality'], 'Germany')
+
+    def test_company_bookings(self):
+        rows = list(company_bookings_query(self.company_id))
+        self.assertEqual([row.username for row in rows],
+                         ['user0', 'user1'])
+
+    def test_command(self):
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['andromeda', 'export-bookings',
+                                     str(self.company_id)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(self.read_csv(result.output)), 2)
+
+    def test_admin_endpoint(self):
+        response = self.app.test_client().get(
+            f'/admin/exports/manifest?flight_id={self.flight_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(len(self.read_csv(response.get_data(as_text=True))),
+                         3)
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'),
+                         "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'manifest.parquet')
+            write_parquet(manifest_query(self.flight_id), path, chunk_size=2)
+            table = pq.read_table(path)
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column('nationality').to_pylist(),
+                         [None, None, 'Germany'])
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow'),
+                     "pyarrow is installed")
+    def test_parquet_unavailable(self):
+        tester = self.app.test_client()
+        self.assertNotIn(b'Parquet', tester.get('/admin/exports/').data)
+
+        response = tester.get('/admin/exports/manifest?flight_id='
+                              f'{self.flight_id}&format=parquet',
+                              follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'needs the pyarrow package', response.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
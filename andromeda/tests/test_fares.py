@@ -0,0 +1,199 @@
+import unittest
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Booking
+from andromeda.bookings import BookingError, book_flight
+from andromeda.config import TestConfig
+from andromeda.fares import fare_engine
+from andromeda.fares import ADVANCE_PURCHASE, FLEXIBILITY, CONTRACT
+from andromeda.models import FareRule
+
+
+NOW = datetime(2030, 1, 1, 12, 0)
+
+
+class FareEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        germany = Country(name="Germany")
+        self.berlin = City("Berlin", germany)
+        self.munich = City("Munich", germany)
+        self.company = Company(name="Andromeda",
+                               email="company@gmail.com",
+                               phone_number=None,
+                               ticket_quota=10)
+        db.session.add(self.company)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def flight(self, days_ahead, base_fare=100):
+        departure = NOW + timedelta(days=days_ahead)
+        flight = Flight(name=f"AN{days_ahead}",
+                        departure_city=self.berlin,
+                        arrival_city=self.munich,
+                        departure=departure,
+                        arrival=departure + timedelta(hours=1),
+                        base_fare=base_fare)
+        db.session.add(flight)
+        db.session.commit()
+        return flight
+
+    def employee(self):
+        user = User(username="mrh26",
+                    email="justatest@gmail.com",
+                    password="cat")
+        db.session.add(Employment(user=user, company=self.company))
+        db.session.commit()
+        return user
+
+    def book_through_form(self, flight, cancellation_deadline):
+        client = self.app.test_client()
+        client.post('/login', data={'email': 'justatest@gmail.com',
+                                    'password': 'cat'})
+        return client.post(
+            f'/flights/{flight.id}/book',
+            query_string={'format': 'json'},
+            data={'cancellation_deadline': cancellation_deadline.isoformat()})
+
+    def add_rules(self, *rules):
+        db.session.add_all(rules)
+        db.session.commit()
+
+    def fares(self, flights, **kwargs):
+        return [quote.fare.amount for quote in
+                fare_engine.quote_flights(flights, booked_at=NOW, **kwargs)]
+
+    def test_base_fare_without_rules(self):
+        quote = fare_engine.quote_flight(self.flight(10, base_fare=120),
+                                         booked_at=NOW)
+        self.assertEqual(quote.fare.amount, Decimal('120.00'))
+        self.assertEqual(quote.fare.currency.code, 'EUR')
+        self.assertEqual(quote.cancellation_fee.amount, Decimal('0.00'))
+
+    def test_advance_purchase(self):
+        self.add_rules(FareRule(ADVANCE_PURCHASE, 0, fare_multiplier=1.5),
+                       FareRule(ADVANCE_PURCHASE, 14, fare_multiplier=1.0),
+                       FareRule(ADVANCE_PURCHASE, 60, fare_multiplier=0.8))
+        flights = [self.flight(days) for days in (5, 14, 20, 90)]
+        self.assertEqual(self.fares(flights),
+                         [Decimal('150.00'), Decimal('100.00'),
+                          Decimal('100.00'), Decimal('80.00')])
+
+    def test_flexibility_and_cancellation_fee(self):
+        self.add_rules(FareRule(FLEXIBILITY, 0,
+                                fare_multiplier=1.3, fee_rate=0.1),
+                       FareRule(FLEXIBILITY, 7,
+                                fare_multiplier=1.0, fee_rate=0.5))
+        flight = self.flight(30)
+
+        flexible = fare_engine.quote_flight(
+            flight, booked_at=NOW,
+            cancellation_deadline=flight.departure.date() - timedelta(1))
+        self.assertEqual(flexible.fare.amount, Decimal('130.00'))
+        self.assertEqual(flexible.cancellation_fee.amount, Decimal('13.00'))
+
+        cheapest = fare_engine.quote_flight(flight, booked_at=NOW)
+        self.assertEqual(cheapest.fare.amount, Decimal('100.00'))
+        self.assertEqual(cheapest.cancellation_fee.amount, Decimal('50.00'))
+
+    def test_company_contract(self):
+        self.add_rules(FareRule(CONTRACT, company=self.company,
+                                fare_multiplier=0.9))
+        flight = self.flight(10)
+        self.assertEqual(self.fares([flight], company_id=self.company.id),
+                         [Decimal('90.00')])
+        self.assertEqual(self.fares([flight]), [Decimal('100.00')])
+
+    def test_rules_are_cached_until_changed(self):
+        flights = [self.flight(days) for days in range(1, 200)]
+        fare_engine.quote_flights(flights, booked_at=NOW)
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        fare_engine.quote_flights(flights, booked_at=NOW)
+        event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+
+        self.add_rules(FareRule(ADVANCE_PURCHASE, 0, fare_multiplier=2))
+        self.assertEqual(self.fares(flights[:1]), [Decimal('200.00')])
+
+    def test_booking_records_quote(self):
+        self.add_rules(FareRule(FLEXIBILITY, 0,
+                                fare_multiplier=1.2, fee_rate=0.25))
+        flight = self.flight(30)
+        user = self.employee()
+
+        booking = book_flight(flight.id, user, NOW.date())
+        self.assertEqual(booking.fare, Decimal('120.00'))
+        self.assertEqual(booking.cancellation_fee, 30.0)
+
+    def test_deadline_after_departure(self):
+        self.add_rules(FareRule(FLEXIBILITY, 0,
+                                fare_multiplier=1.3, fee_rate=0.1),
+                       FareRule(FLEXIBILITY, 7,
+                                fare_multiplier=1.0, fee_rate=0.5))
+        flight = self.flight(30)
+        late = flight.departure.date() + timedelta(10)
+
+        # Quoted like a deadline on the day of departure.
+        quote = fare_engine.quote_flight(flight, booked_at=NOW,
+                                         cancellation_deadline=late)
+        self.assertEqual(quote.fare.amount, Decimal('130.00'))
+        self.assertEqual(quote.cancellation_fee.amount, Decimal('13.00'))
+
+        user = self.employee()
+        with self.assertRaises(BookingError):
+            book_flight(flight.id, user, late)
+        self.assertEqual(flight.seats_remaining, 180)
+        self.assertEqual(self.company.tickets_used, 0)
+
+        response = self.book_through_form(flight, late)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cancellation_deadline', response.get_json()['errors'])
+        self.assertEqual(Booking.query.count(), 0)
+
+    def test_past_deadline(self):
+        flight = self.flight(30)
+        user = self.employee()
+        yesterday = date.today() - timedelta(1)
+
+        with self.assertRaises(BookingError):
+            book_flight(flight.id, user, yesterday)
+
+        response = self.book_through_form(flight, yesterday)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cancellation_deadline', response.get_json()['errors'])
+        self.assertEqual(Booking.query.count(), 0)
+
+    def test_search_results_are_priced(self):
+        flight = self.flight(10, base_fare=75)
+        response = self.app.test_client().get(
+            '/flights/search', query_string={
+                'origin': self.berlin.id,
+                'destination': self.munich.id,
+                'departure_from': flight.departure.date().isoformat(),
+                'format': 'json'})
+        self.assertEqual(response.get_json()['flights'][0]['fare'],
+                         {'amount': '75.00', 'currency': 'EUR'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import inspect
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight
+from andromeda.config import TestConfig
+from andromeda.pagination import decode_cursor, encode_cursor
+from andromeda.search import search_flights
+
+
+class FlightSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        lebanon = Country(name="Lebanon")
+        germany = Country(name="Germany")
+        self.beirut = City(name="Beirut", country=lebanon)
+        self.berlin = City(name="Berlin", country=germany)
+
+        start = datetime(2020, 9, 4, 6, 0)
+        for i in range(7):
+            departure = start + timedelta(hours=6 * i)
+            db.session.add(Flight(name=f"MEA{i}",
+                                  departure_city=self.berlin,
+                                  arrival_city=self.beirut,
+                                  departure=departure,
+                                  arrival=departure + timedelta(hours=4)))
+        db.session.add(Flight(name="MEA-BACK",
+                              departure_city=self.beirut,
+                              arrival_city=self.berlin,
+                              departure=start,
+                              arrival=start + timedelta(hours=4)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_indexes_are_declared(self):
+        indexes = {i['name']: i['column_names']
+                   for i in inspect(db.engine).get_indexes('flight')}
+        self.assertEqual(indexes['ix_flight_route_departure'],
+                         ['departure_city_id', 'arrival_city_id',
+                          'departure'])
+        self.assertEqual(indexes['ix_flight_arrival'], ['arrival'])
+
+    def test_keyset_pages_cover_window_once(self):
+        seen, cursor = [], None
+        while True:
+            flights, cursor = search_flights(self.berlin.id, self.beirut.id,
+                                             date(2020, 9, 4),
+                                             date(2020, 9, 5),
+                                             cursor=cursor, limit=3)
+            seen.extend(f.name for f in flights)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [f"MEA{i}" for i in range(7)])
+
+    def test_window_is_inclusive_by_day(self):
+        flights, cursor = search_flights(self.berlin.id, self.beirut.id,
+                                         date(2020, 9, 4))
+        self.assertEqual([f.name for f in flights],
+                         ["MEA0", "MEA1", "MEA2"])
+        self.assertIsNone(cursor)
+
+    def test_json_endpoint(self):
+        tester = self.app.test_client()
+        response = tester.get('/flights/search', query_string={
+            'origin': self.beirut.id,
+            'destination': self.berlin.id,
+            'departure_from': '2020-09-04',
+            'format': 'json',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['flights'][0]['name'],
+                         "MEA-BACK")
+        self.assertIsNone(response.get_json()['next_cursor'])
+
+    def test_html_endpoint_and_bad_cursor(self):
+        tester = self.app.test_client()
+        query = {
+            'origin': self.berlin.id,
+            'destination': self.beirut.id,
+            'departure_from': '2020-09-04',
+        }
+        response = tester.get('/flights/search', query_string=query)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'MEA0', response.data)
+
+        query['cursor'] = 'not-a-cursor'
+        response = tester.get('/flights/search', query_string=query)
+        self.assertEqual(response.status_code, 400)
+
+    def test_html_form_selects_cities(self):
+        tester = self.app.test_client()
+        page = tester.get('/flights/search').get_data(as_text=True)
+        self.assertIn('<select', page)
+        self.assertIn(f'<option value="{self.beirut.id}">', page)
+
+        response = tester.get('/flights/search', query_string={
+            'origin': 999,
+            'destination': self.beirut.id,
+            'departure_from': '2020-09-04',
+        })
+        self.assertIn('Not a valid choice', response.get_data(as_text=True))
+
+        response = tester.get('/flights/search', query_string={
+            'origin': 999,
+            'destination': self.beirut.id,
+            'departure_from': '2020-09-04',
+            'format': 'json',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['flights'], [])
+
+
+class CursorTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        for timestamp in (datetime(2030, 1, 1, 8, 0),
+                          datetime(2030, 1, 1, 8, 0, 0, 250,
+                                   tzinfo=timezone(timedelta(hours=2)))):
+            self.assertEqual(decode_cursor(encode_cursor(timestamp, 7)),
+                             (timestamp, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
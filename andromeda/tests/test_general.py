@@ -1,12 +1,25 @@
 # http://www.patricksoftwareblog.com/unit-testing-a-flask-application/
 import os
+import subprocess
+import sys
 import unittest
 
-from andromeda import app
+from andromeda import create_app, email_checker, password_hasher
+from andromeda.config import TestConfig
+
+
+def modules_loaded_by(code, **environ):
+    env = dict(os.environ, **environ)
+    output = subprocess.check_output(
+        [sys.executable, '-c',
+         code + '\nimport sys\nprint(" ".join(sys.modules))'],
+        env=env)
+    return set(output.decode().split())
 
 
 class FlaskTestCase(unittest.TestCase):
     def test_pages_load(self):
+        app = create_app(TestConfig)
         tester = app.test_client(self)
 
         home = tester.get('/', content_type='html/text')
@@ -16,5 +29,43 @@ class FlaskTestCase(unittest.TestCase):
         self.assertEqual(login.status_code, 200)
 
 
+class AppFactoryTestCase(unittest.TestCase):
+    def test_import_does_not_build_app(self):
+        modules = modules_loaded_by('import andromeda')
+        self.assertNotIn('andromeda.routes', modules)
+        self.assertNotIn('flask_admin', modules)
+        self.assertNotIn('numpy', modules)
+
+    def test_admin_is_opt_in(self):
+        code = 'import andromeda; andromeda.create_app()'
+        self.assertNotIn('flask_admin',
+                         modules_loaded_by(code, ENABLE_ADMIN='0'))
+        self.assertIn('flask_admin',
+                      modules_loaded_by(code, ENABLE_ADMIN='1'))
+
+    def test_admin_pages_load(self):
+        class AdminConfig(TestConfig):
+            ENABLE_ADMIN = True
+
+        tester = create_app(AdminConfig).test_client(self)
+        self.assertEqual(tester.get('/admin/').status_code, 200)
+        self.assertEqual(create_app(TestConfig).test_client(self)
+                         .get('/admin/').status_code, 404)
+
+    def test_apps_keep_their_own_settings(self):
+        class OnlineConfig(TestConfig):
+            EMAIL_DELIVERABILITY_MODE = 'sync'
+            BCRYPT_LOG_ROUNDS = 5
+
+        offline = create_app(TestConfig)
+        online = create_app(OnlineConfig)
+        with offline.app_context():
+            self.assertEqual(email_checker.state.mode, 'offline')
+            self.assertEqual(password_hasher.state.rounds, 4)
+        with online.app_context():
+            self.assertEqual(email_checker.state.mode, 'sync')
+            self.assertEqual(password_hasher.state.rounds, 5)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, inspect
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Booking
+from andromeda.config import TestConfig
+from andromeda.history import booking_history
+
+
+class BookingHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        germany = Country(name="Germany")
+        berlin = City(name="Berlin", country=germany)
+        munich = City(name="Munich", country=germany)
+        self.flight = Flight(name="AN1",
+                             departure_city=berlin,
+                             arrival_city=munich,
+                             departure=datetime(2030, 1, 1, 8, 0),
+                             arrival=datetime(2030, 1, 1, 9, 0))
+        company = Company(name="Andromeda",
+                          email="company@gmail.com",
+                          phone_number=None,
+                          ticket_quota=100)
+        self.user = User(username="mrh26",
+                         email="justatest@gmail.com",
+                         password="cat")
+        self.other = User(username="other",
+                          email="other@gmail.com",
+                          password="cat")
+        employment = Employment(user=self.user, company=company)
+        db.session.add_all([self.flight, employment, self.other])
+        db.session.flush()
+
+        #   Two bookings share each timestamp, so ties need the id.
+        issued = datetime(2020, 1, 1, 12, 0)
+        for i in range(7):
+            for user in (self.user, self.other):
+                db.session.add(Booking(self.flight, user, date(2029, 12, 1),
+                                       issuing_employment=employment,
+                                       date_issued=issued + timedelta(
+                                           days=i // 2)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def expected_ids(self):
+        return [booking.id for booking in self.user.bookings.order_by(
+            Booking.date_issued.desc(), Booking.id.desc())]
+
+    def test_index_is_declared(self):
+        indexes = {i['name']: i['column_names']
+                   for i in inspect(db.engine).get_indexes('booking')}
+        self.assertEqual(indexes['ix_booking_user_date_issued'],
+                         ['user_id', 'date_issued', 'id'])
+
+    def test_keyset_pages_cover_history_once(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = booking_history(self.user.id, cursor=cursor,
+                                           limit=3)
+            seen.extend(row.id for row in rows)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, self.expected_ids())
+        self.assertEqual(len(seen), 7)
+
+    def test_page_is_one_query(self):
+        user_id = self.user.id
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        rows, cursor = booking_history(user_id, limit=5)
+        [(row.flight, row.departure_city, row.arrival_city) for row in rows]
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(rows[0].departure_city, "Berlin")
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            booking_history(self.user.id, cursor="nonsense")
+
+    def test_endpoint(self):
+        tester = self.app.test_client()
+        self.assertEqual(tester.get('/account/bookings').status_code, 302)
+
+        tester.post('/login', data={'email': 'justatest@gmail.com',
+                                    'password': 'cat'})
+        page = tester.get('/account/bookings',
+                          query_string={'format': 'json', 'limit': 4})
+        data = page.get_json()
+        self.assertEqual([b['id'] for b in data['bookings']],
+                         self.expected_ids()[:4])
+        self.assertEqual(data['bookings'][0]['flight']['name'], "AN1")
+
+        rest = tester.get('/account/bookings', query_string={
+            'format': 'json', 'cursor': data['next_cursor']}).get_json()
+        self.assertEqual([b['id'] for b in rest['bookings']],
+                         self.expected_ids()[4:])
+        self.assertIsNone(rest['next_cursor'])
+
+        self.assertEqual(tester.get('/account/bookings',
+                                    query_string={'cursor': 'x'})
+                         .status_code, 400)
+        html = tester.get('/account/bookings', query_string={'limit': 4})
+        self.assertIn(b'Munich', html.data)
+        self.assertIn(b'Next', html.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
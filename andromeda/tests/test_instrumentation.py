@@ -0,0 +1,102 @@
+import unittest
+
+from andromeda import create_app, db
+from andromeda import Country, instrumentation
+from andromeda.config import TestConfig
+from andromeda.instrumentation import Histogram
+
+
+class MetricsConfig(TestConfig):
+    METRICS_ENDPOINT = '/metrics'
+    SERVER_TIMING_ENABLED = True
+
+
+class SlowQueryConfig(TestConfig):
+    SLOW_QUERY_THRESHOLD_MS = 0
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(MetricsConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        @self.app.route('/countries')
+        def countries():
+            for name in ('France', 'Germany', 'Italy', 'Spain', 'Sweden',
+                         'Norway', 'Poland', 'Greece', 'Austria', 'Chile'):
+                Country.query.filter_by(name=name).first()
+            return 'ok'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_metrics_endpoint(self):
+        tester = self.app.test_client()
+        response = tester.get('/')
+        self.assertIn('render;dur=', response.headers['Server-Timing'])
+        self.assertIn('queries;desc="10"',
+                      tester.get('/countries').headers['Server-Timing'])
+
+        metrics = tester.get('/metrics').get_data(as_text=True)
+        self.assertIn('andromeda_requests_total{endpoint="main.home",'
+                      'method="GET",status="200"}', metrics)
+        self.assertIn('andromeda_request_component_seconds_count'
+                      '{endpoint="main.home",component="render"}', metrics)
+
+    def test_off_by_default(self):
+        app = create_app(TestConfig)
+        tester = app.test_client()
+        self.assertNotIn('Server-Timing', tester.get('/').headers)
+        self.assertEqual(tester.get('/metrics').status_code, 404)
+
+    def test_failed_statement(self):
+        connection = db.engine.connect()
+        try:
+            with self.assertRaises(Exception):
+                connection.execute('SELECT * FROM no_such_table')
+            self.assertEqual(connection.info['query_started'], [])
+        finally:
+            connection.close()
+
+    def test_n_plus_one_is_logged(self):
+        tester = self.app.test_client()
+        with self.assertLogs('andromeda.slow_requests') as logs:
+            tester.get('/countries')
+        self.assertIn('Possible N+1 on countries: 10 executions',
+                      logs.output[0])
+
+    def test_slow_query_log(self):
+        with create_app(SlowQueryConfig).app_context():
+            db.create_all()
+            with self.assertLogs('andromeda.slow_queries') as logs:
+                Country.query.filter_by(name='Secretland').all()
+            db.drop_all()
+        self.assertIn('FROM country', logs.output[0])
+        self.assertNotIn('Secretland', logs.output[0])
+        self.assertIn('andromeda_db_slow_queries_total',
+                      instrumentation.expose())
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_exposition(self):
+        histogram = Histogram('latency', "Latency.", ('path',),
+                              buckets=(0.1, 1))
+        histogram.observe(0.05, path='/')
+        histogram.observe(0.5, path='/')
+        self.assertEqual(list(histogram.expose()), [
+            '# HELP latency Latency.',
+            '# TYPE latency histogram',
+            'latency_bucket{path="/",le="0.1"} 1',
+            'latency_bucket{path="/",le="1"} 2',
+            'latency_bucket{path="/",le="+Inf"} 2',
+            'latency_sum{path="/"} 0.55',
+            'latency_count{path="/"} 2',
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
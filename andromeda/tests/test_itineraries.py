@@ -0,0 +1,275 @@
+import threading
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight
+from andromeda.config import TestConfig
+from andromeda.itineraries import RouteGraph, current_version, route_graph
+from andromeda.itineraries import MAX_WINDOW_DAYS, bump_version
+
+
+class CountingGraph(RouteGraph):
+    loads = 0
+
+    def load(self):
+        self.loads += 1
+        super().load()
+
+
+class ItineraryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.berlin = City(name="Berlin", country=Country(name="Germany"))
+        self.paris = City(name="Paris", country=Country(name="France"))
+        self.beirut = City(name="Beirut", country=Country(name="Lebanon"))
+
+        self.add_flight("AF1", self.berlin, self.paris,
+                        datetime(2020, 9, 4, 8, 0), timedelta(hours=2))
+        # Leaves 30 minutes after AF1 lands: too tight to connect.
+        self.add_flight("MEA1", self.paris, self.beirut,
+                        datetime(2020, 9, 4, 10, 30), timedelta(hours=4))
+        self.add_flight("MEA2", self.paris, self.beirut,
+                        datetime(2020, 9, 4, 13, 0), timedelta(hours=4))
+        db.session.commit()
+
+        self.graph = RouteGraph()
+        self.graph.load()
+
+    def tearDown(self):
+        route_graph.reset()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_flight(self, name, origin, destination, departure, duration):
+        flight = Flight(name=name,
+                        departure_city=origin,
+                        arrival_city=destination,
+                        departure=departure,
+                        arrival=departure + duration)
+        db.session.add(flight)
+        return flight
+
+    def names(self, itineraries):
+        return [[leg.name for leg in itinerary] for itinerary in itineraries]
+
+    def test_connection_respects_minimum_layover(self):
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4))
+        self.assertEqual(self.names(itineraries), [["AF1", "MEA2"]])
+
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4),
+                                        min_layover=timedelta(minutes=15))
+        self.assertEqual(self.names(itineraries), [["AF1", "MEA1"]])
+
+    def test_max_hops(self):
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4), max_hops=1)
+        self.assertEqual(itineraries, [])
+
+    def test_search_does_not_query(self):
+        origin, destination = self.berlin.id, self.beirut.id
+        statements = []
+
+        def count(*args):
+            statements.append(args)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            self.graph.search(origin, destination, date(2020, 9, 4))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+
+    def test_incremental_update(self):
+        direct = self.add_flight("MEA3", self.berlin, self.beirut,
+                                 datetime(2020, 9, 4, 9, 0),
+                                 timedelta(hours=4))
+        db.session.commit()
+        self.graph.upsert(direct)
+
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4))
+        # The direct flight leaves later and lands earlier than AF1+MEA2.
+        self.assertEqual(self.names(itineraries), [["MEA3"]])
+
+        direct.departure = datetime(2020, 9, 4, 7, 0)
+        direct.arrival = datetime(2020, 9, 4, 11, 0)
+        db.session.commit()
+        self.graph.upsert(direct)
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4))
+        self.assertEqual(self.names(itineraries),
+                         [["MEA3"], ["AF1", "MEA2"]])
+
+        self.graph.remove(direct.id)
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4))
+        self.assertEqual(self.names(itineraries), [["AF1", "MEA2"]])
+
+    def test_patches_leave_running_searches_alone(self):
+        before = self.graph._snapshot
+        direct = self.add_flight("MEA3", self.berlin, self.beirut,
+                                 datetime(2020, 9, 4, 9, 0),
+                                 timedelta(hours=4))
+        db.session.commit()
+        self.graph.upsert(direct)
+        self.assertNotIn(direct.id, before.legs)
+        self.assertEqual(len(before.departures[self.berlin.id]), 1)
+
+        # A patch holding the lock does not hold up searches.
+        found = []
+        with self.graph._lock:
+            search = threading.Thread(target=lambda: found.extend(
+                self.graph.search(self.berlin.id, self.beirut.id,
+                                  date(2020, 9, 4))))
+            search.start()
+            search.join(5)
+            self.assertFalse(search.is_alive())
+        self.assertEqual(self.names(found), [["MEA3"]])
+
+    def test_window_and_limit(self):
+        for day in range(1, 6):
+            self.add_flight(f"MEA{10 + day}", self.berlin, self.beirut,
+                            datetime(2020, 9, 4 + day, 9, 0),
+                            timedelta(hours=4))
+        db.session.commit()
+        self.graph.load()
+
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 4), date(2020, 9, 10),
+                                        limit=3)
+        self.assertEqual(self.names(itineraries),
+                         [["AF1", "MEA2"], ["MEA11"], ["MEA12"]])
+
+        with self.assertRaises(ValueError):
+            self.graph.search(self.berlin.id, self.beirut.id,
+                              date(2020, 9, 4),
+                              date(2020, 9, 4) + timedelta(MAX_WINDOW_DAYS))
+
+        response = self.app.test_client().get(
+            '/itineraries/search', query_string={
+                'origin': self.berlin.id,
+                'destination': self.beirut.id,
+                'departure_from': '2020-09-04',
+                'departure_to': '2020-09-11',
+                'format': 'json',
+            })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('departure_to', response.get_json()['errors'])
+
+    def test_later_arrival_can_catch_later_connection(self):
+        rome = City(name="Rome", country=Country(name="Italy"))
+        madrid = City(name="Madrid", country=Country(name="Spain"))
+        day = datetime(2020, 9, 5)
+        hour = timedelta(hours=1)
+        self.add_flight("X1", self.berlin, self.paris, day + 5 * hour, hour)
+        # Reaches Rome at 8:00 directly, or at 13:00 through Madrid.
+        self.add_flight("X2", self.paris, rome, day + 7 * hour, hour)
+        self.add_flight("X3", self.paris, madrid, day + 7 * hour, 2 * hour)
+        self.add_flight("X4", madrid, rome, day + 12 * hour, hour)
+        # More than 10 hours after 8:00.
+        self.add_flight("X5", rome, self.beirut, day + 20 * hour, 2 * hour)
+        db.session.commit()
+        self.graph.load()
+
+        itineraries = self.graph.search(self.berlin.id, self.beirut.id,
+                                        date(2020, 9, 5),
+                                        max_layover=10 * hour, max_hops=4)
+        self.assertEqual(self.names(itineraries),
+                         [["X1", "X3", "X4", "X5"]])
+
+    def test_changes_from_other_processes(self):
+        graph = RouteGraph(check_interval=0)
+        graph.ensure_loaded()
+        flight = self.add_flight("MEA3", self.berlin, self.beirut,
+                                 datetime(2020, 9, 4, 9, 0),
+                                 timedelta(hours=4))
+        db.session.commit()
+
+        # This graph was not told, but the version has moved on.
+        graph.ensure_loaded()
+        itineraries = graph.search(self.berlin.id, self.beirut.id,
+                                   date(2020, 9, 4))
+        self.assertEqual(self.names(itineraries), [["MEA3"]])
+
+        version = current_version()
+        flight.seats_remaining -= 1
+        db.session.commit()
+        self.assertEqual(current_version(), version)
+        flight.arrival += timedelta(hours=1)
+        db.session.commit()
+        self.assertEqual(current_version(), version + 1)
+
+    def test_other_processes_patch_in_changed_flights(self):
+        graph = CountingGraph(check_interval=0)
+        graph.ensure_loaded()
+        flight = self.add_flight("MEA3", self.berlin, self.beirut,
+                                 datetime(2020, 9, 4, 9, 0),
+                                 timedelta(hours=4))
+        db.session.commit()
+        flight.departure = datetime(2020, 9, 4, 7, 0)
+        db.session.commit()
+
+        graph.ensure_loaded()
+        self.assertEqual(graph.loads, 1)
+        self.assertEqual(graph._version, current_version())
+        self.assertEqual(graph._snapshot.legs[flight.id].departure,
+                         datetime(2020, 9, 4, 7, 0))
+
+        db.session.delete(flight)
+        db.session.commit()
+        graph.ensure_loaded()
+        self.assertEqual(graph.loads, 1)
+        self.assertNotIn(flight.id, graph._snapshot.legs)
+
+        # Inserted without naming the flights, as schedule imports do.
+        bump_version(db.session.connection())
+        db.session.commit()
+        graph.ensure_loaded()
+        self.assertEqual(graph.loads, 2)
+
+    def test_commits_patch_this_process(self):
+        route_graph.ensure_loaded()
+        flight = self.add_flight("MEA3", self.berlin, self.beirut,
+                                 datetime(2020, 9, 4, 9, 0),
+                                 timedelta(hours=4))
+        db.session.flush()
+        self.assertNotIn(flight.id, route_graph._snapshot.legs)
+        db.session.commit()
+
+        # Patched with the version its change produced: nothing to load.
+        self.assertEqual(route_graph._version, current_version())
+        itineraries = route_graph.search(self.berlin.id, self.beirut.id,
+                                         date(2020, 9, 4))
+        self.assertEqual(self.names(itineraries), [["MEA3"]])
+
+        flight.arrival += timedelta(hours=1)
+        db.session.rollback()
+        self.assertEqual(route_graph._version, current_version())
+
+    def test_json_endpoint(self):
+        tester = self.app.test_client()
+        response = tester.get('/itineraries/search', query_string={
+            'origin': self.berlin.id,
+            'destination': self.beirut.id,
+            'departure_from': '2020-09-04',
+            'format': 'json',
+        })
+        self.assertEqual(response.status_code, 200)
+        legs = response.get_json()['itineraries'][0]['legs']
+        self.assertEqual([leg['arrival_city'] for leg in legs],
+                         ["Paris", "Beirut"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Job
+from andromeda.bookings import book_flight
+from andromeda.config import TestConfig
+from andromeda.jobs import job_queue, UnknownJobError
+from andromeda.jobs import QUEUED, RUNNING, DONE, FAILED
+
+
+class QueueConfig(TestConfig):
+    JOBS_MODE = 'database'
+    JOBS_RETRY_DELAY = 0
+
+
+calls = []
+
+
+@job_queue.task('test_record')
+def record(value):
+    calls.append(value)
+
+
+@job_queue.task('test_fail')
+def fail():
+    raise RuntimeError("boom")
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(QueueConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        del calls[:]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_enqueue_and_run(self):
+        job_queue.enqueue('test_record', value=1)
+        db.session.commit()
+        self.assertEqual(calls, [])
+
+        self.assertEqual(job_queue.run_pending(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.query.one().status, DONE)
+        self.assertEqual(job_queue.run_pending(), 0)
+
+    def test_rolled_back_with_the_transaction(self):
+        job_queue.enqueue('test_record', value=1)
+        db.session.rollback()
+        self.assertEqual(job_queue.run_pending(), 0)
+
+    def test_idempotency_key(self):
+        first = job_queue.enqueue('test_record', idempotency_key='k', value=1)
+        db.session.commit()
+        again = job_queue.enqueue('test_record', idempotency_key='k', value=2)
+        self.assertIs(again, first)
+        db.session.commit()
+
+        job_queue.run_pending()
+        self.assertEqual(calls, [1])
+
+    def test_unknown_task(self):
+        with self.assertRaises(UnknownJobError):
+            job_queue.enqueue('no_such_task')
+
+    def test_retries_then_fails(self):
+        job_queue.enqueue('test_fail')
+        db.session.commit()
+
+        with self.assertLogs('andromeda.jobs'):
+            for attempt in range(job_queue.state.max_attempts):
+                self.assertEqual(job_queue.run_pending(), 1)
+        job = Job.query.one()
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.attempts, job_queue.state.max_attempts)
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertEqual(job_queue.run_pending(), 0)
+
+    def test_backoff(self):
+        job_queue.state.retry_delay = 60
+        job_queue.enqueue('test_fail')
+        db.session.commit()
+
+        with self.assertLogs('andromeda.jobs'):
+            job_queue.run_pending()
+        job = Job.query.one()
+        self.assertEqual(job.status, QUEUED)
+        self.assertGreater(job.run_at, datetime.now() + timedelta(seconds=50))
+        self.assertEqual(job_queue.run_pending(), 0)
+
+    def test_stale_job_is_reclaimed(self):
+        job = job_queue.enqueue('test_record', value=1)
+        job.status = RUNNING
+        job.locked_at = datetime.now()
+        db.session.commit()
+        self.assertEqual(job_queue.run_pending(), 0)
+
+        job.locked_at = datetime.now() - timedelta(hours=1)
+        db.session.commit()
+        self.assertEqual(job_queue.run_pending(), 1)
+        self.assertEqual(calls, [1])
+
+    def test_booking_confirmation(self):
+        germany = Country(name="Germany")
+        departure = datetime(2030, 1, 1, 8, 0)
+        flight = Flight(name="AN100",
+                        departure_city=City("Berlin", germany),
+                        arrival_city=City("Munich", germany),
+                        departure=departure,
+                        arrival=departure + timedelta(hours=1))
+        user = User(username="mrh26",
+                    email="justatest@gmail.com",
+                    password="cat")
+        company = Company(name="Andromeda",
+                          email="company@gmail.com",
+                          phone_number=None,
+                          ticket_quota=10)
+        db.session.add_all([flight, Employment(user=user, company=company)])
+        db.session.commit()
+
+        book_flight(flight.id, user, date(2029, 12, 1))
+        job = Job.query.one()
+        self.assertEqual(job.name, 'send_booking_confirmation')
+
+        with self.assertLogs('andromeda.mail') as logs:
+            job_queue.run_pending()
+        self.assertIn('Booking confirmed: AN100', logs.output[0])
+
+    def test_registration_queues_welcome_email(self):
+        tester = self.app.test_client()
+        tester.post('/register', data={'username': 'mrh26',
+                                       'email': 'justatest@gmail.com',
+                                       'password': 'cat',
+                                       'confirm_password': 'cat'})
+        self.assertEqual(Job.query.one().name, 'send_welcome_email')
+
+    def test_deleted_job(self):
+        job = job_queue.enqueue('test_fail')
+        db.session.commit()
+        job_id = job.id
+        db.session.delete(job)
+        db.session.commit()
+        with self.assertLogs('andromeda.jobs'):
+            job_queue._failed(job_id, RuntimeError("boom"))
+        self.assertFalse(job_queue.run(job_id))
+
+    def test_worker_survives_errors(self):
+        job_queue.enqueue('test_record', value=1)
+        db.session.commit()
+
+        claim = job_queue.claim
+        failures = []
+
+        def flaky_claim(limit):
+            if not failures:
+                failures.append(limit)
+                raise RuntimeError("database went away")
+            return claim(limit)
+
+        job_queue.claim = flaky_claim
+        try:
+            with self.assertLogs('andromeda.jobs'):
+                job_queue.work(poll_interval=0, burst=True)
+            job_queue.work(poll_interval=0, burst=True)
+        finally:
+            del job_queue.claim
+        self.assertEqual(calls, [1])
+
+    def test_worker_command(self):
+        job_queue.enqueue('test_record', value=1)
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(
+            args=['andromeda', 'worker', '--burst'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(calls, [1])
+
+
+class EagerModeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        del calls[:]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_runs_after_commit(self):
+        self.assertIsNone(job_queue.enqueue('test_record', value=1))
+        self.assertEqual(calls, [])
+        db.session.commit()
+        self.assertEqual(calls, [1])
+
+    def test_not_run_when_rolled_back(self):
+        job_queue.enqueue('test_record', value=1)
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(calls, [])
+
+    def test_failure_is_logged(self):
+        job_queue.enqueue('test_fail')
+        with self.assertLogs('andromeda.jobs'):
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
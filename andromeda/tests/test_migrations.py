@@ -0,0 +1,130 @@
+import io
+import unittest
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect
+
+from andromeda import create_app, db
+from andromeda.config import TestConfig
+from andromeda.schema import create_index_online, drop_index_online
+from andromeda.schema import include_object
+
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.execute('DROP TABLE IF EXISTS alembic_version')
+        self.ctx.pop()
+
+    def index_names(self, table):
+        # The inspector leaves out indexes on expressions.
+        return {name for name, in db.engine.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = ?", table)}
+
+    def test_head_matches_models(self):
+        upgrade()
+        with db.engine.connect() as connection:
+            context = MigrationContext.configure(
+                connection, opts={'include_object': include_object})
+            self.assertEqual(compare_metadata(context, db.metadata), [])
+
+    def test_foreign_key_indexes(self):
+        upgrade(revision='0001')
+        self.assertNotIn('ix_booking_flight_id',
+                         {i['name'] for i in
+                          inspect(db.engine).get_indexes('booking')})
+
+        upgrade(revision='0010')
+        indexes = {i['name']: i['column_names']
+                   for i in inspect(db.engine).get_indexes('booking')}
+        self.assertEqual(indexes['ix_booking_flight_id'], ['flight_id'])
+        self.assertNotIn('ix_user_email_lower', self.index_names('user'))
+
+        upgrade()
+        self.assertIn('ix_user_email_lower', self.index_names('user'))
+
+        downgrade(revision='base')
+        self.assertEqual(inspect(db.engine).get_table_names(),
+                         ['alembic_version'])
+
+    def test_counters_backfilled(self):
+        # A database as the old reset.py created it, then stamped.
+        upgrade(revision='0001')
+        for statement in [
+                "INSERT INTO company (id, name, email, ticket_quota) "
+                "VALUES (1, 'Andromeda', 'company@gmail.com', 5)",
+                "INSERT INTO company (id, name, email, ticket_quota) "
+                "VALUES (2, 'Orion', 'orion@gmail.com', 0)",
+                "INSERT INTO user (id, username, email, _password) "
+                "VALUES (1, 'mrh26', 'justatest@gmail.com', 'x')",
+                "INSERT INTO employment (id, user_id, company_id) "
+                "VALUES (1, 1, 1)",
+                "INSERT INTO country (id, name) VALUES (1, 'Germany')",
+                "INSERT INTO city (id, name, country_id) "
+                "VALUES (1, 'Berlin', 1)",
+                "INSERT INTO flight (id, name, arrival, arrival_city_id, "
+                "departure, departure_city_id) VALUES "
+                "(1, 'AN1', '2030-01-01 10:00:00', 1, "
+                "'2030-01-01 08:00:00', 1), "
+                "(2, 'AN2', '2030-01-02 10:00:00', 1, "
+                "'2030-01-02 08:00:00', 1)"]:
+            db.engine.execute(statement)
+        for i in range(3):
+            db.engine.execute(
+                "INSERT INTO booking (flight_id, user_id, "
+                "issuing_employment_id, cancellation_deadline) "
+                "VALUES (1, 1, 1, '2029-12-01')")
+
+        upgrade()
+        self.assertEqual(list(db.engine.execute(
+            "SELECT id, capacity, seats_remaining, base_fare "
+            "FROM flight ORDER BY id")),
+            [(1, 180, 177, 100), (2, 180, 180, 100)])
+        self.assertEqual(list(db.engine.execute(
+            "SELECT ticket_quota, tickets_used FROM company ORDER BY id")),
+            [(5, 3), (None, 0)])
+
+
+class OnlineIndexTestCase(unittest.TestCase):
+    def sql(self, dialect, operation, *args):
+        output = io.StringIO()
+        context = MigrationContext.configure(
+            dialect_name=dialect,
+            opts={'as_sql': True, 'output_buffer': output,
+                  'transactional_ddl': True})
+        with Operations.context(context):
+            with context.begin_transaction():
+                operation(*args)
+        return output.getvalue()
+
+    def test_postgresql_builds_concurrently(self):
+        sql = self.sql('postgresql', create_index_online,
+                       'ix_booking_flight_id', 'booking', ['flight_id'])
+        self.assertIn('CREATE INDEX CONCURRENTLY ix_booking_flight_id',
+                      sql)
+        # Outside the migration's transaction.
+        self.assertLess(sql.index('COMMIT'), sql.index('CONCURRENTLY'))
+
+        sql = self.sql('postgresql', drop_index_online,
+                       'ix_booking_flight_id', 'booking')
+        self.assertIn('DROP INDEX CONCURRENTLY IF EXISTS', sql)
+
+    def test_other_databases_build_plain_index(self):
+        sql = self.sql('sqlite', create_index_online,
+                       'ix_booking_flight_id', 'booking', ['flight_id'])
+        self.assertIn('CREATE INDEX ix_booking_flight_id', sql)
+        self.assertNotIn('CONCURRENTLY', sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
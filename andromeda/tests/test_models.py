@@ -1,13 +1,22 @@
 import unittest
+from andromeda import create_app
 from andromeda import Country, City
 from andromeda import Company
 from andromeda import User, Passport, Employment
 from andromeda import Flight, Booking
+from andromeda.config import TestConfig
 
 from datetime import datetime
 
 
 class TestObjectCreation(unittest.TestCase):
+    def setUp(self):
+        self.ctx = create_app(TestConfig).app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
     def test_booking(self):
         france = Country(name="France")
         germany = Country(name="Germany")
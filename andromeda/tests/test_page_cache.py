@@ -0,0 +1,89 @@
+import unittest
+
+from andromeda import create_app, db, page_cache
+from andromeda import User
+from andromeda.config import TestConfig
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        page_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_public_page_is_cached_with_etag(self):
+        first = self.client.get('/about')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+
+        self.assertIsNotNone(page_cache.state.backend.get('view:/about?'))
+
+        second = self.client.get('/about')
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertEqual(second.headers['ETag'], etag)
+
+        not_modified = self.client.get('/about',
+                                       headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.get_data(), b'')
+
+    def test_logged_in_users_bypass_cache(self):
+        user = User(username="mrh26",
+                    email="justatest@gmail.com",
+                    password="cat")
+        db.session.add(user)
+        db.session.commit()
+
+        anonymous = self.client.get('/').get_data(as_text=True)
+        self.assertIn('Login', anonymous)
+
+        self.client.post('/login', data={'email': 'justatest@gmail.com',
+                                         'password': 'cat'})
+        home = self.client.get('/')
+        self.assertNotIn('ETag', home.headers)
+        self.assertIn('Logout', home.get_data(as_text=True))
+
+    def test_form_pages_are_not_cached(self):
+        class CSRFConfig(TestConfig):
+            WTF_CSRF_ENABLED = True
+
+        client = create_app(CSRFConfig).test_client()
+        self.assertNotIn('ETag', client.get('/login').headers)
+        self.assertNotIn('ETag', client.get('/login').headers)
+
+    def test_header_fragment_is_reused(self):
+        self.client.get('/login')
+        header = page_cache.state.backend.get('fragment:header:False')
+        self.assertIn('navbar', header)
+
+    def test_static_urls_are_versioned(self):
+        page = self.client.get('/about').get_data(as_text=True)
+        with self.app.test_request_context():
+            url = page_cache.static_url('main.css')
+        self.assertIn(url, page)
+        self.assertIn('?v=', url)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+
+        stale = self.client.get('/static/main.css?v=0')
+        self.assertNotIn('immutable', stale.headers.get('Cache-Control', ''))
+
+        revalidated = self.client.get(url, headers={
+            'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+from sqlalchemy.exc import IntegrityError
+
+from andromeda import create_app, db, password_hasher, rate_limiter
+from andromeda.config import TestConfig
+from andromeda.models import User
+from andromeda.rate_limit import RateLimiter, RateLimitExceeded
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.limiter = RateLimiter(timer=lambda: self.now)
+        app = create_app(TestConfig)
+        self.limiter.init_app(app)
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_burst_then_refused_until_refilled(self):
+        # LOGIN_ACCOUNT_BURST is 10, LOGIN_ACCOUNT_RATE 5 a minute.
+        for _ in range(10):
+            self.limiter.hit('login_account', 'a')
+        with self.assertRaises(RateLimitExceeded) as raised:
+            self.limiter.hit('login_account', 'a')
+        self.assertEqual(raised.exception.retry_after, 12)
+
+        # Other keys have their own bucket.
+        self.limiter.hit('login_account', 'b')
+
+        self.now += 12
+        self.limiter.hit('login_account', 'a')
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.hit('login_account', 'a')
+
+    def test_disabled(self):
+        self.limiter.state.enabled = False
+        for _ in range(50):
+            self.limiter.hit('login_account', 'a')
+
+
+class LoginLimitsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        db.session.add(User(username='mrh26', email='JustATest@gmail.com',
+                            password='cat'))
+        db.session.commit()
+
+    def tearDown(self):
+        rate_limiter.clear()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def login(self, email='justatest@gmail.com', password='dog',
+              address='10.0.0.1'):
+        return self.app.test_client().post(
+            '/login', data={'email': email, 'password': password},
+            environ_base={'REMOTE_ADDR': address})
+
+    def test_email_is_matched_whatever_its_case(self):
+        self.assertEqual(self.login(password='cat').status_code, 302)
+
+    def test_email_unique_whatever_its_case(self):
+        response = self.app.test_client().post('/register', data={
+            'username': 'other',
+            'email': 'justatest@GMAIL.com',
+            'password': 'cat',
+            'confirm_password': 'cat',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Account with email already exists!', response.data)
+
+        db.session.add(User(username='other', email='JUSTATEST@gmail.com',
+                            password='cat'))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_limited_per_address(self):
+        for i in range(20):
+            self.login(email=f'nobody{i}@gmail.com')
+        response = self.login(email='someone@gmail.com')
+        self.assertEqual(response.status_code, 429)
+        # 20 a minute: one every 3 seconds.
+        self.assertIn(response.headers['Retry-After'], {'1', '2', '3'})
+
+        self.assertEqual(self.login(address='10.0.0.2').status_code, 200)
+
+    def test_limited_per_account(self):
+        for i in range(10):
+            self.login(address=f'10.0.1.{i}')
+        # Another address, and the address in another case.
+        response = self.login(email='JUSTATEST@gmail.com',
+                              password='cat', address='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+
+    def test_unknown_account_costs_a_hash(self):
+        checked = []
+        check = password_hasher.check
+        password_hasher.check = lambda *args: checked.append(args) or \
+            check(*args)
+        try:
+            response = self.login(email='nobody@gmail.com')
+        finally:
+            del password_hasher.check
+        self.assertIn(b'Login unsuccessful!', response.data)
+        self.assertEqual(len(checked), 1)
+        self.assertFalse(password_hasher.needs_rehash(checked[0][0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight
+from andromeda.config import TestConfig
+from andromeda.refdata import refdata
+
+
+class AdminConfig(TestConfig):
+    ENABLE_ADMIN = True
+
+
+class ReferenceDataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AdminConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        france, spain = Country('France'), Country('Spain')
+        self.paris = City('Paris', france)
+        self.madrid = City('Madrid', spain)
+        departure = datetime(2030, 1, 1, 8, 0)
+        self.flight = Flight(name='AN1', departure_city=self.paris,
+                             arrival_city=self.madrid,
+                             departure=departure,
+                             arrival=departure + timedelta(hours=2))
+        db.session.add(self.flight)
+        db.session.commit()
+        self.france_id, self.paris_id = france.id, self.paris.id
+        self.flight_id = self.flight.id
+        db.session.remove()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_repr_without_queries(self):
+        flight = Flight.query.get(self.flight_id)
+        refdata.snapshot()
+        del self.statements[:]
+        self.assertEqual(repr(flight),
+                         "Flight('AN1'). "
+                         "Departing from: 'City('Paris') in "
+                         "Country('France')'. "
+                         "Going to: 'City('Madrid') in Country('Spain')'")
+        self.assertEqual(self.statements, [])
+
+    def test_invalidated_by_commit(self):
+        self.assertEqual(refdata.city_name(self.paris_id), 'Paris')
+
+        City.query.get(self.paris_id).name = 'Lutetia'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(refdata.city_name(self.paris_id), 'Paris')
+
+        City.query.get(self.paris_id).name = 'Lutetia'
+        db.session.commit()
+        self.assertEqual(refdata.city_name(self.paris_id), 'Lutetia')
+
+    def test_admin_selects(self):
+        client = self.app.test_client()
+        refdata.snapshot()
+        del self.statements[:]
+        response = client.get('/admin/flight/new/')
+        self.assertIn(b"City(&#39;Madrid&#39;) in Country(&#39;Spain&#39;)",
+                      response.data)
+        self.assertFalse(any('FROM city' in statement
+                             for statement in self.statements))
+
+        response = client.post('/admin/city/new/', data={
+            'name': 'Lyon', 'country_id': str(self.france_id)})
+        self.assertEqual(response.status_code, 302)
+        lyon = City.query.filter_by(name='Lyon').one()
+        self.assertEqual(lyon.country_id, self.france_id)
+        self.assertIn((lyon.id, "City('Lyon') in Country('France')"),
+                      refdata.city_choices())
+
+        response = client.post('/admin/city/new/', data={
+            'name': 'Nowhere', 'country_id': '999'})
+        self.assertIn(b'Not a valid choice', response.data)
+
+
+class PreloadConfig(TestConfig):
+    REFDATA_PRELOAD = True
+
+
+class PreloadTestCase(unittest.TestCase):
+    def test_loaded_before_first_request(self):
+        app = create_app(PreloadConfig)
+        with app.app_context():
+            db.create_all()
+            db.session.add(City('Paris', Country('France')))
+            db.session.commit()
+            refdata.invalidate()
+
+            app.test_client().get('/about')
+            self.assertIsNotNone(refdata.state.snapshot)
+
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import re
+import unittest
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event, select
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda.bookings import book_flight, cancel_booking
+from andromeda.config import TestConfig
+from andromeda.models import CompanyMonthRollup, FlightRollup, RouteDayRollup
+from andromeda.reporting import rebuild_rollups
+
+
+class AdminConfig(TestConfig):
+    ENABLE_ADMIN = True
+
+
+class RollupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(AdminConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.berlin = City("Berlin", Country(name="Germany"))
+        self.beirut = City("Beirut", Country(name="Lebanon"))
+        self.departure = datetime(2030, 1, 1, 8, 0)
+        self.flight = Flight(name="MEA200",
+                             departure_city=self.berlin,
+                             arrival_city=self.beirut,
+                             departure=self.departure,
+                             arrival=self.departure + timedelta(hours=4),
+                             capacity=10)
+        self.user = User(username="mrh26",
+                         email="justatest@gmail.com",
+                         password="1234")
+        self.company = Company(name="Andromeda",
+                               email="company@gmail.com",
+                               phone_number=None,
+                               ticket_quota=100)
+        db.session.add(self.flight)
+        db.session.add(Employment(user=self.user, company=self.company))
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def rollups(self):
+        return {model.__tablename__: sorted(
+                    tuple(row) for row in db.session.execute(
+                        select([model.__table__])))
+                for model in (FlightRollup, RouteDayRollup,
+                              CompanyMonthRollup)}
+
+    def book(self):
+        return book_flight(self.flight.id, self.user, date(2029, 12, 1))
+
+    def test_booking_and_cancel(self):
+        self.assertEqual(self.rollups()['route_day_rollup'], [
+            (self.berlin.id, self.beirut.id, date(2030, 1, 1),
+             1, 10, 0, Decimal(0))])
+
+        first = self.book()
+        self.book()
+        fare = first.fare
+        month = date.today().replace(day=1)
+        self.assertEqual(self.rollups(), {
+            'flight_rollup': [(self.flight.id, 2, 2 * fare)],
+            'route_day_rollup': [(self.berlin.id, self.beirut.id,
+                                  date(2030, 1, 1), 1, 10, 2, 2 * fare)],
+            'company_month_rollup': [(self.company.id, month, 2, 2 * fare)],
+        })
+
+        cancel_booking(first)
+        self.assertEqual(self.rollups()['company_month_rollup'],
+                         [(self.company.id, month, 1, fare)])
+        self.assertEqual(self.rollups()['flight_rollup'],
+                         [(self.flight.id, 1, fare)])
+
+    def test_rebuild_matches(self):
+        booking = self.book()
+        self.book()
+        cancel_booking(booking)
+        self.book()
+        incremental = self.rollups()
+
+        counts = rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(counts, {'flight_rollup': 1,
+                                  'route_day_rollup': 1,
+                                  'company_month_rollup': 1})
+
+    def test_flight_moved(self):
+        self.book()
+        fare = self.book().fare
+        self.flight.departure = self.departure + timedelta(days=1)
+        self.flight.capacity = 20
+        db.session.commit()
+
+        self.assertEqual(self.rollups()['route_day_rollup'], [
+            (self.berlin.id, self.beirut.id, date(2030, 1, 1),
+             0, 0, 0, Decimal(0)),
+            (self.berlin.id, self.beirut.id, date(2030, 1, 2),
+             1, 20, 2, 2 * fare)])
+
+    def test_reports_read_rollups_only(self):
+        self.book()
+        del self.statements[:]
+        response = self.app.test_client().get(
+            '/admin/reports/?start=2029-12-01&end=2030-01-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Berlin', response.data)
+        self.assertIn(b'Andromeda', response.data)
+        self.assertIn(b'MEA200', response.data)
+        self.assertFalse(any(re.search(r'\bbooking\b', statement)
+                             for statement in self.statements))
+
+        response = self.app.test_client().get('/admin/reports/?start=soon')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cli(self):
+        self.book()
+        db.session.execute(RouteDayRollup.__table__.delete())
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(
+            args=['andromeda', 'rebuild-rollups'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('route_day_rollup: 1 rows', result.output)
+        self.assertEqual(len(self.rollups()['route_day_rollup']), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight
+from andromeda.config import TestConfig
+from andromeda.schedule_import import MAX_ERRORS, ScheduleError
+from andromeda.schedule_import import ScheduleImporter, read_schedule
+
+
+HEADER = ('name,departure_city,departure_country,arrival_city,'
+          'arrival_country,departure,arrival,capacity\n')
+
+
+def schedule_row(i, origin='Berlin', destination='Paris'):
+    return (f'AN{i},{origin},Germany,{destination},France,'
+            f'2030-01-01T{i % 24:02}:00,2030-01-02T{i % 24:02}:00,150\n')
+
+
+class ScheduleImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write('schedule.csv',
+                          HEADER + ''.join(schedule_row(i)
+                                           for i in range(10)))
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        importer = ScheduleImporter(chunk_size=5).run(read_schedule(path))
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(importer.inserted, 10)
+        self.assertEqual(Country.query.count(), 2)
+        self.assertEqual(City.query.count(), 2)
+        flight = Flight.query.filter_by(name='AN3').one()
+        self.assertEqual(flight.departure_city.name, 'Berlin')
+        self.assertEqual(flight.arrival_city.country.name, 'France')
+        self.assertEqual(flight.seats_remaining, 150)
+        # Statements do not grow with the number of rows.
+        self.assertLess(len(statements), 20)
+
+    def test_invalid_rows_are_reported(self):
+        rows = [
+            {'name': 'AN1', 'departure_city': 'Berlin',
+             'departure_country': 'Germany', 'arrival_city': 'Paris',
+             'arrival_country': 'France',
+             'departure': '2030-01-01T10:00', 'arrival': '2030-01-01T12:00'},
+            {'name': 'AN2', 'departure_city': 'Atlantis',
+             'departure_country': 'Atlantis', 'arrival_city': 'Paris',
+             'arrival_country': 'France',
+             'departure': '2030-01-01T10:00', 'arrival': '2030-01-01T12:00'},
+            {'name': 'AN3', 'departure_city': 'Berlin',
+             'departure_country': 'Germany', 'arrival_city': 'Paris',
+             'arrival_country': 'France',
+             'departure': '2030-01-01T10:00', 'arrival': '2030-01-01T09:00'},
+        ]
+        path = self.write('schedule.jsonl',
+                          '\n'.join(json.dumps(row) for row in rows))
+        importer = ScheduleImporter().run(read_schedule(path))
+
+        self.assertEqual(importer.inserted, 1)
+        self.assertEqual(sorted(importer.errors), [
+            (2, "unknown country 'Atlantis'"),
+            (3, "arrival is not after departure")])
+        self.assertEqual(Flight.query.one().capacity, 180)
+        self.assertIsNone(Country.query.filter_by(name='Atlantis').first())
+
+    def test_malformed_json_lines(self):
+        row = {'name': 123, 'departure_city': 'Berlin',
+               'departure_country': 'Germany', 'arrival_city': 'Paris',
+               'arrival_country': 'France',
+               'departure': '2030-01-01 10:00:00',
+               'arrival': '2030-01-01T12:00'}
+        path = self.write('schedule.jsonl', '\n'.join([
+            '{"name": ', '[1, 2]', json.dumps(row)]))
+        importer = ScheduleImporter().run(read_schedule(path))
+
+        self.assertEqual(importer.inserted, 1)
+        self.assertEqual(Flight.query.one().name, '123')
+        self.assertEqual([number for number, message in importer.errors],
+                         [1, 2])
+
+        with self.assertRaises(ScheduleError):
+            list(read_schedule(self.write('schedule.json', '[]')))
+
+    def test_errors_are_bounded(self):
+        rows = [{'name': f'AN{i}'} for i in range(MAX_ERRORS + 5)]
+        importer = ScheduleImporter().run(rows)
+
+        self.assertEqual(importer.error_count, MAX_ERRORS + 5)
+        self.assertEqual(len(importer.errors), MAX_ERRORS)
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('schedule.csv',
+                          HEADER + ''.join(schedule_row(i)
+                                           for i in range(10)))
+        checkpoint = path + '.checkpoint'
+        with open(checkpoint, 'w') as f:
+            json.dump({'rows': 6}, f)
+
+        importer = ScheduleImporter(checkpoint=checkpoint)
+        importer.run(read_schedule(path))
+
+        self.assertEqual(sorted(name for name, in
+                                db.session.query(Flight.name)),
+                         ['AN6', 'AN7', 'AN8', 'AN9'])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_existing_flights_are_skipped(self):
+        path = self.write('schedule.csv',
+                          HEADER + ''.join(schedule_row(i)
+                                           for i in range(4)))
+        ScheduleImporter().run(read_schedule(path))
+        importer = ScheduleImporter().run(read_schedule(path))
+
+        self.assertEqual(importer.inserted, 0)
+        self.assertEqual(importer.skipped, 4)
+        self.assertEqual(City.query.count(), 2)
+
+    def test_command(self):
+        path = self.write('schedule.csv', HEADER + schedule_row(1))
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['andromeda', 'import-schedule', path])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 1 flights', result.output)
+        self.assertEqual(Flight.query.count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import Country, City, Flight, User, Company, Employment
+from andromeda import Booking, Passport
+from andromeda.config import TestConfig
+from andromeda.models import SweepFinding
+from andromeda.sweeps import sweep_cancellation_deadlines
+from andromeda.sweeps import sweep_passport_expiry
+from andromeda.sweeps import PASSPORT_EXPIRY, CANCELLATION_DEADLINE
+
+
+NOW = datetime(2030, 1, 1, 12, 0)
+
+
+class SweepTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.germany = Country(name="Germany")
+        self.berlin = City("Berlin", self.germany)
+        self.munich = City("Munich", self.germany)
+        self.company = Company(name="Andromeda",
+                               email="company@gmail.com",
+                               phone_number=None,
+                               ticket_quota=100)
+        self.users = 0
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def book(self, departure, passport_expires=None, deadline=None,
+             issued=NOW - timedelta(days=30)):
+        flight = Flight(name=f"AN{self.users}",
+                        departure_city=self.berlin,
+                        arrival_city=self.munich,
+                        departure=departure,
+                        arrival=departure + timedelta(hours=1))
+        user = User(username=f"user{self.users}",
+                    email=f"user{self.users}@gmail.com",
+                    password="cat")
+        self.users += 1
+        if passport_expires is not None:
+            db.session.add(Passport(user=user,
+                                    first_name="Ada",
+                                    last_name="Lovelace",
+                                    date_of_birth=date(1990, 1, 1),
+                                    country=self.germany,
+                                    issue_date=date(2020, 1, 1),
+                                    expiration_date=passport_expires))
+        employment = Employment(user=user, company=self.company)
+        booking = Booking(flight, user,
+                          deadline or (departure - timedelta(days=1)).date(),
+                          issuing_employment=employment,
+                          date_issued=issued)
+        db.session.add(booking)
+        db.session.commit()
+        return booking
+
+    def open_findings(self, sweep):
+        return sorted(finding.booking_id for finding in SweepFinding.query
+                      .filter_by(sweep=sweep, resolved_at=None))
+
+    def test_passport_expiry(self):
+        expired = self.book(NOW + timedelta(days=10),
+                            passport_expires=date(2030, 1, 5))
+        self.book(NOW + timedelta(days=10),
+                  passport_expires=date(2031, 1, 1))
+        self.book(NOW + timedelta(days=60),
+                  passport_expires=date(2030, 1, 5))
+        self.book(NOW + timedelta(days=10))
+
+        self.assertEqual(sweep_passport_expiry(NOW), 1)
+        self.assertEqual(self.open_findings(PASSPORT_EXPIRY), [expired.id])
+        # Nothing changed: nothing new is found.
+        self.assertEqual(sweep_passport_expiry(NOW + timedelta(hours=1)), 0)
+
+    def test_passport_expiry_is_incremental(self):
+        sweep_passport_expiry(NOW)
+        later = NOW + timedelta(days=1)
+        # Flight that entered the horizon since the last run.
+        entered = self.book(later + timedelta(days=29, hours=12),
+                            passport_expires=date(2030, 1, 5))
+        # New booking on a flight already inside it.
+        issued = self.book(NOW + timedelta(days=5),
+                           passport_expires=date(2030, 1, 2),
+                           issued=later - timedelta(hours=1))
+        # Existing booking, already examined by the last run.
+        self.book(NOW + timedelta(days=5),
+                  passport_expires=date(2030, 1, 2))
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(sweep_passport_expiry(later), 2)
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(self.open_findings(PASSPORT_EXPIRY),
+                         sorted([entered.id, issued.id]))
+        # Set-based: the number of statements does not depend on rows.
+        self.assertLess(len(statements), 8)
+
+    def test_renewed_passport_resolves_finding(self):
+        booking = self.book(NOW + timedelta(days=10),
+                            passport_expires=date(2030, 1, 5))
+        sweep_passport_expiry(NOW)
+
+        booking.user.passport.expiration_date = date(2040, 1, 1)
+        db.session.commit()
+        sweep_passport_expiry(NOW + timedelta(days=1))
+        self.assertEqual(self.open_findings(PASSPORT_EXPIRY), [])
+
+    def test_changed_passport_and_rescheduled_flight(self):
+        # The change times come from the clock.
+        now = datetime.now()
+        issued = now - timedelta(days=1)
+        expiry = (now + timedelta(days=20)).date()
+        changed = self.book(now + timedelta(days=10),
+                            passport_expires=date(2099, 1, 1),
+                            issued=issued)
+        moved = self.book(now + timedelta(days=10), passport_expires=expiry,
+                          issued=issued)
+        self.assertEqual(sweep_passport_expiry(now), 0)
+
+        changed.user.passport.expiration_date = (now + timedelta(days=5)) \
+            .date()
+        moved.flight.departure = now + timedelta(days=25)
+        db.session.commit()
+        self.assertEqual(sweep_passport_expiry(now + timedelta(minutes=1)),
+                         2)
+        self.assertEqual(self.open_findings(PASSPORT_EXPIRY),
+                         sorted([changed.id, moved.id]))
+
+    def test_cancellation_deadlines(self):
+        passed = self.book(NOW + timedelta(days=10),
+                           deadline=date(2029, 12, 31))
+        self.book(NOW + timedelta(days=10), deadline=date(2030, 1, 1))
+
+        self.assertEqual(sweep_cancellation_deadlines(NOW), 1)
+        self.assertEqual(self.open_findings(CANCELLATION_DEADLINE),
+                         [passed.id])
+
+        tomorrow = NOW + timedelta(days=1)
+        self.assertEqual(sweep_cancellation_deadlines(tomorrow), 1)
+        self.assertEqual(sweep_cancellation_deadlines(tomorrow), 0)
+        self.assertEqual(len(self.open_findings(CANCELLATION_DEADLINE)), 2)
+
+        # Issued since the last run, with a deadline already passed.
+        late = self.book(NOW + timedelta(days=10),
+                         deadline=date(2029, 12, 1),
+                         issued=tomorrow + timedelta(hours=1))
+        self.assertEqual(
+            sweep_cancellation_deadlines(tomorrow + timedelta(hours=2)), 1)
+        self.assertIn(late.id, self.open_findings(CANCELLATION_DEADLINE))
+
+    def test_command(self):
+        self.book(NOW + timedelta(days=390),
+                  deadline=date(2020, 1, 1))
+        result = self.app.test_cli_runner().invoke(args=['andromeda',
+                                                         'sweep'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('cancellation_deadline: 1 new findings', result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from sqlalchemy import event
+
+from andromeda import create_app, db
+from andromeda import User
+from andromeda.cache import ClientCache
+from andromeda.config import TestConfig
+from andromeda.user_cache import UserCache, user_cache
+
+
+class FakeRedis:
+    # Local stand-in for a redis client.
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, pattern):
+        return [k for k in list(self.data) if k.startswith(pattern[:-1])]
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        user = User(username="mrh26",
+                    email="justatest@gmail.com",
+                    password="cat")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count)
+        user_cache.state.backend.clear()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def count(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_hit_does_not_query(self):
+        cache = UserCache()
+        cache.get(self.user_id)
+        self.assertEqual(len(self.statements), 1)
+        self.assertNotIn('passport', self.statements[0])
+        db.session.remove()
+
+        user = cache.get(self.user_id)
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(user.username, "mrh26")
+        self.assertTrue(user.verify_password("cat"))
+        self.assertIs(db.session.query(User).get(self.user_id), user)
+        self.assertEqual(len(self.statements), 1)
+
+    def test_shared_backend(self):
+        cache = UserCache()
+        cache.state.backend = ClientCache(FakeRedis(), prefix='test:')
+        cache.get(self.user_id)
+        db.session.remove()
+
+        self.assertEqual(cache.get(self.user_id).email,
+                         "justatest@gmail.com")
+        self.assertEqual(len(self.statements), 1)
+
+    def test_account_update_invalidates(self):
+        tester = self.app.test_client()
+        tester.post('/login', data={'email': 'justatest@gmail.com',
+                                    'password': 'cat'})
+        tester.get('/account')
+        self.assertIsNotNone(user_cache.state.backend.get(str(self.user_id)))
+
+        tester.post('/account', data={'username': 'renamed',
+                                      'email': 'justatest@gmail.com'})
+        self.assertIsNone(user_cache.state.backend.get(str(self.user_id)))
+
+        response = tester.get('/account')
+        self.assertIn(b'renamed', response.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
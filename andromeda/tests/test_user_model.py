@@ -1,8 +1,20 @@
+import threading
 import unittest
+
+from andromeda import create_app, db, password_hasher
 from andromeda import User
+from andromeda.config import TestConfig
+from andromeda.hashing import PasswordHasher, HashingBusyError
 
 
 class UserModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ctx = create_app(TestConfig).app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
     def test_password_setter(self):
         u = User(username="Test", email="test@test.com", password='cat')
         self.assertTrue(u._password is not None)
@@ -16,3 +28,99 @@ class UserModelTestCase(unittest.TestCase):
         u = User(username="Test", email="test@test.com", password='cat')
         u2 = User(username="Test2", email="test2@test.com", password='cat')
         self.assertTrue(u._password != u2._password)
+
+    def test_password_upgraded_when_cost_changes(self):
+        u = User(username="Test", email="test@test.com", password='cat')
+        self.assertFalse(u.upgrade_password('cat'))
+
+        old_hash = u._password
+        password_hasher.state.rounds += 1
+        try:
+            self.assertTrue(u.upgrade_password('cat'))
+        finally:
+            password_hasher.state.rounds -= 1
+        self.assertNotEqual(u._password, old_hash)
+        self.assertTrue(u._password.startswith('$2b$05$'))
+        self.assertTrue(u.verify_password('cat'))
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def test_busy_when_backlog_is_full(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        class SlowBcrypt:
+            def generate_password_hash(self, password, rounds):
+                started.set()
+                release.wait(5)
+                return b'$2b$04$hash'
+
+        hasher = PasswordHasher(bcrypt=SlowBcrypt())
+        hasher.state.workers, hasher.state.backlog = 1, 0
+
+        worker = threading.Thread(target=hasher.hash, args=('cat',))
+        worker.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(HashingBusyError):
+                hasher.hash('dog')
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(hasher.hash('dog'), '$2b$04$hash')
+
+    def test_busy_after_timeout(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        class SlowBcrypt:
+            def generate_password_hash(self, password, rounds):
+                started.set()
+                release.wait(5)
+                return b'$2b$04$hash'
+
+        hasher = PasswordHasher(bcrypt=SlowBcrypt())
+        state = hasher.state
+        state.workers, state.backlog, state.timeout = 1, 0, 0.01
+
+        try:
+            with self.assertRaises(HashingBusyError):
+                hasher.hash('cat')
+            started.wait(5)
+            # Still hashing 'cat', so there is no slot for 'dog'.
+            with self.assertRaises(HashingBusyError):
+                hasher.hash('dog')
+        finally:
+            release.set()
+
+
+class RegistrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_registered_password_verifies(self):
+        tester = self.app.test_client()
+        response = tester.post('/register', data={
+            'username': 'mrh26',
+            'email': 'justatest@gmail.com',
+            'password': 'cat',
+            'confirm_password': 'cat',
+        })
+        self.assertEqual(response.status_code, 302)
+
+        user = User.query.filter_by(username='mrh26').one()
+        self.assertTrue(user.verify_password('cat'))
+
+        response = tester.post('/login', data={
+            'email': 'justatest@gmail.com',
+            'password': 'cat',
+        })
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,96 @@
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from andromeda import db, login_manager
+from andromeda.cache import cache_from_url
+from andromeda.extension import Extension
+from andromeda.models import User
+
+
+class UserCache(Extension):
+    """Short-lived cache of User rows for the login_manager user loader.
+
+    Only column values are cached. A hit rebuilds the User and attaches
+    it to the current session without a query (relationships still
+    lazy-load on access). Entries are dropped when a transaction that
+    changed the user commits, and otherwise expire after USER_CACHE_TTL
+    seconds. USER_CACHE_URL selects a shared backend (redis://...);
+    the default is a per-process cache.
+    """
+
+    name = 'user_cache'
+
+    class State:
+        def __init__(self, url=None, maxsize=10000, ttl=60):
+            self.backend = cache_from_url(url, prefix='andromeda:user:',
+                                          maxsize=maxsize, ttl=ttl)
+
+    def __init__(self, app=None):
+        super().__init__()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_URL', None)
+        app.config.setdefault('USER_CACHE_SIZE', 10000)
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        self._bind(app, self.State(url=app.config['USER_CACHE_URL'],
+                                   maxsize=app.config['USER_CACHE_SIZE'],
+                                   ttl=app.config['USER_CACHE_TTL']))
+
+    def get(self, user_id):
+        backend = self.state.backend
+        values = backend.get(str(user_id))
+        if values is not None:
+            return self._restore(values)
+
+        user = User.query.get(user_id)
+        if user is not None:
+            backend.set(str(user_id), self._snapshot(user))
+        return user
+
+    def invalidate(self, user_id):
+        self.state.backend.delete(str(user_id))
+
+    def _snapshot(self, user):
+        return {attr.key: getattr(user, attr.key)
+                for attr in User.__mapper__.column_attrs}
+
+    def _restore(self, values):
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            # Bypasses __init__ and the attribute validators: these
+            # values were read from the database.
+            set_committed_value(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+user_cache = UserCache()
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return user_cache.get(int(user_id))
+
+
+#   Invalidate after commit rather than at flush time, so a concurrent
+#   request cannot cache the old row again before the new one is visible.
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_users', set()).add(target.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed(session):
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_changed(session, previous_transaction):
+    session.info.pop('changed_users', None)
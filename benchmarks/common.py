@@ -0,0 +1,135 @@
+"""Shared by the benchmark scripts: where the synthetic dataset lives,
+and how results are summarized and compared with a baseline."""
+import json
+import os
+import re
+import statistics
+import sys
+
+from datetime import datetime
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.join(ROOT, 'benchmarks')
+DEFAULT_DATABASE = 'sqlite:///' + os.path.join(HERE, 'benchmark.db')
+MANIFEST = os.path.join(HERE, 'benchmark.json')
+
+#   Seeded users all have this password.
+PASSWORD = 'benchmark'
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+QUERIES = re.compile(r'queries;desc="(\d+)"')
+
+
+def database_url():
+    return os.environ.get('DATABASE_URL', DEFAULT_DATABASE)
+
+
+def load_manifest():
+    """What seed.py put in the database: ids, routes and dates to use."""
+    if not os.path.exists(MANIFEST):
+        sys.exit("No dataset: run benchmarks/seed.py first.")
+    with open(MANIFEST) as f:
+        manifest = json.load(f)
+    # strptime: date.fromisoformat does not exist before Python 3.7.
+    manifest['days'] = [datetime.strptime(day, '%Y-%m-%d').date()
+                        for day in manifest['days']]
+    return manifest
+
+
+def queries_in(headers):
+    """SQL statements run for a response, from its Server-Timing header."""
+    match = QUERIES.search(headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+#   Status of a successful response, where it is not 200.
+EXPECTED_STATUS = {'login': 302, 'register': 302, 'book': 201}
+
+
+def summarize(name, samples, elapsed):
+    """Summary of the (latency in seconds, queries, status) samples of
+    scenario name, collected over elapsed seconds."""
+    expected = EXPECTED_STATUS.get(name, 200)
+    latencies = [latency for latency, queries, status in samples]
+    queries = [queries for latency, queries, status in samples
+               if queries is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for latency, queries, status in samples
+                      if status != expected),
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries': statistics.mean(queries) if queries else None,
+    }
+
+
+def report(results):
+    print(f"{'scenario':<18}{'requests':>9}{'errors':>8}{'req/s':>9}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for name, result in results.items():
+        queries = result['queries']
+        print(f"{name:<18}{result['requests']:>9}{result['errors']:>8}"
+              f"{result['throughput']:>9.1f}{result['p50_ms']:>9.1f}"
+              f"{result['p99_ms']:>9.1f}"
+              f"{'-' if queries is None else f'{queries:.1f}':>9}")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against baseline, as messages.
+
+    The median latency may grow by tolerance (a fraction) before it
+    counts, as it depends on the machine; p99, over a few hundred
+    requests, is too noisy to fail on. Query counts do not depend on
+    the machine, so any increase counts.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {result['p50_ms']:.1f} ms "
+                               f"(baseline {before['p50_ms']:.1f} ms)")
+        if result['queries'] is not None and \
+                before.get('queries') is not None and \
+                result['queries'] > before['queries'] + 0.5:
+            regressions.append(f"{name}: {result['queries']:.1f} queries "
+                               f"per request (baseline "
+                               f"{before['queries']:.1f})")
+        if result['errors'] > before.get('errors', 0):
+            regressions.append(f"{name}: {result['errors']} errors")
+    return regressions
+
+
+def check_baseline(results, path, save, tolerance):
+    """Save results as the baseline at path, or compare them with it.
+    Returns the exit status."""
+    if save:
+        rounded = {name: {key: round(value, 1)
+                          if isinstance(value, float) else value
+                          for key, value in result.items()}
+                   for name, result in results.items()}
+        with open(path, 'w') as f:
+            json.dump(rounded, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline saved to {path}")
+        return 0
+    if not os.path.exists(path):
+        print(f"no baseline at {path}; save one with --save-baseline")
+        return 0
+
+    with open(path) as f:
+        regressions = compare(results, json.load(f), tolerance)
+    for regression in regressions:
+        print(f"regression: {regression}")
+    return 1 if regressions else 0
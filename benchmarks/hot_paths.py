@@ -0,0 +1,161 @@
+"""Drive the hot paths in-process, through the Flask test client, and
+report throughput, p50/p99 latency and queries per request.
+
+    python benchmarks/seed.py
+    python benchmarks/hot_paths.py [--requests 100] [--save-baseline]
+
+Results are compared with benchmarks/baseline.json: the script exits
+with status 1 if a median latency grew by more than --tolerance, or a
+scenario runs more queries per request than it did. Bookings made by
+the run are kept; re-seed for a clean dataset.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+from datetime import date, timedelta
+
+# Also puts the repository on sys.path, for andromeda.
+from common import HERE, PASSWORD, database_url, load_manifest
+from common import check_baseline, queries_in, report, summarize
+
+from andromeda import create_app
+from andromeda.config import Config
+
+
+class BenchmarkConfig(Config):
+    ENABLE_ADMIN = True
+    #   The test client posts forms without a CSRF token.
+    WTF_CSRF_ENABLED = False
+    #   Every login comes from the same address.
+    RATE_LIMIT_ENABLED = False
+    EMAIL_DELIVERABILITY_MODE = 'offline'
+    #   Jobs are queued, as in production, and left for a worker.
+    JOBS_MODE = 'database'
+    MAIL_SERVER = None
+    #   Queries per request are read from the Server-Timing header.
+    SERVER_TIMING_ENABLED = True
+
+
+class Scenarios:
+    """Each scenario makes one request and returns the response."""
+
+    def __init__(self, app, manifest, rng):
+        self.app = app
+        self.manifest = manifest
+        self.rng = rng
+        self.run_id = uuid.uuid4().hex[:8]
+        self.registered = 0
+        self.client = app.test_client()
+        self.client.post('/login', data=self.credentials())
+
+    def credentials(self):
+        i = self.rng.randrange(self.manifest['users'])
+        return {'email': f'user{i}@example.com', 'password': PASSWORD}
+
+    def search_args(self):
+        origin, destination = self.rng.choice(self.manifest['routes'])
+        first, last = self.manifest['days']
+        day = first + timedelta(days=self.rng.randrange(
+            (last - first).days + 1))
+        return {'origin': origin, 'destination': destination,
+                'departure_from': day.isoformat(),
+                'departure_to': (day + timedelta(days=6)).isoformat()}
+
+    def login(self):
+        # A new client each time, so that every request logs in.
+        return self.app.test_client().post('/login',
+                                           data=self.credentials())
+
+    def register(self):
+        self.registered += 1
+        name = f'b{self.run_id}{self.registered}'
+        return self.app.test_client().post('/register', data={
+            'username': name,
+            'email': f'{name}@example.com',
+            'password': PASSWORD,
+            'confirm_password': PASSWORD,
+        })
+
+    def flight_search(self):
+        return self.client.get('/flights/search',
+                               query_string=dict(self.search_args(),
+                                                 format='json'))
+
+    def flight_search_html(self):
+        return self.client.get('/flights/search',
+                               query_string=self.search_args())
+
+    def book(self):
+        first, last = self.manifest['flight_ids']
+        flight_id = self.rng.randint(first, last)
+        return self.client.post(
+            f'/flights/{flight_id}/book',
+            data={'cancellation_deadline': date.today().isoformat()},
+            headers={'Accept': 'application/json'})
+
+    def account_bookings(self):
+        return self.client.get('/account/bookings',
+                               query_string={'format': 'json'})
+
+    def admin_bookings(self):
+        return self.client.get('/admin/booking/')
+
+    def admin_flights(self):
+        return self.client.get('/admin/flight/')
+
+    def admin_users(self):
+        return self.client.get('/admin/user/')
+
+
+SCENARIOS = ['login', 'register', 'flight_search', 'flight_search_html',
+             'book', 'account_bookings', 'admin_bookings', 'admin_flights',
+             'admin_users']
+
+
+def run(name, scenario, requests, warmup):
+    for _ in range(warmup):
+        scenario()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        before = time.perf_counter()
+        response = scenario()
+        samples.append((time.perf_counter() - before,
+                        queries_in(response.headers),
+                        response.status_code))
+    return summarize(name, samples, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help="run only these (may be repeated)")
+    parser.add_argument('--baseline',
+                        default=os.path.join(HERE, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="allowed latency growth, as a fraction")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    BenchmarkConfig.SQLALCHEMY_DATABASE_URI = database_url()
+    app = create_app(BenchmarkConfig)
+    scenarios = Scenarios(app, load_manifest(), random.Random(args.seed))
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run(name, getattr(scenarios, name),
+                            args.requests, args.warmup)
+    report(results)
+    return check_baseline(results, args.baseline, args.save_baseline,
+                          args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Generate HTTP load against a running server, from several processes,
+and report throughput, p50/p99 latency and queries per request.
+
+    python benchmarks/seed.py
+    FLASK_APP=andromeda DATABASE_URL=sqlite:///$PWD/benchmarks/benchmark.db \\
+        ENABLE_ADMIN=1 RATE_LIMIT_ENABLED=0 SERVER_TIMING_ENABLED=1 flask run
+    python benchmarks/load.py http://127.0.0.1:5000 [--processes 4] \\
+        [--duration 30] [--mix flight_search=6,book=2,login=1]
+
+The server must be serving the seeded dataset. Each process keeps its
+own logged-in session and picks scenarios at random, weighted by
+--mix. Queries per request are read from the Server-Timing header.
+With --baseline, results are compared as by hot_paths.py.
+"""
+import argparse
+import http.cookiejar
+import multiprocessing
+import random
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from common import PASSWORD, load_manifest
+from common import check_baseline, queries_in, report, summarize
+
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+DEFAULT_MIX = 'flight_search=6,book=2,account_bookings=2,login=1'
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time the request itself, not the page it redirects to.
+    def redirect_request(self, *args):
+        return None
+
+
+class Session:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirect)
+        self.csrf_token = None
+
+    def request(self, path, data=None, params=None, headers=None):
+        """Return (status, headers, body), timed by the caller."""
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        if data is not None:
+            if self.csrf_token:
+                data = dict(data, csrf_token=self.csrf_token)
+            data = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(url, data=data,
+                                         headers=headers or {})
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def fetch_csrf_token(self, path='/login'):
+        status, headers, body = self.request(path)
+        match = CSRF_TOKEN.search(body.decode('utf-8', 'replace'))
+        self.csrf_token = match.group(1) if match else None
+
+
+class Scenarios:
+    """Each scenario makes one timed request and returns a sample."""
+
+    def __init__(self, base_url, manifest, rng):
+        self.base_url = base_url
+        self.manifest = manifest
+        self.rng = rng
+        self.session = Session(base_url)
+        self.session.fetch_csrf_token()
+        self.session.request('/login', data=self.credentials())
+
+    def credentials(self):
+        i = self.rng.randrange(self.manifest['users'])
+        return {'email': f'user{i}@example.com', 'password': PASSWORD}
+
+    def timed(self, session, *args, **kwargs):
+        start = time.perf_counter()
+        status, headers, body = session.request(*args, **kwargs)
+        return time.perf_counter() - start, queries_in(headers), status
+
+    def login(self):
+        session = Session(self.base_url)
+        session.fetch_csrf_token()
+        return self.timed(session, '/login', data=self.credentials())
+
+    def register(self):
+        name = f'l{uuid.uuid4().hex[:14]}'
+        session = Session(self.base_url)
+        session.fetch_csrf_token('/register')
+        return self.timed(session, '/register', data={
+            'username': name,
+            'email': f'{name}@example.com',
+            'password': PASSWORD,
+            'confirm_password': PASSWORD,
+        })
+
+    def flight_search(self):
+        origin, destination = self.rng.choice(self.manifest['routes'])
+        first = self.manifest['days'][0]
+        day = first + timedelta(days=self.rng.randrange(30))
+        return self.timed(self.session, '/flights/search', params={
+            'origin': origin, 'destination': destination,
+            'departure_from': day.isoformat(), 'format': 'json'})
+
+    def book(self):
+        first, last = self.manifest['flight_ids']
+        return self.timed(
+            self.session, f'/flights/{self.rng.randint(first, last)}/book',
+            data={'cancellation_deadline': date.today().isoformat()},
+            headers={'Accept': 'application/json'})
+
+    def account_bookings(self):
+        return self.timed(self.session, '/account/bookings',
+                          params={'format': 'json'})
+
+    def admin_bookings(self):
+        return self.timed(self.session, '/admin/booking/')
+
+
+SCENARIOS = ['login', 'register', 'flight_search', 'book',
+             'account_bookings', 'admin_bookings']
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def worker(job):
+    base_url, mix, duration, seed = job
+    rng = random.Random(seed)
+    scenarios = Scenarios(base_url, load_manifest(), rng)
+    names, weights = list(mix), list(mix.values())
+
+    samples = defaultdict(list)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        samples[name].append(getattr(scenarios, name)())
+    return dict(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', type=parse_mix,
+                        default=parse_mix(DEFAULT_MIX))
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    args = parser.parse_args()
+
+    jobs = [(args.url, args.mix, args.duration, i)
+            for i in range(args.processes)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        per_process = pool.map(worker, jobs)
+    elapsed = time.perf_counter() - start
+
+    samples = defaultdict(list)
+    for process_samples in per_process:
+        for name, values in process_samples.items():
+            samples[name].extend(values)
+    results = {name: summarize(name, samples[name], elapsed)
+               for name in args.mix if samples[name]}
+    report(results)
+
+    total = sum(len(values) for values in samples.values())
+    print(f"total: {total / elapsed:.1f} requests/s "
+          f"from {args.processes} processes")
+    if args.baseline:
+        return check_baseline(results, args.baseline, args.save_baseline,
+                              args.tolerance)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Fill a database with a synthetic dataset for the benchmarks.
+
+    python benchmarks/seed.py [--scale 1] [--flights N] [--users N] ...
+
+The database is DATABASE_URL, or benchmarks/benchmark.db by default; it
+is wiped and rebuilt from the migrations. Counts are multiplied by
+--scale. Rows are written with executemany INSERTs, and every user gets
+the same password hash, so a large dataset takes seconds, not hours.
+What the runners need to know (ids, routes, dates) is written to
+benchmarks/benchmark.json.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from datetime import date, datetime, time as day_time, timedelta
+
+from flask_migrate import upgrade
+from iso3166 import countries
+
+# Also puts the repository on sys.path, for andromeda.
+from common import MANIFEST, PASSWORD, database_url
+
+from andromeda import create_app, db, password_hasher
+from andromeda.config import Config
+from andromeda.models import Booking, City, Company, Country, Employment
+from andromeda.models import Flight, User
+from andromeda.reporting import rebuild_rollups
+
+
+DEFAULTS = {
+    'countries': 20,
+    'cities': 200,
+    'routes': 400,
+    'flights': 20000,
+    'companies': 20,
+    'users': 2000,
+    'bookings': 50000,
+}
+CHUNK_SIZE = 10000
+DAYS = 60
+CAPACITY = 400
+
+
+class SeedConfig(Config):
+    EMAIL_DELIVERABILITY_MODE = 'offline'
+    ENABLE_ADMIN = False
+
+
+def insert(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(table.insert(), rows[start:start + CHUNK_SIZE])
+
+
+def ids(model):
+    return [id for id, in db.session.query(model.id).order_by(model.id)]
+
+
+def seed(counts, rng):
+    first_day = date.today() + timedelta(days=1)
+
+    names = [country.name for country in countries]
+    insert(Country.__table__,
+           [{'name': name} for name in rng.sample(names,
+                                                  counts['countries'])])
+    country_ids = ids(Country)
+    insert(City.__table__,
+           [{'name': f'City {i}', 'country_id': rng.choice(country_ids)}
+            for i in range(counts['cities'])])
+    city_ids = ids(City)
+
+    routes = set()
+    while len(routes) < min(counts['routes'],
+                            len(city_ids) * (len(city_ids) - 1)):
+        origin, destination = rng.sample(city_ids, 2)
+        routes.add((origin, destination))
+    routes = sorted(routes)
+
+    flights = []
+    for i in range(counts['flights']):
+        origin, destination = rng.choice(routes)
+        departure = datetime.combine(
+            first_day + timedelta(days=rng.randrange(DAYS)),
+            day_time(rng.randrange(24), rng.choice((0, 15, 30, 45))))
+        flights.append({
+            'name': f'BM{i}',
+            'departure_city_id': origin,
+            'arrival_city_id': destination,
+            'departure': departure,
+            'arrival': departure + timedelta(minutes=rng.randrange(60, 600)),
+            'capacity': CAPACITY,
+            'seats_remaining': CAPACITY,
+            'base_fare': rng.randrange(50, 500),
+        })
+    insert(Flight.__table__, flights)
+    flight_ids = ids(Flight)
+
+    # No ticket quota, so bookings made by the runners never run out.
+    insert(Company.__table__,
+           [{'name': f'Company {i}', 'email': f'company{i}@example.com',
+             'ticket_quota': None, 'tickets_used': 0}
+            for i in range(counts['companies'])])
+    company_ids = ids(Company)
+
+    password = password_hasher.hash(PASSWORD)
+    insert(User.__table__,
+           [{'username': f'user{i}', 'email': f'user{i}@example.com',
+             '_password': password}
+            for i in range(counts['users'])])
+    user_ids = ids(User)
+    employers = {user_id: rng.choice(company_ids) for user_id in user_ids}
+    insert(Employment.__table__,
+           [{'user_id': user_id, 'company_id': company_id,
+             'employment_date': first_day - timedelta(days=365)}
+            for user_id, company_id in employers.items()])
+
+    seats = dict.fromkeys(flight_ids, 0)
+    tickets = dict.fromkeys(company_ids, 0)
+    bookings = []
+    issued = datetime.combine(first_day - timedelta(days=365), day_time())
+    for i in range(counts['bookings']):
+        flight_id = rng.choice(flight_ids)
+        if seats[flight_id] >= CAPACITY:
+            continue
+        seats[flight_id] += 1
+        user_id = rng.choice(user_ids)
+        tickets[employers[user_id]] += 1
+        bookings.append({
+            'flight_id': flight_id,
+            'user_id': user_id,
+            'issuing_employment_id': user_id,
+            'date_issued': issued + timedelta(
+                seconds=rng.randrange(365 * 24 * 3600)),
+            'cancellation_deadline': first_day,
+            'cancellation_fee': 0,
+        })
+    insert(Booking.__table__, bookings)
+
+    # Keep the denormalized counters consistent with the bookings.
+    db.session.execute(
+        Flight.__table__.update()
+        .where(Flight.id == db.bindparam('flight_id'))
+        .values(seats_remaining=CAPACITY - db.bindparam('booked')),
+        [{'flight_id': id, 'booked': n} for id, n in seats.items() if n])
+    db.session.execute(
+        Company.__table__.update()
+        .where(Company.id == db.bindparam('company_id'))
+        .values(tickets_used=db.bindparam('used')),
+        [{'company_id': id, 'used': n} for id, n in tickets.items() if n])
+    db.session.commit()
+    # The rows above skip the ORM events that keep the rollups.
+    rebuild_rollups()
+
+    return {
+        'users': len(user_ids),
+        'first_user_id': user_ids[0],
+        'flight_ids': [flight_ids[0], flight_ids[-1]],
+        'routes': routes,
+        'days': [first_day.isoformat(),
+                 (first_day + timedelta(days=DAYS - 1)).isoformat()],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f'--{name}', type=int,
+                            help=f"default {default} (times --scale)")
+    args = parser.parse_args()
+
+    counts = {name: getattr(args, name) or max(1, int(default * args.scale))
+              for name, default in DEFAULTS.items()}
+
+    SeedConfig.SQLALCHEMY_DATABASE_URI = database_url()
+    app = create_app(SeedConfig)
+    with app.app_context():
+        start = time.perf_counter()
+        db.drop_all()
+        db.engine.execute('DROP TABLE IF EXISTS alembic_version')
+        upgrade()
+        manifest = seed(counts, random.Random(args.seed))
+        elapsed = time.perf_counter() - start
+
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f)
+    print(', '.join(f"{n} {name}" for name, n in counts.items()))
+    print(f"seeded {SeedConfig.SQLALCHEMY_DATABASE_URI} "
+          f"in {elapsed:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Measure how long a fresh process takes to import andromeda and build
+an app, with and without the admin UI.
+
+    python benchmarks/startup.py [--runs 10] [--budget 1.5]
+
+Exits with status 1 if the median time without the admin UI is over
+the budget (in seconds), so it can guard import cost in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE = 'import andromeda; andromeda.create_app()'
+
+
+def time_startup(runs, **environ):
+    env = dict(os.environ, **environ)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', CODE],
+                              cwd=ROOT, env=env)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=1.5)
+    args = parser.parse_args()
+
+    # Don't let DNS or hashing settings from the environment interfere.
+    base = {'EMAIL_DELIVERABILITY_MODE': 'offline'}
+    without_admin = time_startup(args.runs, ENABLE_ADMIN='0', **base)
+    with_admin = time_startup(args.runs, ENABLE_ADMIN='1', **base)
+
+    print(f"startup without admin: {without_admin * 1000:.0f} ms (median)")
+    print(f"startup with admin:    {with_admin * 1000:.0f} ms (median)")
+
+    if without_admin > args.budget:
+        print(f"over budget of {args.budget * 1000:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""baseline
+
+The schema as reset.py used to create it, before any of the columns,
+tables and indexes added by the later revisions. Databases created
+that way are brought under migrations with `flask db stamp 0001`, and
+then upgraded.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 19:12:05.517125
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('company',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=150), nullable=False),
+    sa.Column('email', sa.String(length=50), nullable=False),
+    sa.Column('phone_number', sa.String(length=30), nullable=True),
+    sa.Column('ticket_quota', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('country',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=60), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('email', sa.String(length=50), nullable=False),
+    sa.Column('phone_number', sa.String(length=30), nullable=True),
+    sa.Column('_password', sa.String(length=128), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('city',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('country_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['country_id'], ['country.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('employment',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('employment_date', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['company_id'], ['company.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('passport',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('first_name', sa.String(length=50), nullable=False),
+    sa.Column('last_name', sa.String(length=50), nullable=False),
+    sa.Column('date_of_birth', sa.Date(), nullable=False),
+    sa.Column('issue_date', sa.Date(), nullable=False),
+    sa.Column('expiration_date', sa.Date(), nullable=False),
+    sa.Column('country_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['country_id'], ['country.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_table('flight',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('arrival', sa.DateTime(), nullable=False),
+    sa.Column('arrival_city_id', sa.Integer(), nullable=False),
+    sa.Column('departure', sa.DateTime(), nullable=False),
+    sa.Column('departure_city_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['arrival_city_id'], ['city.id'], ),
+    sa.ForeignKeyConstraint(['departure_city_id'], ['city.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('booking',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('flight_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('date_issued', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.Column('issuing_employment_id', sa.Integer(), nullable=False),
+    sa.Column('cancellation_fee', sa.Float(), nullable=True),
+    sa.Column('cancellation_deadline', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['flight_id'], ['flight.id'], ),
+    sa.ForeignKeyConstraint(['issuing_employment_id'], ['employment.user_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('booking')
+    op.drop_table('flight')
+    op.drop_table('passport')
+    op.drop_table('employment')
+    op.drop_table('city')
+    op.drop_table('user')
+    op.drop_table('country')
+    op.drop_table('company')
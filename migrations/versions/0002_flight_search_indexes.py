@@ -0,0 +1,35 @@
+"""flight search indexes
+
+Flight search filters on the route and the day of departure, and
+itinerary search on arrival times.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 19:12:10.000000
+
+"""
+from andromeda.schema import create_index_online, drop_index_online
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_flight_route_departure', 'flight',
+     ['departure_city_id', 'arrival_city_id', 'departure']),
+    ('ix_flight_arrival', 'flight', ['arrival']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        create_index_online(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        drop_index_online(name, table)
@@ -0,0 +1,33 @@
+"""cache version
+
+Versions of the data that processes copy into memory, so that a change
+made in one process reaches the copies in the others. The itinerary
+route graph is the first.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 19:12:15.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_version = op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(cache_version, [{'name': 'route_graph', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('cache_version')
@@ -0,0 +1,92 @@
+"""booking counters
+
+Flights get a capacity and a count of the seats still for sale, and
+companies a count of the tickets issued against their quota. Both
+counters are computed from the existing bookings. Flights had no
+capacity before: they get the default of 180 seats, and a flight with
+more bookings than that is left with no seats remaining.
+
+Companies created without a quota got 0, which meant nothing while the
+quota was not enforced, and would now stop their bookings. A missing
+quota is NULL (no limit): those zeroes become NULL.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 19:12:20.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+flight = sa.table('flight',
+                  sa.column('id'),
+                  sa.column('capacity'),
+                  sa.column('seats_remaining'))
+company = sa.table('company',
+                   sa.column('id'),
+                   sa.column('ticket_quota'),
+                   sa.column('tickets_used'))
+booking = sa.table('booking',
+                   sa.column('flight_id'),
+                   sa.column('issuing_employment_id'))
+employment = sa.table('employment',
+                      sa.column('user_id'),
+                      sa.column('company_id'))
+
+
+def upgrade():
+    with op.batch_alter_table('flight') as batch_op:
+        batch_op.add_column(sa.Column('capacity', sa.Integer(),
+                                      nullable=False, server_default='180'))
+        batch_op.add_column(sa.Column('seats_remaining', sa.Integer(),
+                                      nullable=True))
+    with op.batch_alter_table('company') as batch_op:
+        batch_op.add_column(sa.Column('tickets_used', sa.Integer(),
+                                      nullable=False, server_default='0'))
+
+    booked = sa.select([sa.func.count()])\
+        .where(booking.c.flight_id == flight.c.id)\
+        .as_scalar()
+    op.execute(flight.update().values(seats_remaining=sa.case(
+        [(booked > flight.c.capacity, 0)],
+        else_=flight.c.capacity - booked)))
+
+    issued = sa.select([sa.func.count()])\
+        .select_from(booking.join(
+            employment,
+            employment.c.user_id == booking.c.issuing_employment_id))\
+        .where(employment.c.company_id == company.c.id)\
+        .as_scalar()
+    op.execute(company.update().values(tickets_used=issued))
+    op.execute(company.update()
+               .where(company.c.ticket_quota == 0)
+               .values(ticket_quota=None))
+
+    with op.batch_alter_table('flight') as batch_op:
+        batch_op.alter_column('seats_remaining', existing_type=sa.Integer(),
+                              nullable=False)
+        batch_op.create_check_constraint('ck_flight_seats_remaining',
+                                         'seats_remaining >= 0')
+
+
+def downgrade():
+    # Companies without a quota cannot be told from those whose quota
+    # was cleared, and neither was limited before: they stay NULL.
+    with op.batch_alter_table('company') as batch_op:
+        batch_op.drop_column('tickets_used')
+    with op.batch_alter_table('flight') as batch_op:
+        # SQLite does not reflect CHECK constraints: the copy of the
+        # table that batch mode makes goes without it.
+        if op.get_context().dialect.name != 'sqlite':
+            batch_op.drop_constraint('ck_flight_seats_remaining',
+                                     type_='check')
+        batch_op.drop_column('seats_remaining')
+        batch_op.drop_column('capacity')
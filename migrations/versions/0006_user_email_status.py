@@ -0,0 +1,35 @@
+"""user e-mail status
+
+Whether each user's e-mail domain accepts mail. In background mode the
+status is pending until the lookup finishes; existing users have none
+until their address is checked again.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 19:12:35.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from andromeda.schema import create_index_online, drop_index_online
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('email_status', sa.String(length=20),
+                                      nullable=True))
+    create_index_online('ix_user_email_status', 'user', ['email_status'])
+
+
+def downgrade():
+    drop_index_online('ix_user_email_status', 'user')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('email_status')
@@ -0,0 +1,80 @@
+"""sweeps
+
+Findings of the passport expiry and cancellation deadline sweeps, the
+time each sweep last ran, and the indexes they scan. Passports record
+when they were last changed and flights when they were last
+rescheduled, so that the passport expiry sweep examines the bookings
+they affect. Rows changed before this revision have neither, and are
+not examined again by the incremental sweep.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 19:12:40.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from andromeda.schema import create_index_online, drop_index_online
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_passport_expiration_date', 'passport', ['expiration_date']),
+    ('ix_flight_departure', 'flight', ['departure']),
+    ('ix_booking_cancellation_deadline', 'booking',
+     ['cancellation_deadline']),
+]
+
+
+def upgrade():
+    op.create_table('sweep_watermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('sweep_finding',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('sweep', sa.String(length=50), nullable=False),
+    sa.Column('booking_id', sa.Integer(), nullable=False),
+    sa.Column('found_at', sa.DateTime(), nullable=False),
+    sa.Column('resolved_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['booking_id'], ['booking.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sweep', 'booking_id', name='uq_sweep_finding_booking')
+    )
+    op.create_index('ix_sweep_finding_open', 'sweep_finding',
+                    ['sweep', 'resolved_at'], unique=False)
+    with op.batch_alter_table('passport') as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(),
+                                      nullable=True))
+    with op.batch_alter_table('flight') as batch_op:
+        batch_op.add_column(sa.Column('rescheduled_at', sa.DateTime(),
+                                      nullable=True))
+    for name, table, columns in INDEXES:
+        create_index_online(name, table, columns)
+
+
+#   SQLite does not reflect CHECK constraints: batch mode copies the
+#   table without this one unless it is given.
+SEATS_CHECK = sa.CheckConstraint('seats_remaining >= 0',
+                                 name='ck_flight_seats_remaining')
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        drop_index_online(name, table)
+    with op.batch_alter_table('flight',
+                              table_args=(SEATS_CHECK,)) as batch_op:
+        batch_op.drop_column('rescheduled_at')
+    with op.batch_alter_table('passport') as batch_op:
+        batch_op.drop_column('updated_at')
+    op.drop_index('ix_sweep_finding_open', table_name='sweep_finding')
+    op.drop_table('sweep_finding')
+    op.drop_table('sweep_watermark')
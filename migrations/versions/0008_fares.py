@@ -0,0 +1,49 @@
+"""fares
+
+Fare rules, a base fare per flight, and the fare each booking was
+sold at. Existing flights get the default base fare of 100; the fare
+of existing bookings is unknown and left empty.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:12:50.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('fare_rule',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(length=30), nullable=False),
+    sa.Column('min_days', sa.Integer(), nullable=True),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('fare_multiplier', sa.Float(), nullable=False),
+    sa.Column('fee_rate', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['company.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('flight') as batch_op:
+        batch_op.add_column(sa.Column('base_fare',
+                                      sa.Numeric(precision=10, scale=2),
+                                      nullable=False, server_default='100'))
+    with op.batch_alter_table('booking') as batch_op:
+        batch_op.add_column(sa.Column('fare',
+                                      sa.Numeric(precision=10, scale=2),
+                                      nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('booking') as batch_op:
+        batch_op.drop_column('fare')
+    with op.batch_alter_table('flight') as batch_op:
+        batch_op.drop_column('base_fare')
+    op.drop_table('fare_rule')
@@ -0,0 +1,26 @@
+"""booking history index
+
+The booking history pages through a user's bookings by date issued.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 19:13:00.000000
+
+"""
+from andromeda.schema import create_index_online, drop_index_online
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_online('ix_booking_user_date_issued', 'booking',
+                        ['user_id', 'date_issued', 'id'])
+
+
+def downgrade():
+    drop_index_online('ix_booking_user_date_issued', 'booking')
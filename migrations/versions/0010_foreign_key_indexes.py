@@ -0,0 +1,44 @@
+"""index foreign keys
+
+Lookups and joins by these foreign keys, and deletes of the rows they
+point to, scanned the whole table. booking.user_id and
+flight.departure_city_id are already covered by the leading column of
+ix_booking_user_date_issued and ix_flight_route_departure.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+from andromeda.schema import create_index_online, drop_index_online
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_booking_flight_id', 'booking', ['flight_id']),
+    ('ix_booking_issuing_employment_id', 'booking',
+     ['issuing_employment_id']),
+    ('ix_city_country_id', 'city', ['country_id']),
+    ('ix_employment_company_id', 'employment', ['company_id']),
+    ('ix_employment_user_id', 'employment', ['user_id']),
+    ('ix_fare_rule_company_id', 'fare_rule', ['company_id']),
+    ('ix_flight_arrival_city_id', 'flight', ['arrival_city_id']),
+    ('ix_passport_country_id', 'passport', ['country_id']),
+    ('ix_sweep_finding_booking_id', 'sweep_finding', ['booking_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        create_index_online(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        drop_index_online(name, table)
@@ -0,0 +1,33 @@
+"""case-insensitive unique e-mail index
+
+Logins looked users up by exact e-mail, so an address typed in
+another case did not match, and two accounts could differ only by
+case. The upgrade fails while such accounts exist; list them with
+
+    SELECT lower(email) FROM "user" GROUP BY lower(email)
+    HAVING count(*) > 1
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+from andromeda.schema import create_index_online, drop_index_online
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_online('ix_user_email_lower', 'user',
+                        [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    drop_index_online('ix_user_email_lower', 'user')
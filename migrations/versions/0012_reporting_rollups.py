@@ -0,0 +1,60 @@
+"""reporting rollups
+
+Bookings summed per flight, per route and day of departure, and per
+company and month of issue, for the admin reports. The tables are
+created empty: fill them with `flask andromeda rebuild-rollups`, after
+which they are kept up to date as bookings change.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('company_month_rollup',
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['company.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('company_id', 'month')
+    )
+    op.create_table('route_day_rollup',
+    sa.Column('departure_city_id', sa.Integer(), nullable=False),
+    sa.Column('arrival_city_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('flights', sa.Integer(), nullable=False),
+    sa.Column('seats', sa.Integer(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['arrival_city_id'], ['city.id'], ),
+    sa.ForeignKeyConstraint(['departure_city_id'], ['city.id'], ),
+    sa.PrimaryKeyConstraint('departure_city_id', 'arrival_city_id', 'day')
+    )
+    op.create_index('ix_route_day_rollup_day', 'route_day_rollup', ['day'],
+                    unique=False)
+    op.create_table('flight_rollup',
+    sa.Column('flight_id', sa.Integer(), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['flight_id'], ['flight.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('flight_id')
+    )
+
+
+def downgrade():
+    op.drop_table('flight_rollup')
+    op.drop_index('ix_route_day_rollup_day', table_name='route_day_rollup')
+    op.drop_table('route_day_rollup')
+    op.drop_table('company_month_rollup')
@@ -0,0 +1,37 @@
+"""cache changes
+
+The items each cache_version bump changed, so that a process whose
+copy is a few versions behind patches in only those items. A version
+with nothing logged may have changed everything.
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_cache_change_name_version', 'cache_change',
+                    ['name', 'version'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cache_change_name_version', table_name='cache_change')
+    op.drop_table('cache_change')
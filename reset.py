@@ -1,4 +1,13 @@
-from andromeda import db
+"""Development only: drop every table and rebuild the schema from the
+migrations. Existing databases are upgraded in place with
+`flask db upgrade` instead."""
+from flask_migrate import upgrade
 
-db.drop_all()
-db.create_all()
+from andromeda import create_app, db
+
+app = create_app()
+
+with app.app_context():
+    db.drop_all()
+    db.engine.execute('DROP TABLE IF EXISTS alembic_version')
+    upgrade()